@@ -3,15 +3,22 @@
 from configparser import ConfigParser
 from pathlib import Path
 from types import ModuleType, SimpleNamespace
+import json
+import statistics
 import sys
+import time
 
 import pytest
 
-
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
+BENCHMARK_BASELINES = Path(__file__).with_name("benchmark_baselines.json")
+# Fail only when the median regresses well beyond run-to-run noise.
+BENCHMARK_TOLERANCE = 3.0
+_benchmark_results = {}
+
 
 def _install_stub_modules():
     """Install lightweight stubs required to import trading_assistant."""
@@ -92,31 +99,53 @@ _install_stub_modules()
 @pytest.fixture
 def sample_trade(tmp_path):
     """Provide a simple trade-like object backed by temporary files."""
+    import trading_assistant
+
     return SimpleNamespace(
+        backend=trading_assistant.WindowsBackend(),
         symbol="1234",
         cash_balance=300_000,
         share_size=0,
         process="HYPERSBI2",
         geometries_section="HYPERSBI2 Geometries",
+        widgets_section="HYPERSBI2 Widgets",
         customer_margin_ratios_section="SBI Customer Margin Ratios",
         customer_margin_ratios=str(tmp_path / "customer_margin_ratios.csv"),
-        closing_prices=str(tmp_path / "closing_prices_"),
+        share_sizes=str(tmp_path / "share_sizes.csv"),
+        closing_prices=str(tmp_path / "closing_prices"),
+        market_history=str(tmp_path / "history"),
+        settings=None,
+        action_graph=None,
+        input_map=None,
     )
 
 
 @pytest.fixture
 def sample_config():
     """Provide the minimal config sections used by the tests."""
+    import trading_assistant
+
     config = ConfigParser()
     config["HYPERSBI2"] = {
+        "title": "Hyper SBI 2 Assistant",
         "utilization_ratio": "0.5",
+        "share_size_utilization_ratios": "(0.5, 1.0)",
+        "daily_loss_limit_ratio": "-0.01",
+        "maximum_daily_number_of_trades": "0",
         "image_magnification": "1",
         "binarization_threshold": "128",
         "is_dark_theme": "false",
+        "screencast_directory": "",
+        "screencast_regex": "",
     }
     config["HYPERSBI2 Geometries"] = {"price_limit_region": "0, 0, 10, 10"}
     config["SBI Customer Margin Ratios"] = {"customer_margin_ratio": "0.3"}
-    config["Market Data"] = {"rankings": ""}
+    config["Market Data"] = {
+        "rankings": "",
+        "history_compaction_days": "7",
+        "history_retention_days": "400",
+        "price_limit_bands": str(trading_assistant.PRICE_LIMIT_BANDS),
+    }
     return config
 
 
@@ -136,3 +165,89 @@ def rankings_csv(tmp_path) -> Path:
         encoding="utf-8",
     )
     return rankings
+
+
+def pytest_addoption(parser):
+    """Add an option to rewrite the benchmark baselines."""
+    parser.addoption(
+        "--update-benchmark-baselines",
+        action="store_true",
+        help="store the measured latencies as the new baselines",
+    )
+
+
+def pytest_configure(config):
+    """Register the benchmark marker."""
+    config.addinivalue_line(
+        "markers", "benchmark: time a hot path against a stored baseline"
+    )
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    """Report the latency percentiles and store baselines on request."""
+    if not _benchmark_results:
+        return
+
+    terminalreporter.section("benchmark latencies (microseconds)")
+    for name, result in sorted(_benchmark_results.items()):
+        terminalreporter.write_line(
+            f"{name}: p50 {result['p50'] * 1e6:.1f},"
+            f" p90 {result['p90'] * 1e6:.1f},"
+            f" p99 {result['p99'] * 1e6:.1f}"
+        )
+
+    if config.getoption("--update-benchmark-baselines"):
+        baselines = _read_benchmark_baselines()
+        baselines.update(_benchmark_results)
+        BENCHMARK_BASELINES.write_text(
+            json.dumps(baselines, indent=2, sort_keys=True) + "\n",
+            encoding="utf-8",
+        )
+
+
+def _read_benchmark_baselines():
+    """Return the stored baselines keyed by benchmark name."""
+    try:
+        return json.loads(BENCHMARK_BASELINES.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return {}
+
+
+@pytest.fixture
+def benchmark(request):
+    """Time a callable and fail if its median exceeds the baseline."""
+
+    def run(function, *args, rounds=100, setup=None, **kwargs):
+        latencies = []
+        result = None
+        for _ in range(rounds):
+            if setup:
+                setup()
+            start = time.perf_counter()
+            result = function(*args, **kwargs)
+            latencies.append(time.perf_counter() - start)
+
+        quantiles = statistics.quantiles(latencies, n=100, method="inclusive")
+        measured = {
+            "p50": statistics.median(latencies),
+            "p90": quantiles[89],
+            "p99": quantiles[98],
+        }
+        name = request.node.name
+        _benchmark_results[name] = measured
+
+        baseline = _read_benchmark_baselines().get(name)
+        if baseline and not request.config.getoption(
+            "--update-benchmark-baselines"
+        ):
+            limit = baseline["p50"] * BENCHMARK_TOLERANCE
+            if measured["p50"] > limit:
+                pytest.fail(
+                    f"{name} regressed: median {measured['p50'] * 1e6:.1f} us"
+                    f" exceeds {limit * 1e6:.1f} us"
+                    f" ({BENCHMARK_TOLERANCE}x the baseline)"
+                )
+
+        return result
+
+    return run
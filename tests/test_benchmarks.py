@@ -0,0 +1,349 @@
+"""Benchmarks for the hot paths of order preparation and market data."""
+
+from datetime import date, timedelta
+from pathlib import Path
+from types import SimpleNamespace
+import csv
+import itertools
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+import pandas as pd
+import pytest
+
+import trading_assistant
+
+pytestmark = pytest.mark.benchmark
+
+JPX_NUMBER_OF_ISSUES = 4_000
+ALPHANUMERIC_CHARACTERS = "ACDFGHJKLMNPRSTUWXY"
+# Importing the module must not import the dependencies of specific commands.
+DEFERRED_MODULES = {
+    "numpy",
+    "pandas",
+    "pyarrow",
+    "pynput",
+    "pyautogui",
+    "tkinter",
+    "win32gui",
+}
+IMPORT_TIME_BUDGET = 0.3
+
+
+def _generate_securities_codes(count):
+    """Return distinct securities codes including new-style codes."""
+    numeric_codes = (str(code) for code in range(1301, 10000))
+    alphanumeric_codes = (
+        f"{first}{second}{third}{fourth}"
+        for first, second, third, fourth in itertools.product(
+            "123456789", "0123456789", "0123456789", ALPHANUMERIC_CHARACTERS
+        )
+    )
+    return list(
+        itertools.islice(
+            itertools.chain(numeric_codes, alphanumeric_codes), count
+        )
+    )
+
+
+def _write_rankings(path, count):
+    """Write a rankings CSV with the layout of the downloaded export."""
+    lines = ["順位,市場,名称,業種,単元,時刻,コード,始値,高値,現在値"]
+    for index, code in enumerate(_generate_securities_codes(count), 1):
+        price = 50 + index * 37 % 120_000
+        lines.append(
+            f"{index},東証PRM,Name {index},業種,100,15:30,{code},1,1,"
+            f'"{price:,}"'
+        )
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+@pytest.fixture
+def market_trade(sample_trade, sample_config, tmp_path):
+    """Provide a trade whose market data covers every listed issue."""
+    rankings = tmp_path / "market_rankings.csv"
+    _write_rankings(rankings, JPX_NUMBER_OF_ISSUES)
+    sample_config["Market Data"]["rankings"] = str(rankings)
+    assert trading_assistant.save_market_data(sample_trade, sample_config)
+
+    codes = _generate_securities_codes(JPX_NUMBER_OF_ISSUES)
+    Path(sample_trade.customer_margin_ratios).write_text(
+        "".join(
+            f"{code},{'suspended' if index % 50 == 0 else '0.5'}\n"
+            for index, code in enumerate(codes[::4])
+        ),
+        encoding="utf-8",
+    )
+    sample_trade.symbol = codes[-1]
+    sample_trade.cash_balance = 100_000_000
+    return sample_trade
+
+
+def test_calculate_share_size_latency(benchmark, market_trade, sample_config):
+    assert benchmark(
+        trading_assistant.calculate_share_size,
+        market_trade,
+        sample_config,
+        "long",
+    ) == (True, None)
+
+
+def test_get_price_limit_latency(benchmark, market_trade, sample_config):
+    assert benchmark(
+        trading_assistant.get_price_limit, market_trade, sample_config
+    )
+
+
+@pytest.mark.parametrize("count", [4_000, 100_000])
+def test_save_market_data_latency(
+    benchmark, sample_trade, sample_config, tmp_path, count
+):
+    source = tmp_path / "source.csv"
+    rankings = tmp_path / "rankings.csv"
+    _write_rankings(source, count)
+    sample_config["Market Data"]["rankings"] = str(rankings)
+
+    def setup():
+        # Time only the publish path and not the snapshot of the last round.
+        trading_assistant.flush_market_history()
+        rankings.write_bytes(source.read_bytes())
+
+    assert benchmark(
+        trading_assistant.save_market_data,
+        sample_trade,
+        sample_config,
+        rounds=5 if count > 10_000 else 20,
+        setup=setup,
+    )
+    trading_assistant.flush_market_history()
+
+
+def _save_market_data_by_row(trade, config):
+    """Save market data with the row loop that the Arrow path replaced."""
+    closing_prices = {}
+    with open(config["Market Data"]["rankings"], encoding="utf-8") as f:
+        for row in csv.reader(f):
+            securities_code = row[6].strip()
+            if re.fullmatch(
+                trading_assistant.SECURITIES_CODE_REGEX, securities_code
+            ):
+                closing_prices[securities_code] = float(
+                    row[9].strip().replace(",", "")
+                )
+    return trading_assistant.write_closing_prices(
+        trade, config, closing_prices
+    )
+
+
+def test_save_market_data_is_faster_than_row_loop(
+    sample_trade, sample_config, tmp_path
+):
+    source = tmp_path / "source.csv"
+    rankings = tmp_path / "rankings.csv"
+    _write_rankings(source, 100_000)
+    sample_config["Market Data"]["rankings"] = str(rankings)
+
+    def measure(function):
+        rankings.write_bytes(source.read_bytes())
+        start = time.perf_counter()
+        assert function(sample_trade, sample_config)
+        elapsed_time = time.perf_counter() - start
+        # Keep the snapshot of one round from overlapping the next round.
+        trading_assistant.flush_market_history()
+        return elapsed_time
+
+    # Interleave the rounds so that a slow period affects both paths alike.
+    row_loop_times, columnar_times = zip(
+        *(
+            (
+                measure(_save_market_data_by_row),
+                measure(trading_assistant.save_market_data),
+            )
+            for _ in range(5)
+        )
+    )
+
+    assert statistics.median(columnar_times) < statistics.median(
+        row_loop_times
+    )
+    assert trading_assistant.get_closing_price(sample_trade, "1301") == 87.0
+
+
+@pytest.fixture
+def market_holidays(tmp_path):
+    """Write ten years of weekend-free holidays like the JPX calendar."""
+    path = tmp_path / "market_holidays.csv"
+    start = date(2020, 1, 1)
+    path.write_text(
+        "".join(
+            f"{(start + timedelta(days=days)).strftime('%Y/%m/%d')}\n"
+            for days in range(0, 3650, 17)
+        ),
+        encoding="utf-8",
+    )
+    return path
+
+
+def test_is_trading_day_latency(benchmark, market_holidays):
+    benchmark(
+        trading_assistant.is_trading_day,
+        pd.Timestamp("2026-05-01", tz="Asia/Tokyo"),
+        str(market_holidays),
+        "%Y/%m/%d",
+    )
+
+
+def test_get_latest_latency(
+    benchmark, monkeypatch, sample_config, market_holidays, tmp_path
+):
+    sample_config["Market Holidays"] = {
+        "url": "https://example.com/calendar",
+        "date_header": "日付",
+        # 'sample_config' uses basic interpolation, which requires '%%'.
+        "date_format": "%%Y/%%m/%%d",
+    }
+    monkeypatch.setattr(
+        trading_assistant.web_utilities,
+        "make_head_request",
+        lambda url: SimpleNamespace(
+            headers={"last-modified": "Mon, 01 Jan 2001 00:00:00 GMT"}
+        ),
+    )
+    data = tmp_path / "customer_margin_ratios.csv"
+    data.write_text("", encoding="utf-8")
+
+    benchmark(
+        trading_assistant.get_latest,
+        sample_config,
+        str(market_holidays),
+        "20:00:00",
+        "Asia/Tokyo",
+        str(data),
+    )
+
+
+def test_execute_action_dispatch_latency(
+    benchmark, sample_trade, sample_config
+):
+    backend = trading_assistant.HeadlessBackend()
+    sample_trade.backend = backend
+    sample_trade.resource_directory = "resources"
+    action = trading_assistant.compile_action(
+        sample_trade,
+        [
+            instruction
+            for index in range(2_500)
+            for instruction in (
+                ("move_to", f"{index}, {index}"),
+                ("click", f"{index}, {index}"),
+                ("press_key", "tab, 2"),
+                ("execute_action", [("write_string", "100")]),
+            )
+        ],
+    )
+    gui_state = backend.create_gui_state(())
+
+    assert benchmark(
+        trading_assistant.execute_action,
+        sample_trade,
+        sample_config,
+        gui_state,
+        action,
+        should_initialize=False,
+        rounds=20,
+        setup=backend.calls.clear,
+    )
+
+
+@pytest.fixture
+def window_classifier():
+    """Provide a classifier over patterns like the default window titles."""
+    securities_code_regex = trading_assistant.SECURITIES_CODE_REGEX
+    interactive_windows = (
+        "HYPER SBI 2",
+        "お知らせ",
+        rf"個別銘柄\s.*\(({securities_code_regex})\)",
+        "登録銘柄",
+        "保有証券",
+        "注文一覧",
+        rf"個別チャート\s.*\(({securities_code_regex})\).*",
+        "マーケット",
+        "ランキング",
+        "銘柄一覧",
+        "口座情報",
+        "ニュース",
+        "取引ポップアップ",
+        "通知設定",
+        rf"全板\s.*\(({securities_code_regex})\)",
+        r"HYPER SBI 2\s.*",
+    )
+    backend = trading_assistant.HeadlessBackend(
+        windows={1: "メモ帳", 2: "全板 トヨタ自動車 (7203)"}
+    )
+    return trading_assistant.WindowClassifier(backend, interactive_windows)
+
+
+def test_is_interactive_window_cached_latency(benchmark, window_classifier):
+    assert not benchmark(window_classifier.is_interactive_window, rounds=1000)
+
+
+def test_is_interactive_window_switching_latency(benchmark, window_classifier):
+    window_classifier.backend.responses["get_foreground_window"] = (
+        itertools.cycle((1, 2)).__next__
+    )
+
+    benchmark(window_classifier.is_interactive_window, rounds=1000)
+
+
+def test_import_time_within_budget():
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import trading_assistant"],
+        cwd=Path(trading_assistant.__file__).parent,
+        capture_output=True,
+        text=True,
+    )
+    assert not result.returncode, result.stderr
+
+    cumulative_times = {}
+    for line in result.stderr.splitlines():
+        match = re.fullmatch(r"import time:\s+\d+ \|\s+(\d+) \| *(\S+)", line)
+        if match:
+            cumulative_times[match[2]] = int(match[1]) / 1_000_000
+
+    assert not {
+        module
+        for module in cumulative_times
+        if module.partition(".")[0] in DEFERRED_MODULES
+    }
+    assert cumulative_times["trading_assistant"] < IMPORT_TIME_BUDGET
+
+
+def test_config_option_access_latency(benchmark, sample_config):
+    section = sample_config["HYPERSBI2"]
+    benchmark(
+        lambda: (
+            int(section["image_magnification"]),
+            int(section["binarization_threshold"]),
+            section.getboolean("is_dark_theme"),
+            float(section["utilization_ratio"]),
+        ),
+        rounds=1000,
+    )
+
+
+def test_settings_access_latency(benchmark, sample_trade, sample_config):
+    settings = trading_assistant.publish_settings(
+        sample_trade, sample_config
+    ).process
+    benchmark(
+        lambda: (
+            settings.image_magnification,
+            settings.binarization_threshold,
+            settings.is_dark_theme,
+            settings.utilization_ratio,
+        ),
+        rounds=1000,
+    )
@@ -1,6 +1,16 @@
 """Tests for deterministic parsing and calculation helpers."""
 
 from pathlib import Path
+import collections
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+import types
+
+import pytest
 
 import trading_assistant
 
@@ -11,19 +21,17 @@ def test_is_xy_accepts_two_integers_with_whitespace():
     assert not trading_assistant._is_xy("10.5,25")
 
 
-def test_save_market_data_splits_valid_symbols_and_strips_commas(
+def test_save_market_data_keeps_valid_symbols_and_strips_commas(
     sample_trade, sample_config, rankings_csv
 ):
     sample_config["Market Data"]["rankings"] = str(rankings_csv)
 
     assert trading_assistant.save_market_data(sample_trade, sample_config)
+    trading_assistant.flush_market_history()
     assert not rankings_csv.exists()
 
-    closing_prices_1 = Path(f"{sample_trade.closing_prices}1.csv")
-    closing_prices_9 = Path(f"{sample_trade.closing_prices}9.csv")
-
-    assert closing_prices_1.read_text(encoding="utf-8").strip() == "1234,1500"
-    assert closing_prices_9.read_text(encoding="utf-8").strip() == "9876,2500"
+    assert trading_assistant.get_closing_price(sample_trade, "1234") == 1500.0
+    assert trading_assistant.get_closing_price(sample_trade, "9876") == 2500.0
 
 
 def test_save_market_data_returns_false_for_missing_rankings_file(
@@ -34,9 +42,27 @@ def test_save_market_data_returns_false_for_missing_rankings_file(
     assert not trading_assistant.save_market_data(sample_trade, sample_config)
 
 
+def test_save_market_data_publishes_an_empty_table_for_an_empty_file(
+    sample_trade, sample_config, tmp_path
+):
+    rankings = tmp_path / "rankings.csv"
+    rankings.write_bytes(b"")
+    sample_config["Market Data"]["rankings"] = str(rankings)
+    trading_assistant.write_closing_prices(
+        sample_trade, sample_config, {"1234": 980.0}
+    )
+
+    assert trading_assistant.save_market_data(sample_trade, sample_config)
+    trading_assistant.flush_market_history()
+
+    assert not rankings.exists()
+    assert not trading_assistant.get_closing_price(sample_trade, "1234")
+    assert not (tmp_path / "history").exists()
+
+
 def test_get_price_limit_uses_saved_closing_price(sample_trade, sample_config):
-    Path(f"{sample_trade.closing_prices}1.csv").write_text(
-        "1234,980\n", encoding="utf-8"
+    trading_assistant.write_closing_prices(
+        sample_trade, sample_config, {"1234": 980.0}
     )
 
     assert (
@@ -71,8 +97,8 @@ def test_calculate_share_size_uses_margin_ratio_file(
     Path(sample_trade.customer_margin_ratios).write_text(
         "1234,0.5\n", encoding="utf-8"
     )
-    Path(f"{sample_trade.closing_prices}1.csv").write_text(
-        "1234,980\n", encoding="utf-8"
+    trading_assistant.write_closing_prices(
+        sample_trade, sample_config, {"1234": 980.0}
     )
 
     success, message = trading_assistant.calculate_share_size(
@@ -102,8 +128,8 @@ def test_calculate_share_size_caps_short_positions_at_fifty_units(
     Path(sample_trade.customer_margin_ratios).write_text(
         "1234,0.5\n", encoding="utf-8"
     )
-    Path(f"{sample_trade.closing_prices}1.csv").write_text(
-        "1234,980\n", encoding="utf-8"
+    trading_assistant.write_closing_prices(
+        sample_trade, sample_config, {"1234": 980.0}
     )
 
     success, message = trading_assistant.calculate_share_size(
@@ -122,3 +148,1535 @@ def test_calculate_share_size_requires_symbol_and_cash_balance(
     assert trading_assistant.calculate_share_size(
         sample_trade, sample_config, "long"
     ) == (False, "Symbol or cash balance not provided.")
+
+
+def test_save_share_sizes_matches_calculate_share_size_in_batch(
+    sample_trade, sample_config
+):
+    sample_trade.backend = trading_assistant.HeadlessBackend()
+    sample_trade.backend.clipboard_text = "1234 9876 1301 5555 1234 abc"
+    sample_trade.cash_balance = 10_000_000
+    Path(sample_trade.customer_margin_ratios).write_text(
+        "1234,0.5\n9876,suspended\n", encoding="utf-8"
+    )
+    trading_assistant.write_closing_prices(
+        sample_trade,
+        sample_config,
+        {"1234": 980.0, "9876": 2500.0, "1301": 99.0},
+    )
+
+    df = trading_assistant.save_share_sizes(
+        sample_trade, sample_config, sample_trade.cash_balance
+    )
+
+    assert df.index.tolist() == ["1234", "9876", "1301", "5555"]
+    assert df[["long_0.5", "short_0.5", "long_1", "short_1"]].to_dict(
+        "index"
+    ) == {
+        "1234": {
+            "long_0.5": 8800,
+            "short_0.5": 5000,
+            "long_1": 17600,
+            "short_1": 5000,
+        },
+        "9876": {"long_0.5": 0, "short_0.5": 0, "long_1": 0, "short_1": 0},
+        "1301": {
+            "long_0.5": 129100,
+            "short_0.5": 5000,
+            "long_1": 258300,
+            "short_1": 5000,
+        },
+        "5555": {"long_0.5": 0, "short_0.5": 0, "long_1": 0, "short_1": 0},
+    }
+    assert trading_assistant.calculate_share_size(
+        sample_trade, sample_config, "long"
+    ) == (True, None)
+    assert sample_trade.share_size == df.loc["1234", "long_0.5"]
+    assert Path(sample_trade.share_sizes).read_text(
+        encoding="utf-8"
+    ).splitlines()[:2] == [
+        "securities_code,closing_price,price_limit,customer_margin_ratio,"
+        "long_0.5,short_0.5,long_1,short_1",
+        "1234,980.0,1130.0,0.5,8800,5000,17600,5000",
+    ]
+
+
+@pytest.mark.parametrize(
+    "argument, cash_balance",
+    [("1,000,000", 1_000_000), ("1000000", 1_000_000), ("1e6", None)],
+)
+def test_cash_balance_argument_is_validated(
+    monkeypatch, capsys, argument, cash_balance
+):
+    monkeypatch.setattr(
+        trading_assistant.sys, "argv", ["trading_assistant.py", "-b", argument]
+    )
+
+    if cash_balance is None:
+        with pytest.raises(SystemExit):
+            trading_assistant.get_arguments()
+        assert "invalid CASH_BALANCE: '1e6'" in capsys.readouterr().err
+    else:
+        assert trading_assistant.get_arguments().b == [cash_balance]
+
+
+def test_compile_action_pre_parses_arguments_and_nested_actions(
+    sample_trade,
+):
+    sample_trade.resource_directory = "resources"
+    action = trading_assistant.compile_action(
+        sample_trade,
+        "[('click', '10, 20'), ('press_key', 'tab, 3'),"
+        " ('is_now_after', '09:00', [('sleep', '0.5')])]",
+    )
+
+    assert [instruction.command for instruction in action] == [
+        "click",
+        "press_key",
+        "is_now_after",
+    ]
+    assert action[0].operand == (10, 20)
+    assert action[1].operand == ("tab", 3)
+    assert action[2].operand == (9, 0, 0)
+    assert action[2].nested_action[0].operand == 0.5
+
+
+def test_compile_actions_reuses_graph_for_unchanged_section(
+    sample_trade, sample_config
+):
+    sample_trade.resource_directory = "resources"
+    sample_trade.actions_section = "HYPERSBI2 Actions"
+    sample_config["HYPERSBI2 Actions"] = {"greet": "[('speak_text', 'Hi')]"}
+
+    action_graph = trading_assistant.compile_actions(
+        sample_trade, sample_config
+    )
+
+    assert sample_trade.action_graph is action_graph
+    assert (
+        trading_assistant.compile_actions(sample_trade, sample_config)
+        is action_graph
+    )
+
+    sample_config["HYPERSBI2 Actions"]["greet"] = "[('speak_text', 'Hello')]"
+
+    assert (
+        trading_assistant.compile_actions(sample_trade, sample_config)
+        is not action_graph
+    )
+
+
+def test_execute_action_stops_at_unknown_or_invalid_instructions(
+    sample_trade, sample_config
+):
+    sample_trade.resource_directory = "resources"
+
+    for action in ("[('no_such_command',)]", "[('move_to', 'x, 20')]"):
+        assert not trading_assistant.execute_action(
+            sample_trade,
+            sample_config,
+            None,
+            trading_assistant.compile_action(sample_trade, action),
+            should_initialize=False,
+        )
+
+
+def test_action_tracer_writes_chrome_trace_with_nesting_depth(
+    sample_trade, sample_config, tmp_path
+):
+    sample_trade.resource_directory = "resources"
+    tracer = trading_assistant.ActionTracer(
+        str(tmp_path / "trace.json"), capacity=2
+    )
+    action = trading_assistant.compile_action(
+        sample_trade,
+        "[('sleep', '0'), ('execute_action', [('sleep', '0')])]",
+    )
+
+    assert tracer.execute(sample_trade, sample_config, None, action)
+    assert tracer.dump()
+
+    trace = json.loads((tmp_path / "trace.json").read_text(encoding="utf-8"))
+    events = trace["traceEvents"]
+
+    assert [(event["name"], event["args"]["depth"]) for event in events] == [
+        ("execute_action", 0),
+        ("execute_action", 1),
+    ]
+    assert all(event["ph"] == "X" for event in events)
+
+
+def test_tracing_starts_at_process_creation(
+    monkeypatch, sample_trade, sample_config, tmp_path
+):
+    sample_trade.resource_directory = str(tmp_path)
+    monkeypatch.setattr(trading_assistant, "_action_tracer", None)
+    monkeypatch.setattr(
+        trading_assistant,
+        "psutil",
+        types.SimpleNamespace(
+            Process=lambda: types.SimpleNamespace(
+                create_time=lambda: time.time() - 2.0
+            )
+        ),
+    )
+    monkeypatch.setattr(
+        trading_assistant.atexit, "register", lambda function: None
+    )
+    tracer = trading_assistant.start_tracing(sample_trade)
+    action = trading_assistant.compile_action(sample_trade, "[('sleep', '0')]")
+
+    assert tracer.execute(sample_trade, sample_config, None, action)
+    assert tracer.dump()
+
+    events = json.loads(Path(tracer.path).read_text(encoding="utf-8"))[
+        "traceEvents"
+    ]
+
+    assert [event["name"] for event in events] == [
+        "startup",
+        "execute_action",
+        "sleep",
+    ]
+    assert events[0]["ts"] == 0
+    assert events[0]["dur"] > 1.9e6
+    assert events[1]["ts"] >= events[0]["dur"]
+
+
+def test_analyze_actions_reports_cycles_and_unknown_names():
+    call_graph, cyclic_actions, problems = trading_assistant.analyze_actions(
+        {
+            "a": [("execute_action", "b")],
+            "b": [("is_now_after", "09:00:00", [("execute_action", "a")])],
+            "c": [("jump",), ("execute_action", "missing")],
+        }
+    )
+
+    assert call_graph["b"] == {"a"}
+    assert cyclic_actions == {"a", "b"}
+    assert problems == [
+        "'c': 'jump' is not a recognized command.",
+        "'c': 'missing' is not a defined action.",
+        "'a' -> 'b' -> 'a' is a cycle.",
+    ]
+
+
+def test_compile_actions_inlines_referenced_actions(
+    sample_trade, sample_config
+):
+    sample_trade.resource_directory = "resources"
+    sample_trade.actions_section = "HYPERSBI2 Actions"
+    sample_config["HYPERSBI2 Actions"] = {
+        "inner": "[('sleep', '1'), ('sleep', '2')]",
+        "outer": "[('execute_action', 'inner'),"
+        " ('is_now_after', '09:00:00', 'inner')]",
+        "loop": "[('execute_action', 'loop')]",
+    }
+
+    actions = trading_assistant.compile_actions(
+        sample_trade, sample_config
+    ).actions
+    outer = actions["outer"]
+
+    assert [instruction.command for instruction in outer] == [
+        "sleep",
+        "sleep",
+        "is_now_after",
+    ]
+    assert outer[2].nested_action is actions["inner"]
+    assert (
+        actions["loop"][0].handler is trading_assistant._handle_cyclic_action
+    )
+
+
+def test_execute_action_runs_end_to_end_on_headless_backend(
+    sample_trade, sample_config
+):
+    backend = trading_assistant.HeadlessBackend(
+        windows={1: "Other", 2: "個別チャート (1234)"},
+        responses={"recognize_text": [300_000]},
+    )
+    sample_trade.backend = backend
+    sample_trade.symbol = ""
+    sample_trade.resource_directory = "resources"
+    sample_trade.get_symbol = lambda hwnd, title_regex: (
+        trading_assistant.Trade.get_symbol(sample_trade, hwnd, title_regex)
+    )
+    sample_config["HYPERSBI2 Geometries"]["cash_balance_region"] = "1, 2, 3, 4"
+    action = trading_assistant.compile_action(
+        sample_trade,
+        "[('get_symbol', '個別チャート \\\\((\\\\d{4})\\\\)'),"
+        " ('get_cash_balance',), ('click', '10, 20'),"
+        " ('write_share_size',)]",
+    )
+
+    assert trading_assistant.execute_action(
+        sample_trade,
+        sample_config,
+        backend.create_gui_state(()),
+        action,
+        should_initialize=False,
+    )
+    assert sample_trade.symbol == "1234"
+    assert sample_trade.cash_balance == 300_000
+    assert [call[1:] for call in backend.calls[2:]] == [
+        ("click", (10, 20), {"button": "left"}),
+        ("write_string", ("0",), {}),
+    ]
+
+
+def test_incomplete_backend_fails_on_construction():
+    class PartialBackend(trading_assistant.AutomationBackend):
+        def move_to(self, *position):
+            pass
+
+    with pytest.raises(TypeError, match="recognize_text"):
+        PartialBackend()
+    assert not trading_assistant.HeadlessBackend.__abstractmethods__
+
+
+def _wait_for_completed_actions(action_executor, count, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while action_executor.counters["completed"] < count:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def executor_trade(sample_trade, sample_config):
+    sample_trade.resource_directory = "resources"
+    sample_trade.actions_section = "HYPERSBI2 Actions"
+    sample_trade.action_graph = None
+    sample_trade.backend = trading_assistant.HeadlessBackend()
+    sample_trade.initialize_attributes = lambda: None
+    sample_config["HYPERSBI2 Actions"] = {
+        "slow": str([("sleep", "0.05")] * 4 + [("write_string", "done")])
+    }
+    return sample_trade
+
+
+@pytest.mark.parametrize(
+    "policy, accepted, completed, dropped, writes",
+    [
+        ("drop", [True, False, False], 1, 2, 1),
+        ("queue", [True, True, True], 3, 0, 3),
+        ("replace", [True, True, True], 2, 1, 1),
+        ("coalesce", [True, True, False], 2, 1, 2),
+    ],
+)
+def test_action_executor_applies_overlap_policy(
+    executor_trade,
+    sample_config,
+    policy,
+    accepted,
+    completed,
+    dropped,
+    writes,
+):
+    action_executor = trading_assistant.ActionExecutor(
+        executor_trade,
+        sample_config,
+        executor_trade.backend.create_gui_state(()),
+        number_of_workers=2,
+        default_policy=policy,
+        coalescing_window=0.0,
+    )
+
+    assert [action_executor.submit("slow") for _ in range(3)] == accepted
+    _wait_for_completed_actions(action_executor, completed)
+    action_executor.shutdown()
+
+    assert action_executor.counters["dropped"] == dropped
+    assert action_executor.counters["queued"] == 0
+    assert action_executor.counters["running"] == 0
+    assert len(executor_trade.backend.calls) == writes
+
+
+def test_sleep_ends_when_the_action_is_canceled(sample_trade, sample_config):
+    token = trading_assistant.CancellationToken()
+    context = contextvars.copy_context()
+    context.run(trading_assistant._cancellation_token.set, token)
+    threading.Timer(0.1, token.cancel).start()
+    start = time.monotonic()
+
+    assert not context.run(
+        trading_assistant._handle_wait_command,
+        sample_trade,
+        sample_config,
+        None,
+        trading_assistant.Instruction(
+            "sleep", trading_assistant._handle_wait_command, operand=5.0
+        ),
+    )
+    assert time.monotonic() - start < 1.0
+
+
+@pytest.fixture
+def listening_trade(sample_trade):
+    sample_trade._pressed_modifiers = set()
+    sample_trade._armed_tokens = set()
+    sample_trade._armed_tokens_lock = threading.Lock()
+    sample_trade.speech_manager = types.SimpleNamespace(
+        set_speech_text=lambda text: None
+    )
+    for name in ("arm_token", "disarm_token", "on_press"):
+        setattr(
+            sample_trade,
+            name,
+            types.MethodType(
+                getattr(trading_assistant.Trade, name), sample_trade
+            ),
+        )
+    return sample_trade
+
+
+KeyCode = collections.namedtuple("KeyCode", "char")
+
+
+def _wait_for_key_in_thread(trade, config, gui_state, key, results):
+    token = trading_assistant.CancellationToken()
+
+    def wait_for_key():
+        trading_assistant._cancellation_token.set(token)
+        results[key] = trading_assistant._wait_for_key(
+            trade, config, gui_state, key, None
+        )
+
+    thread = threading.Thread(target=wait_for_key, daemon=True)
+    thread.start()
+    return token, thread
+
+
+def test_escape_wakes_every_waiting_action_immediately(
+    listening_trade, sample_config
+):
+    gui_state = trading_assistant.HeadlessBackend().create_gui_state(())
+    results = {}
+    waits = [
+        _wait_for_key_in_thread(
+            listening_trade, sample_config, gui_state, key, results
+        )
+        for key in ("a", "b")
+    ]
+    while len(listening_trade._armed_tokens) < 2:
+        time.sleep(0.001)
+
+    listening_trade.on_press(KeyCode(char="a"), sample_config, gui_state)
+    waits[0][1].join(1.0)
+
+    assert results == {"a": True}
+    assert not waits[1][0].is_cancelled
+
+    start = time.perf_counter()
+    listening_trade.on_press(
+        trading_assistant.keyboard.Key.esc, sample_config, gui_state
+    )
+    waits[1][1].join(1.0)
+
+    assert time.perf_counter() - start < 0.1
+    assert results == {"a": True, "b": False}
+    assert not listening_trade._armed_tokens
+
+
+def test_cancellation_does_not_leak_into_later_actions_on_a_thread(
+    listening_trade, sample_config
+):
+    backend = trading_assistant.HeadlessBackend()
+    listening_trade.backend = backend
+    listening_trade.resource_directory = "resources"
+    listening_trade.initialize_attributes = lambda: None
+    gui_state = backend.create_gui_state(())
+    results = []
+
+    def execute_actions():
+        for action in (
+            "[('wait_for_key', 'y'), ('write_string', 'confirmed')]",
+            "[('write_string', 'x')]",
+            "[('write_string', 'y')]",
+        ):
+            results.append(
+                trading_assistant.execute_action(
+                    listening_trade, sample_config, gui_state, action
+                )
+            )
+
+    thread = threading.Thread(target=execute_actions, daemon=True)
+    thread.start()
+    while not listening_trade._armed_tokens:
+        time.sleep(0.001)
+    listening_trade.on_press(
+        trading_assistant.keyboard.Key.esc, sample_config, gui_state
+    )
+    thread.join(1.0)
+
+    assert results == [False, True, True]
+    assert [call[2] for call in backend.calls] == [("x",), ("y",)]
+
+
+def test_get_dependencies_orders_by_effects_and_barriers(sample_trade):
+    sample_trade.resource_directory = "resources"
+    action = trading_assistant.compile_action(
+        sample_trade,
+        "[('get_symbol', 'Chart'), ('get_cash_balance',),"
+        " ('calculate_share_size', 'long'), ('write_share_size',),"
+        " ('speak_text', 'Ready.'), ('press_key', 'enter')]",
+    )
+
+    assert trading_assistant.get_dependencies(action) == (
+        frozenset(),
+        frozenset(),
+        frozenset({0, 1}),
+        frozenset({2}),
+        frozenset({2}),
+        frozenset({2, 3}),
+    )
+    assert trading_assistant.get_dependencies(action) is (
+        trading_assistant.get_dependencies(action)
+    )
+
+
+def test_parallel_execution_overlaps_independent_recognition(
+    monkeypatch, sample_trade, sample_config
+):
+    def recognize_slowly():
+        time.sleep(0.2)
+        return 500_000
+
+    def get_symbol_slowly(hwnd, title_regex):
+        time.sleep(0.2)
+        sample_trade.symbol = "5678"
+        return False
+
+    backend = trading_assistant.HeadlessBackend(
+        windows={1: "Chart"}, responses={"recognize_text": recognize_slowly}
+    )
+    sample_trade.backend = backend
+    sample_trade.get_symbol = get_symbol_slowly
+    sample_trade.resource_directory = "resources"
+    sample_config["HYPERSBI2 Geometries"]["cash_balance_region"] = "1, 2, 3, 4"
+    monkeypatch.setattr(
+        trading_assistant,
+        "_instruction_pool",
+        trading_assistant.concurrent.futures.ThreadPoolExecutor(2),
+    )
+    action = trading_assistant.compile_action(
+        sample_trade,
+        "[('get_symbol', 'Chart'), ('get_cash_balance',),"
+        " ('write_string', 'done')]",
+    )
+
+    start = time.perf_counter()
+    assert trading_assistant.execute_action(
+        sample_trade,
+        sample_config,
+        backend.create_gui_state(()),
+        action,
+        should_initialize=False,
+    )
+
+    assert time.perf_counter() - start < 0.35
+    assert (sample_trade.symbol, sample_trade.cash_balance) == (
+        "5678",
+        500_000,
+    )
+    assert backend.calls[-1][1:] == ("write_string", ("done",), {})
+
+
+def test_async_runtime_runs_waiting_actions_without_threads(
+    executor_trade, sample_config
+):
+    sample_config["HYPERSBI2 Actions"] = {
+        f"wait_{index}": "[('sleep', '0.2'), ('write_string', 'done')]"
+        for index in range(20)
+    }
+    runtime = trading_assistant.AsyncActionRuntime(
+        executor_trade,
+        sample_config,
+        executor_trade.backend.create_gui_state(()),
+        number_of_workers=1,
+    )
+
+    start = time.perf_counter()
+    assert all(runtime.submit(f"wait_{index}") for index in range(20))
+    _wait_for_completed_actions(runtime, 20)
+    runtime.shutdown()
+
+    assert time.perf_counter() - start < 1.0
+    assert len(executor_trade.backend.calls) == 20
+
+
+def test_async_runtime_cancels_key_wait_on_escape(
+    executor_trade, listening_trade, sample_config
+):
+    sample_config["HYPERSBI2 Actions"] = {
+        "confirm": "[('wait_for_key', 'y', [('write_string', 'canceled')]),"
+        " ('write_string', 'confirmed')]"
+    }
+    gui_state = executor_trade.backend.create_gui_state(())
+    runtime = trading_assistant.AsyncActionRuntime(
+        executor_trade, sample_config, gui_state
+    )
+
+    assert runtime.submit("confirm")
+    while not listening_trade._armed_tokens:
+        time.sleep(0.001)
+    listening_trade.on_press(
+        trading_assistant.keyboard.Key.esc, sample_config, gui_state
+    )
+    _wait_for_completed_actions(runtime, 1)
+    runtime.shutdown()
+
+    assert [call[2] for call in executor_trade.backend.calls] == [
+        ("canceled",)
+    ]
+
+
+def test_async_runtime_evaluates_conditions_off_the_event_loop(
+    monkeypatch, executor_trade, sample_config
+):
+    threads = []
+
+    def evaluate_condition(trade, config, instruction):
+        threads.append(threading.current_thread().name)
+        return True
+
+    monkeypatch.setattr(
+        trading_assistant, "_evaluate_condition", evaluate_condition
+    )
+    sample_config["HYPERSBI2 Actions"] = {
+        "check": "[('is_trading_day', 'True', [('write_string', 'open')])]"
+    }
+    runtime = trading_assistant.AsyncActionRuntime(
+        executor_trade,
+        sample_config,
+        executor_trade.backend.create_gui_state(()),
+    )
+
+    assert runtime.submit("check")
+    _wait_for_completed_actions(runtime, 1)
+    runtime.shutdown()
+
+    assert [name.startswith("action") for name in threads] == [True]
+    assert [call[2] for call in executor_trade.backend.calls] == [("open",)]
+
+
+def test_async_runtime_polls_price_and_window_without_holding_threads(
+    executor_trade, sample_config
+):
+    executor_trade.arm_token = lambda token, key=None: token.arm(key)
+    executor_trade.disarm_token = lambda token: None
+    executor_trade.backend.windows = {1: "Chart"}
+    executor_trade.backend.responses["recognize_text"] = [0, 0, 1234]
+    sample_config["HYPERSBI2 Actions"] = {
+        "order": str(
+            [
+                ("wait_for_price", "0, 0, 10, 10, 0"),
+                ("wait_for_window", "Order"),
+                ("write_string", "done"),
+            ]
+        )
+    }
+    runtime = trading_assistant.AsyncActionRuntime(
+        executor_trade,
+        sample_config,
+        executor_trade.backend.create_gui_state(()),
+        number_of_workers=1,
+    )
+
+    assert runtime.submit("order")
+    time.sleep(0.5)
+    # The single thread is free while the window is awaited.
+    assert runtime._executor.submit(lambda: True).result(timeout=1.0)
+    executor_trade.backend.windows[2] = "Order"
+    _wait_for_completed_actions(runtime, 1)
+    runtime.shutdown()
+
+    assert [
+        call[1]
+        for call in executor_trade.backend.calls
+        if call[1] != "enumerate_windows"
+    ] == ["recognize_text"] * 3 + ["write_string"]
+
+
+def test_async_runtime_shutdown_cancels_pending_actions(
+    executor_trade, sample_config
+):
+    executor_trade.arm_token = lambda token, key=None: token.arm(key)
+    executor_trade.disarm_token = lambda token: None
+    executor_trade.speech_manager = types.SimpleNamespace(
+        set_speech_text=lambda text: None
+    )
+    sample_config["HYPERSBI2 Actions"] = {
+        "wait": str([("wait_for_window", "Order"), ("write_string", "done")])
+    }
+    runtime = trading_assistant.AsyncActionRuntime(
+        executor_trade,
+        sample_config,
+        executor_trade.backend.create_gui_state(()),
+    )
+
+    assert runtime.submit("wait")
+    time.sleep(0.2)
+    runtime.shutdown()
+
+    assert runtime.counters["completed"] == 1
+    assert not [
+        call
+        for call in executor_trade.backend.calls
+        if call[1] == "write_string"
+    ]
+
+
+def test_async_schedules_queue_overlapping_runs(executor_trade, sample_config):
+    sample_config["HYPERSBI2"]["number_of_action_workers"] = "1"
+    gui_state = executor_trade.backend.create_gui_state(())
+    now = time.time()
+
+    trading_assistant._run_async_schedules(
+        executor_trade,
+        sample_config,
+        gui_state,
+        "HYPERSBI2",
+        [(now, "slow"), (now + 0.01, "slow")],
+    )
+
+    assert [call[2] for call in executor_trade.backend.calls] == [
+        ("done",),
+        ("done",),
+    ]
+
+
+def test_compile_input_map_binds_buttons_and_function_keys(
+    monkeypatch, sample_trade, listening_trade, sample_config
+):
+    buttons = types.SimpleNamespace(left=object(), x1=object())
+    monkeypatch.setattr(
+        trading_assistant.mouse, "Button", buttons, raising=False
+    )
+    sample_trade.resource_directory = "resources"
+    sample_trade.actions_section = "HYPERSBI2 Actions"
+    sample_trade.action_graph = None
+    sample_trade.input_map = None
+    sample_config["HYPERSBI2 Actions"] = {"buy": "[('speak_text', 'Buy.')]"}
+    sample_config["HYPERSBI2"]["input_map"] = str(
+        {"left": "", "x1": "buy", "f2": "buy"}
+    )
+
+    input_map = trading_assistant.compile_input_map(
+        sample_trade, sample_config
+    )
+
+    assert dict(input_map.bindings) == {
+        buttons.x1: ("buy", sample_trade.action_graph.actions["buy"]),
+        trading_assistant.keyboard.Key.f2: (
+            "buy",
+            sample_trade.action_graph.actions["buy"],
+        ),
+    }
+    assert (
+        trading_assistant.compile_input_map(sample_trade, sample_config)
+        is input_map
+    )
+
+    sample_config["HYPERSBI2"]["input_map"] = str({"f3": "buy"})
+
+    assert list(
+        trading_assistant.compile_input_map(
+            sample_trade, sample_config
+        ).bindings
+    ) == [trading_assistant.keyboard.Key.f3]
+
+    sample_config["HYPERSBI2 Actions"]["buy"] = "[('speak_text', 'Now.')]"
+    action_graph = trading_assistant.compile_actions(
+        sample_trade, sample_config
+    )
+    submitted = []
+    sample_trade.action_executor = types.SimpleNamespace(
+        submit=lambda *arguments: submitted.append(arguments)
+    )
+    listening_trade._last_action_time = 0
+    listening_trade.on_press(
+        trading_assistant.keyboard.Key.f3,
+        sample_config,
+        types.SimpleNamespace(is_interactive_window=lambda: True),
+    )
+
+    assert submitted == [("buy", action_graph.actions["buy"])]
+    assert submitted[0][1][0].argument == "Now."
+
+
+def test_input_event_queue_drops_events_beyond_its_size():
+    release = threading.Event()
+    handled = []
+
+    def handle(event):
+        release.wait(1.0)
+        handled.append(event)
+
+    input_event_queue = trading_assistant.InputEventQueue(maximum_size=2)
+    for event in range(5):
+        input_event_queue.put(handle, event)
+        # Let the consumer take the first event before queuing the rest.
+        while event == 0 and input_event_queue.metrics["depth"]:
+            time.sleep(0.001)
+
+    assert input_event_queue.metrics["depth"] == 2
+    assert input_event_queue.metrics["dropped"] == 2
+
+    release.set()
+    input_event_queue.stop()
+    input_event_queue._consumer.join(1.0)
+    metrics = input_event_queue.metrics
+
+    assert handled == [0, 1, 2]
+    assert (metrics["depth"], metrics["dispatched"]) == (0, 3)
+    assert 0 < metrics["latency_p50"] <= metrics["latency_p99"]
+
+
+def test_window_classifier_caches_verdict_per_window_and_title():
+    backend = trading_assistant.HeadlessBackend(
+        windows={1: "個別チャート (1234) 日足", 2: "メモ帳"}
+    )
+    classifier = trading_assistant.WindowClassifier(
+        backend, ("お知らせ", r"個別チャート\s.*\((\d{4})\).*")
+    )
+
+    assert classifier.is_interactive_window()
+    assert classifier._verdict == (1, "個別チャート (1234) 日足", True)
+
+    backend.responses["get_foreground_window"] = 2
+
+    assert not classifier.is_interactive_window()
+
+    backend.windows[2] = "お知らせ"
+
+    assert classifier.is_interactive_window()
+    assert not trading_assistant.WindowClassifier(
+        backend, ()
+    ).is_interactive_window()
+
+
+@pytest.mark.parametrize(
+    "title_regex, title",
+    [
+        ("(?i)order", "ORDER"),
+        (r"(\d)\1 chart", "11 chart"),
+        (r"(?P<code>\d{4}) (?P=code)", "1234 1234"),
+    ],
+)
+def test_window_classifier_keeps_the_meaning_of_each_pattern(
+    title_regex, title
+):
+    backend = trading_assistant.HeadlessBackend(windows={1: title})
+    classifier = trading_assistant.WindowClassifier(
+        backend, (r"(?P<code>\d)x", title_regex)
+    )
+
+    assert classifier.is_interactive_window()
+
+    backend.windows[1] = f"{title}!"
+
+    assert not classifier.is_interactive_window()
+
+
+def test_variables_journal_coalesces_writes_and_replays(tmp_path):
+    writes = []
+    path = tmp_path / "state_journal.jsonl"
+    variables = {"current_number_of_trades": 0}
+    variables_journal = trading_assistant.VariablesJournal(
+        str(path), variables, writes.append, coalescing_delay=0.05
+    )
+
+    for number in range(1, 4):
+        variables_journal.set("current_number_of_trades", number)
+
+    assert not writes
+    assert len(path.read_text(encoding="utf-8").splitlines()) == 3
+
+    replayed_variables = {}
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('["current_num')
+
+    assert (
+        trading_assistant.VariablesJournal.replay(
+            str(path), replayed_variables
+        )
+        == 3
+    )
+    assert replayed_variables == {"current_number_of_trades": 3}
+
+    deadline = time.monotonic() + 5.0
+    while not writes:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    variables_journal.close()
+
+    assert writes[0] == {"current_number_of_trades": 3}
+    assert path.read_text(encoding="utf-8") == ""
+
+
+def test_variables_journal_closes_itself_before_compacting(
+    monkeypatch, tmp_path
+):
+    path = tmp_path / "state_journal.jsonl"
+    replace_file = trading_assistant._replace_file
+
+    def fake_replace_file(target, data):
+        # Windows refuses to replace a file with an open handle.
+        if target == str(path) and not variables_journal._file.closed:
+            raise PermissionError(target)
+        replace_file(target, data)
+
+    monkeypatch.setattr(trading_assistant, "_replace_file", fake_replace_file)
+    writes = []
+    variables_journal = trading_assistant.VariablesJournal(
+        str(path), {}, writes.append, coalescing_delay=60.0
+    )
+    variables_journal.set("current_number_of_trades", 1)
+    variables_journal.close()
+
+    assert writes == [{"current_number_of_trades": 1}]
+    assert path.read_text(encoding="utf-8") == ""
+
+
+def test_state_store_rolls_over_and_persists_typed_state(tmp_path):
+    path = tmp_path / "state.json"
+    journal_path = str(tmp_path / "state_journal.jsonl")
+    state_store = trading_assistant.StateStore(str(path), journal_path)
+
+    assert state_store.is_new
+    state_store.migrate(
+        {
+            "current_date": "2026-10-16",
+            "initial_cash_balance": "300000",
+            "current_number_of_trades": "2",
+        }
+    )
+    state_store.roll_over(trading_assistant.date(2026, 10, 16))
+
+    assert state_store.current_number_of_trades == 2
+
+    state_store.current_number_of_trades += 1
+    state_store.close()
+    state_store = trading_assistant.StateStore(str(path), journal_path)
+
+    assert not state_store.is_new
+    assert (
+        state_store.current_date,
+        state_store.initial_cash_balance,
+        state_store.current_number_of_trades,
+    ) == (trading_assistant.date(2026, 10, 16), 300_000, 3)
+
+    state_store.roll_over(trading_assistant.date(2026, 10, 19))
+    state_store.close()
+
+    assert json.loads(path.read_text(encoding="utf-8")) == {
+        "current_date": "2026-10-19",
+        "initial_cash_balance": 0,
+        "current_number_of_trades": 0,
+    }
+
+
+def test_config_snapshot_is_reused_until_the_config_changes(tmp_path):
+    config_path = tmp_path / "trading_assistant.ini.gpg"
+    config_path.write_bytes(b"encrypted")
+    trade = types.SimpleNamespace(
+        config_path=str(config_path),
+        config_snapshot=str(tmp_path / "config_snapshot.bin"),
+        executable="HYPERSBI2.exe",
+    )
+    sections = {"General": {"fingerprint": "", "voice_name": "${Voice:name}"}}
+    snapshot_key = trading_assistant._get_config_snapshot_key(trade)
+
+    trading_assistant._save_config_snapshot(trade, sections, snapshot_key)
+    snapshot = trading_assistant._load_config_snapshot(
+        trade, trading_assistant._get_config_snapshot_key(trade)
+    )
+
+    assert snapshot["executable"] == "HYPERSBI2.exe"
+    assert snapshot["sections"] == {
+        "General": {"fingerprint": "", "voice_name": "${Voice:name}"}
+    }
+
+    config_path.write_bytes(b"re-encrypted")
+
+    assert not trading_assistant._load_config_snapshot(
+        trade, trading_assistant._get_config_snapshot_key(trade)
+    )
+
+
+def test_replace_file_writes_through_a_unique_temporary_file(
+    monkeypatch, tmp_path
+):
+    path = tmp_path / "state.json"
+    path.write_bytes(b"old")
+    temporary_paths = []
+
+    def fail_to_replace(source, destination):
+        temporary_paths.append(source)
+        raise PermissionError(destination)
+
+    monkeypatch.setattr(trading_assistant.os, "replace", fail_to_replace)
+    for _ in range(2):
+        with pytest.raises(PermissionError):
+            trading_assistant._replace_file(str(path), b"new")
+    monkeypatch.undo()
+
+    assert len(set(temporary_paths)) == 2
+    assert [entry.name for entry in tmp_path.iterdir()] == ["state.json"]
+    assert path.read_bytes() == b"old"
+
+    trading_assistant._replace_file(str(path), b"new")
+
+    assert path.read_bytes() == b"new"
+    if sys.platform != "win32":
+        assert path.stat().st_mode & 0o777 == 0o600
+
+
+def test_private_files_are_encrypted_for_the_user_on_windows(
+    monkeypatch, tmp_path
+):
+    monkeypatch.setattr(trading_assistant.sys, "platform", "win32")
+    monkeypatch.setattr(
+        trading_assistant,
+        "win32crypt",
+        types.SimpleNamespace(
+            CryptProtectData=lambda data, *args: b"protected:" + data[::-1],
+            CryptUnprotectData=lambda data, *args: (
+                None,
+                data.removeprefix(b"protected:")[::-1],
+            ),
+        ),
+    )
+    path = tmp_path / "config_snapshot.bin"
+
+    trading_assistant._write_private_file(str(path), b"fingerprint")
+
+    assert path.read_bytes() == b"protected:tnirpregnif"
+    assert trading_assistant._read_private_file(str(path)) == b"fingerprint"
+
+
+def test_send_action_reaches_a_running_daemon(tmp_path):
+    submitted = []
+    trade = types.SimpleNamespace(
+        daemon_address=str(tmp_path / "daemon.sock"),
+        daemon_authkey=str(tmp_path / "daemon_authkey"),
+        action_graph=types.SimpleNamespace(actions={"buy": ()}),
+        action_executor=types.SimpleNamespace(
+            submit=lambda action, compiled_action: submitted.append(action)
+            or True
+        ),
+    )
+    assert not trading_assistant.send_action(trade, "buy")
+
+    action_server = trading_assistant.ActionServer(
+        trade, trading_assistant._create_daemon_authkey(trade)
+    )
+    thread = threading.Thread(target=action_server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        assert trading_assistant.send_action(trade, "buy")
+        assert trading_assistant.send_action(trade, "sell")
+        assert submitted == ["buy"]
+    finally:
+        action_server.close()
+    thread.join(timeout=5)
+
+    assert not thread.is_alive()
+    assert not Path(trade.daemon_authkey).exists()
+    assert not trading_assistant.send_action(trade, "buy")
+
+
+def test_action_server_closes_without_serving(tmp_path):
+    trade = types.SimpleNamespace(
+        daemon_address=str(tmp_path / "daemon.sock"),
+        daemon_authkey=str(tmp_path / "daemon_authkey"),
+    )
+    action_server = trading_assistant.ActionServer(
+        trade, trading_assistant._create_daemon_authkey(trade)
+    )
+    thread = threading.Thread(target=action_server.close, daemon=True)
+    thread.start()
+    thread.join(timeout=5)
+
+    assert not thread.is_alive()
+    assert not Path(trade.daemon_authkey).exists()
+
+
+def test_supervise_daemon_rearms_schedules_and_reloads_config(
+    monkeypatch, tmp_path
+):
+    config_path = tmp_path / "trading_assistant.ini.gpg"
+    config_path.write_bytes(b"encrypted")
+    stop_event = threading.Event()
+    process_states = [False, True, True, False, True]
+    calls = []
+
+    def is_process_running():
+        calls.append("poll")
+        if len(process_states) == 2:
+            config_path.write_bytes(b"encrypted again")
+        if len(process_states) == 1:
+            stop_event.set()
+        return process_states.pop(0)
+
+    trade = types.SimpleNamespace(
+        process="HYPERSBI2",
+        config_path=str(config_path),
+        backend=trading_assistant.HeadlessBackend(
+            responses={"is_process_running": is_process_running}
+        ),
+        state_store=types.SimpleNamespace(
+            roll_over=lambda current_date: calls.append("roll_over")
+        ),
+    )
+    monkeypatch.setattr(
+        trading_assistant,
+        "start_scheduler",
+        lambda *arguments: calls.append("start_scheduler"),
+    )
+    monkeypatch.setattr(
+        trading_assistant,
+        "reload_config",
+        lambda trade, config: calls.append("reload_config"),
+    )
+
+    trading_assistant.supervise_daemon(
+        trade, None, None, None, stop_event, poll_interval=0.01
+    )
+    deadline = time.monotonic() + 5.0
+    while calls.count("start_scheduler") < 2:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+    assert calls == [
+        "roll_over",
+        "poll",
+        "poll",
+        "start_scheduler",
+        "poll",
+        "poll",
+        "reload_config",
+        "poll",
+        "start_scheduler",
+    ]
+
+
+def test_supervise_daemon_rearms_schedules_after_a_reload(
+    monkeypatch, tmp_path
+):
+    config_path = tmp_path / "trading_assistant.ini.gpg"
+    config_path.write_bytes(b"encrypted")
+    stop_event = threading.Event()
+    scheduler_stop_events = []
+
+    def start_scheduler(*arguments):
+        scheduler_stop_events.append(arguments[-1])
+        if len(scheduler_stop_events) == 1:
+            config_path.write_bytes(b"encrypted again")
+        else:
+            stop_event.set()
+        arguments[-1].wait(5.0)
+
+    trade = types.SimpleNamespace(
+        process="HYPERSBI2",
+        config_path=str(config_path),
+        backend=trading_assistant.HeadlessBackend(),
+        state_store=types.SimpleNamespace(roll_over=lambda current_date: None),
+    )
+    monkeypatch.setattr(trading_assistant, "start_scheduler", start_scheduler)
+    monkeypatch.setattr(
+        trading_assistant, "reload_config", lambda trade, config: None
+    )
+
+    trading_assistant.supervise_daemon(
+        trade, None, None, None, stop_event, poll_interval=0.01
+    )
+
+    assert len(scheduler_stop_events) == 2
+    assert scheduler_stop_events[0].is_set()
+    assert not scheduler_stop_events[1].is_set()
+
+
+def test_reload_config_updates_sections_in_place(monkeypatch):
+    config = trading_assistant.configparser.ConfigParser()
+    config.read_dict({"HYPERSBI2": {"a": "1", "b": "2"}, "Stale": {"c": "3"}})
+    section = config["HYPERSBI2"]
+    new_config = trading_assistant.configparser.ConfigParser()
+    new_config.read_dict(
+        {
+            "HYPERSBI2": {"a": "10", "d": "${a}"},
+            "HYPERSBI2 Variables": {"current_number_of_trades": "1"},
+        }
+    )
+    compiled = []
+    monkeypatch.setattr(
+        trading_assistant, "configure", lambda trade: new_config
+    )
+    monkeypatch.setattr(
+        trading_assistant,
+        "publish_settings",
+        lambda trade, config: compiled.append("settings"),
+    )
+    monkeypatch.setattr(
+        trading_assistant,
+        "compile_actions",
+        lambda trade, config: compiled.append("actions")
+        or types.SimpleNamespace(problems=()),
+    )
+    monkeypatch.setattr(
+        trading_assistant,
+        "compile_input_map",
+        lambda trade, config: compiled.append("input_map"),
+    )
+    trade = types.SimpleNamespace(
+        variables_section="HYPERSBI2 Variables", config_digest=None
+    )
+
+    trading_assistant.reload_config(trade, config)
+
+    assert config.sections() == ["HYPERSBI2"]
+    assert config["HYPERSBI2"] is section
+    assert dict(config.items("HYPERSBI2", raw=True)) == {
+        "a": "10",
+        "d": "${a}",
+    }
+    assert trade.config_digest == trading_assistant.get_config_digest(config)
+    assert compiled == ["settings", "actions", "input_map"]
+
+
+def test_configure_reads_the_config_once_for_both_views(monkeypatch, tmp_path):
+    config_path = tmp_path / "trading_assistant.ini.gpg"
+    config_path.write_bytes(b"encrypted")
+    trade = types.SimpleNamespace(
+        vendor="Other Securities",
+        process="Other",
+        executable=None,
+        config_path=str(config_path),
+        config_snapshot=str(tmp_path / "config_snapshot.bin"),
+        default_sections=None,
+        config_sections=None,
+        geometries_section="Other Geometries",
+        actions_section="Other Actions",
+        schedules_section="Other Schedules",
+    )
+    reads = []
+
+    def read_config(config, path, is_encrypted=False):
+        reads.append(path)
+        config["Market Data"]["opening_time"] = "08:00:00"
+
+    monkeypatch.setattr(
+        trading_assistant.configuration, "read_config", read_config
+    )
+
+    raw_config = trading_assistant.configure(trade, can_interpolate=False)
+    config = trading_assistant.configure(trade)
+    default_config = trading_assistant.configure(trade, can_override=False)
+
+    assert reads == [str(config_path)]
+    assert config["Other Actions"]["speak_seconds_until_open"] != (
+        raw_config["Other Actions"]["speak_seconds_until_open"]
+    )
+    assert "08:00:00" in config["Other Actions"]["speak_seconds_until_open"]
+    assert default_config["Market Data"]["opening_time"] == "09:00:00"
+
+    config_path.write_bytes(b"re-encrypted")
+    trading_assistant.configure(trade)
+
+    assert len(reads) == 2
+
+
+def test_settings_are_typed_and_republished(sample_trade, sample_config):
+    settings = trading_assistant.get_settings(sample_trade, sample_config)
+
+    assert settings.process.image_magnification == 1
+    assert settings.process.is_dark_theme is False
+    assert settings.general is None
+    assert trading_assistant.get_settings(sample_trade, sample_config) is (
+        settings
+    )
+
+    sample_config["HYPERSBI2"]["utilization_ratio"] = "0.25"
+    trading_assistant.publish_settings(sample_trade, sample_config)
+
+    assert settings.process.utilization_ratio == 0.5
+    assert sample_trade.settings.process.utilization_ratio == 0.25
+
+
+def test_settings_read_a_section_only_when_it_is_used(
+    sample_trade, sample_config
+):
+    del sample_config["HYPERSBI2"]["screencast_regex"]
+    sample_config["HYPERSBI2 Widgets"] = {}
+
+    settings = trading_assistant.publish_settings(sample_trade, sample_config)
+
+    with pytest.raises(KeyError):
+        settings.process
+    with pytest.raises(KeyError):
+        settings.widgets
+
+
+def test_closing_prices_are_keyed_densely_by_securities_code(
+    sample_trade, sample_config
+):
+    codes = ("1000", "9999", "130A", "1A0Y5", "9Y9Y5")
+    keys = [trading_assistant.encode_securities_code(code) for code in codes]
+
+    assert len(set(keys)) == len(keys)
+    assert min(keys) == 0
+    assert max(keys) == trading_assistant.NUMBER_OF_SECURITIES_CODE_KEYS - 1
+
+    assert trading_assistant.write_closing_prices(
+        sample_trade,
+        sample_config,
+        {code: float(index) for index, code in enumerate(codes)},
+    )
+    assert trading_assistant.get_closing_price(sample_trade, "1A0Y5") == 3.0
+    assert trading_assistant.get_closing_price(sample_trade, "1302") == 0.0
+
+    trading_assistant.write_closing_prices(
+        sample_trade, sample_config, {"1A0Y5": 7.0}
+    )
+
+    assert trading_assistant.get_closing_price(sample_trade, "1A0Y5") == 7.0
+
+
+def test_closing_price_table_is_unmapped_when_replaced(
+    sample_trade, sample_config
+):
+    trading_assistant.write_closing_prices(
+        sample_trade, sample_config, {"1234": 1500.0}
+    )
+    table = trading_assistant._get_closing_price_table(
+        sample_trade.closing_prices
+    )
+    trading_assistant.write_closing_prices(
+        sample_trade, sample_config, {"1234": 1600.0}
+    )
+
+    assert trading_assistant.get_closing_price(sample_trade, "1234") == 1600.0
+    assert table.closed
+
+
+def test_save_market_data_streams_blocks_and_publishes_generations(
+    monkeypatch, sample_trade, sample_config, tmp_path
+):
+    monkeypatch.setattr(trading_assistant, "RANKINGS_BLOCK_SIZE", 1024)
+    rankings = tmp_path / "rankings.csv"
+    sample_config["Market Data"]["rankings"] = str(rankings)
+    generations = []
+    for price in (100, 200, 300):
+        rankings.write_text(
+            "".join(
+                f'a,b,c,d,e,f,{code},h,i,"{price:,}"\n'
+                for code in range(1301, 1801)
+            ),
+            encoding="utf-8",
+        )
+
+        assert trading_assistant.save_market_data(sample_trade, sample_config)
+        assert trading_assistant.get_closing_price(sample_trade, "1301") == (
+            price
+        )
+        assert trading_assistant.get_closing_price(sample_trade, "1800") == (
+            price
+        )
+        generations.append(Path(sample_trade.closing_prices).read_text())
+
+    assert len(set(generations)) == 3
+    assert sorted(path.name for path in tmp_path.glob("closing_prices_*")) == (
+        generations[1:]
+    )
+
+
+def test_history_sessions_list_only_partitions_up_to_the_date(
+    monkeypatch, sample_trade
+):
+    history = Path(sample_trade.market_history)
+    for session in ("2026-05-07", "2026-05-08", "2026-05-11"):
+        partition = history / f"date={session}"
+        partition.mkdir(parents=True)
+        (partition / "2.parquet").touch()
+        (partition / "1.parquet").touch()
+        (partition / ".3.parquet.tmp").touch()
+    scandir = os.scandir
+    listed = []
+
+    def record_scandir(path):
+        listed.append(Path(path).name)
+        return scandir(path)
+
+    monkeypatch.setattr(trading_assistant.os, "scandir", record_scandir)
+    sessions = trading_assistant._get_history_sessions(
+        sample_trade, trading_assistant.date(2026, 5, 8)
+    )
+
+    assert list(sessions) == [
+        trading_assistant.date(2026, 5, 7),
+        trading_assistant.date(2026, 5, 8),
+    ]
+    assert [
+        Path(path).name
+        for path in sessions[trading_assistant.date(2026, 5, 8)]
+    ] == [
+        "1.parquet",
+        "2.parquet",
+    ]
+    assert "date=2026-05-11" not in listed
+
+
+def test_market_history_answers_queries_and_stays_bounded(
+    monkeypatch, sample_trade, sample_config, tmp_path
+):
+    rankings = tmp_path / "rankings.csv"
+    sample_config["Market Data"]["rankings"] = str(rankings)
+    sample_config["Market Data"]["history_compaction_days"] = "1"
+    sample_config["Market Data"]["history_retention_days"] = "3"
+    today = trading_assistant.date(2026, 5, 11)
+
+    class FakeDate(trading_assistant.date):
+        @classmethod
+        def today(cls):
+            return today
+
+    monkeypatch.setattr(trading_assistant, "date", FakeDate)
+
+    def ingest(session, price):
+        nonlocal today
+        today = session
+        rankings.write_text(
+            "順位,市場,名称,業種,単元,時刻,コード,始値,高値,現在値\n"
+            f'1,東証PRM,Name,業種,100,15:30,1301,1,1,"{price:,}"\n'
+            "2,東証PRM,Name,業種,100,15:30,1332,1,1,-\n",
+            encoding="utf-8",
+        )
+        assert trading_assistant.save_market_data(sample_trade, sample_config)
+        trading_assistant.flush_market_history()
+
+    ingest(trading_assistant.date(2026, 5, 11), 1000)
+    ingest(trading_assistant.date(2026, 5, 12), 2000)
+    ingest(trading_assistant.date(2026, 5, 12), 2100)
+
+    assert trading_assistant.get_previous_close(
+        sample_trade, "1301", trading_assistant.date(2026, 5, 11)
+    ) == (1000.0)
+    assert (
+        trading_assistant.get_previous_close(
+            sample_trade, "1332", trading_assistant.date(2026, 5, 12)
+        )
+        is None
+    )
+    history = trading_assistant.get_closing_history(
+        sample_trade, 5, securities_codes=["1301"]
+    )
+    assert history["closing_price"].tolist() == [1000.0, 2100.0]
+
+    ingest(trading_assistant.date(2026, 5, 15), 3000)
+
+    assert [
+        len(list(partition.glob("*.parquet")))
+        for partition in sorted((tmp_path / "history").iterdir())
+    ] == [1, 1]
+    assert trading_assistant.get_previous_close(
+        sample_trade, "1301", trading_assistant.date(2026, 5, 14)
+    ) == (2100.0)
+
+
+def test_failed_snapshot_keeps_the_rankings_and_no_temporary_file(
+    monkeypatch, sample_trade, sample_config, rankings_csv, tmp_path
+):
+    sample_config["Market Data"]["rankings"] = str(rankings_csv)
+    replace = os.replace
+
+    def fake_replace(source, destination):
+        if source.endswith(".parquet.tmp"):
+            raise OSError("rename failed")
+        replace(source, destination)
+
+    monkeypatch.setattr(trading_assistant.os, "replace", fake_replace)
+
+    assert trading_assistant.save_market_data(sample_trade, sample_config)
+    trading_assistant.flush_market_history()
+
+    assert rankings_csv.exists()
+    assert not [
+        path for path in (tmp_path / "history").rglob("*") if path.is_file()
+    ]
+
+
+@pytest.mark.parametrize(
+    "session, price_limit", [("2026-05-08", 1130.0), ("2026-05-07", 4321)]
+)
+def test_restore_market_data_accepts_only_the_previous_session(
+    monkeypatch, sample_trade, sample_config, tmp_path, session, price_limit
+):
+    partition = tmp_path / "history" / f"date={session}"
+    partition.mkdir(parents=True)
+    trading_assistant.pa_parquet.write_table(
+        trading_assistant.pa.table(
+            {"securities_code": ["1234"], "closing_price": [980.0]}
+        ),
+        partition / "1.parquet",
+    )
+    (partition / "2.parquet").write_bytes(b"not a snapshot")
+
+    class FakeDate(trading_assistant.date):
+        @classmethod
+        def today(cls):
+            # The Monday after the session of Friday, 2026-05-08.
+            return cls(2026, 5, 11)
+
+    monkeypatch.setattr(trading_assistant, "date", FakeDate)
+    sample_trade.market_holidays = str(tmp_path / "market_holidays.csv")
+    sample_config["Market Holidays"] = {"date_format": "%%Y/%%m/%%d"}
+    monkeypatch.setattr(
+        trading_assistant.WindowsBackend,
+        "recognize_text",
+        lambda *args, **kwargs: 4321,
+    )
+
+    assert trading_assistant.restore_market_data(
+        sample_trade, sample_config
+    ) == (price_limit != 4321)
+    assert (
+        trading_assistant.get_price_limit(sample_trade, sample_config)
+        == price_limit
+    )
+
+
+def test_price_limits_are_precomputed_from_the_bands(
+    sample_trade, sample_config
+):
+    assert trading_assistant.write_closing_prices(
+        sample_trade,
+        sample_config,
+        {"1301": 99.0, "1332": 100.0, "1333": 499.0, "1334": 50_000.0},
+    )
+
+    assert [
+        trading_assistant.get_saved_price_limit(sample_trade, code)
+        for code in ("1301", "1332", "1333", "1334", "1335")
+    ] == [129.0, 150.0, 579.0, 60_000.0, 0.0]
+
+
+@pytest.mark.parametrize(
+    "bands, message",
+    [
+        ("((100, 30), (200,))", "is not a sequence of pairs"),
+        ("((100, 30), (None, 50), (500, 80))", "Only the last maximum"),
+        ("((100, 30), (2oo, 50))", "is not a sequence of pairs"),
+        ("((200, 30), (100, 50), (None, 80))", "must be ascending"),
+        ("((100, 30), (None, '50'))", "limits must be numbers"),
+    ],
+)
+def test_invalid_price_limit_bands_are_reported(
+    capsys, sample_trade, sample_config, bands, message
+):
+    sample_config["Market Data"]["price_limit_bands"] = bands
+
+    assert not trading_assistant.write_closing_prices(
+        sample_trade, sample_config, {"1301": 99.0}
+    )
+    assert message in capsys.readouterr().out
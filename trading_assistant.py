@@ -1,90 +1,190 @@
 """Assist with discretionary day trading of stocks on margin."""
 
-from collections import defaultdict
-from datetime import date
+from collections import defaultdict, deque
+from datetime import date, timedelta
 from io import BytesIO
-from multiprocessing.managers import BaseManager
-from tkinter import TclError
+from multiprocessing.connection import AuthenticationError, Client, Listener
+import abc
 import argparse
 import atexit
+import concurrent.futures
 import configparser
+import contextvars
 import csv
+import dataclasses
+import functools
+import hashlib
+import importlib
+import itertools
+import json
+import marshal
 import math
+import mmap
 import os
+import queue
 import re
 import sched
+import secrets
+import shutil
+import struct
 import sys
+import tempfile
 import threading
 import time
-import tkinter as tk
-import win32clipboard
-
-from pynput import keyboard
-from pynput import mouse
-from win32api import GetMonitorInfo, MonitorFromPoint
-import pandas as pd
-import psutil
-import pyautogui
-import requests
-import win32gui
-
-from core_utilities import (
-    configuration,
-    data_utilities,
-    file_utilities,
-    initializer,
-    process_utilities,
+import types
+
+from core_utilities import configuration, file_utilities, initializer
+
+
+# 'importlib.util.LazyLoader' needs a spec at import time, and finding the
+# spec of a submodule such as 'pyarrow.compute' imports its package, while
+# modules such as 'win32api' have no spec outside Windows.
+class _LazyModule(types.ModuleType):
+    """Stand in for a module until one of its attributes is used."""
+
+    def __init__(self, name, alias):
+        """Construct a new _LazyModule object."""
+        super().__init__(name)
+        self.__dict__["_alias"] = alias
+
+    def _load(self):
+        """Import the module and bind it in place of this object."""
+        module = importlib.import_module(self.__name__)
+        if globals().get(self._alias) is self:
+            globals()[self._alias] = module
+        return module
+
+    def __getattr__(self, name):
+        """Return an attribute of the imported module."""
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        """Set an attribute of the imported module."""
+        setattr(self._load(), name, value)
+
+    def __delattr__(self, name):
+        """Delete an attribute of the imported module."""
+        delattr(self._load(), name)
+
+
+# Defer the modules that only some commands use so that the configuration
+# options and the daemon client start quickly.
+asyncio = _LazyModule("asyncio", "asyncio")
+managers = _LazyModule("multiprocessing.managers", "managers")
+keyboard = _LazyModule("pynput.keyboard", "keyboard")
+mouse = _LazyModule("pynput.mouse", "mouse")
+np = _LazyModule("numpy", "np")
+pa = _LazyModule("pyarrow", "pa")
+pa_compute = _LazyModule("pyarrow.compute", "pa_compute")
+pa_csv = _LazyModule("pyarrow.csv", "pa_csv")
+pa_dataset = _LazyModule("pyarrow.dataset", "pa_dataset")
+pa_parquet = _LazyModule("pyarrow.parquet", "pa_parquet")
+pd = _LazyModule("pandas", "pd")
+psutil = _LazyModule("psutil", "psutil")
+pyautogui = _LazyModule("pyautogui", "pyautogui")
+requests = _LazyModule("requests", "requests")
+tk = _LazyModule("tkinter", "tk")
+win32api = _LazyModule("win32api", "win32api")
+win32clipboard = _LazyModule("win32clipboard", "win32clipboard")
+win32crypt = _LazyModule("win32crypt", "win32crypt")
+win32gui = _LazyModule("win32gui", "win32gui")
+pywintypes = _LazyModule("pywintypes", "pywintypes")
+
+data_utilities = _LazyModule("core_utilities.data_utilities", "data_utilities")
+process_utilities = _LazyModule(
+    "core_utilities.process_utilities", "process_utilities"
 )
-from interaction_utilities import (
-    gui_interactions,
-    speech_synthesis,
-    text_recognition,
+gui_interactions = _LazyModule(
+    "interaction_utilities.gui_interactions", "gui_interactions"
 )
-from web_utilities import web_utilities
+speech_synthesis = _LazyModule(
+    "interaction_utilities.speech_synthesis", "speech_synthesis"
+)
+text_recognition = _LazyModule(
+    "interaction_utilities.text_recognition", "text_recognition"
+)
+web_utilities = _LazyModule("web_utilities.web_utilities", "web_utilities")
 
 RATIO_EPSILON = 1e-4
 SANS_INITIAL_SECURITIES_CODE_REGEX = (
     r"[\dACDFGHJKLMNPRSTUWXY]\d[\dACDFGHJKLMNPRSTUWXY]5?"
 )
 SECURITIES_CODE_REGEX = "[1-9]" + SANS_INITIAL_SECURITIES_CODE_REGEX
+# The second and fourth characters of a securities code are digits or one of
+# these letters, so each code maps to a distinct index of a dense table.
+SECURITIES_CODE_CHARACTERS = "0123456789ACDFGHJKLMNPRSTUWXY"
+NUMBER_OF_SECURITIES_CODE_KEYS = 9 * 29 * 10 * 29 * 2
+RANKINGS_BLOCK_SIZE = 1 << 20
+TRADING_UNIT = 100
+# Short selling on margin is limited to this number of trading units.
+MAXIMUM_SHORT_TRADING_UNITS = 50
+# Each row of the market data table holds the closing price and the upper
+# price limit derived from it.
+MARKET_DATA_ROW = struct.Struct("2d")
+# Daily price limits by the maximum closing price (exclusive) of each band.
+# None means no maximum.
+PRICE_LIMIT_BANDS = (
+    (100, 30),
+    (200, 50),
+    (500, 80),
+    (700, 100),
+    (1000, 150),
+    (1500, 300),
+    (2000, 400),
+    (3000, 500),
+    (5000, 700),
+    (7000, 1000),
+    (10000, 1500),
+    (15000, 3000),
+    (20000, 4000),
+    (30000, 5000),
+    (50000, 7000),
+    (70000, 10000),
+    (100000, 15000),
+    (150000, 30000),
+    (200000, 40000),
+    (300000, 50000),
+    (500000, 70000),
+    (700000, 100000),
+    (1000000, 150000),
+    (1500000, 300000),
+    (2000000, 400000),
+    (3000000, 500000),
+    (5000000, 700000),
+    (7000000, 1000000),
+    (10000000, 1500000),
+    (15000000, 3000000),
+    (20000000, 4000000),
+    (30000000, 5000000),
+    (50000000, 7000000),
+    (None, 10000000),
+)
 
 
 class Trade(initializer.Initializer):
     """Handle trading operations for a specific vendor and process."""
 
-    _MODIFIER_KEYS = {
-        keyboard.Key.alt,
-        keyboard.Key.alt_gr,
-        keyboard.Key.alt_l,
-        keyboard.Key.alt_r,
-        keyboard.Key.cmd,
-        keyboard.Key.cmd_l,
-        keyboard.Key.cmd_r,
-        keyboard.Key.ctrl,
-        keyboard.Key.ctrl_l,
-        keyboard.Key.ctrl_r,
-        keyboard.Key.shift,
-        keyboard.Key.shift_l,
-        keyboard.Key.shift_r,
-    }
-    _FUNCTION_KEYS = (
-        keyboard.Key.f1,
-        keyboard.Key.f2,
-        keyboard.Key.f3,
-        keyboard.Key.f4,
-        keyboard.Key.f5,
-        keyboard.Key.f6,
-        keyboard.Key.f7,
-        keyboard.Key.f8,
-        keyboard.Key.f9,
-        keyboard.Key.f10,
-        keyboard.Key.f11,
-        keyboard.Key.f12,
-    )
-
-    def __init__(self, vendor, process):
+    _MODIFIER_KEY_NAMES = (
+        "alt",
+        "alt_gr",
+        "alt_l",
+        "alt_r",
+        "cmd",
+        "cmd_l",
+        "cmd_r",
+        "ctrl",
+        "ctrl_l",
+        "ctrl_r",
+        "shift",
+        "shift_l",
+        "shift_r",
+    )
+    _FUNCTION_KEY_NAMES = tuple(f"f{number}" for number in range(1, 13))
+
+    def __init__(self, vendor, process, backend=None):
         """Initialize the Trade with the vendor and process."""
         super().__init__(vendor, process, __file__)
+        self.backend = backend or WindowsBackend()
         self.market_directory = os.path.join(self.config_directory, "market")
         self.resource_directory = os.path.join(
             self.config_directory, self.process
@@ -96,8 +196,9 @@ class Trade(initializer.Initializer):
             self.market_directory, "market_holidays.csv"
         )
         self.closing_prices = os.path.join(
-            self.market_directory, "closing_prices_"
+            self.market_directory, "closing_prices"
         )
+        self.market_history = os.path.join(self.market_directory, "history")
 
         self.geometries_section = f"{self.process} Geometries"
 
@@ -109,6 +210,22 @@ class Trade(initializer.Initializer):
         self.customer_margin_ratios = os.path.join(
             self.resource_directory, "customer_margin_ratios.csv"
         )
+        self.share_sizes = os.path.join(
+            self.resource_directory, "share_sizes.csv"
+        )
+
+        self.state_file = os.path.join(self.resource_directory, "state.json")
+        self.state_journal = os.path.join(
+            self.resource_directory, "state_journal.jsonl"
+        )
+        self.state_store = None
+        self.config_digest = None
+        self.config_snapshot = os.path.join(
+            self.resource_directory, "config_snapshot.bin"
+        )
+        self.default_sections = None
+        self.config_sections = None
+        self.settings = None
 
         self.window_titles_section = f"{self.process} Window Titles"
 
@@ -121,14 +238,23 @@ class Trade(initializer.Initializer):
             self.resource_directory, f"{self.startup_script_base}.ps1"
         )
 
+        self.daemon_authkey = os.path.join(
+            self.resource_directory, "daemon_authkey"
+        )
+        if sys.platform == "win32":
+            self.daemon_address = rf"\\.\pipe\{self.startup_script_base}"
+        else:
+            self.daemon_address = os.path.join(
+                self.resource_directory, "daemon.sock"
+            )
+
         self.mouse_listener = None
 
         self.keyboard_listener = None
-        self.keyboard_listener_state = 0
         self._pressed_modifiers = set()
         self._last_action_time = 0
-        self.key_to_check = None
-        self.should_continue = False
+        self._armed_tokens = set()
+        self._armed_tokens_lock = threading.Lock()
 
         self.speech_manager = None
         self.speaking_process = None
@@ -136,12 +262,18 @@ class Trade(initializer.Initializer):
         self.stop_listeners_event = None
         self.wait_listeners_thread = None
 
+        self.action_graph = None
+        self.input_map = None
+        self.input_event_queue = None
+        self.action_executor = None
+
         self.instruction_items = {
             "all_keys": sorted(_COMMAND_DISPATCH.keys()),
             "no_value_keys": {
                 "back_to",
                 "get_cash_balance",
                 "save_market_data",
+                "save_trace",
                 "show_hide_indicator",
                 "write_share_size",
             },
@@ -195,7 +327,7 @@ class Trade(initializer.Initializer):
 
     def get_symbol(self, hwnd, title_regex):
         """Get the symbol from a window title matching a regular expression."""
-        matched = re.fullmatch(title_regex, win32gui.GetWindowText(hwnd))
+        matched = re.fullmatch(title_regex, self.backend.get_window_text(hwnd))
         if matched:
             self.symbol = matched.group(1)
             return False
@@ -203,46 +335,65 @@ class Trade(initializer.Initializer):
 
     def on_click(self, _1, _2, button, pressed, config, gui_state):
         """Handle mouse click events."""
-        if gui_state.is_interactive_window():
-            if not pressed:
-                action = configuration.evaluate_value(
-                    config[self.process]["input_map"]
-                ).get(button.name)
-                if action:
-                    start_execute_action_thread(
-                        self, config, gui_state, action
-                    )
+        if not pressed:
+            binding = self.input_map.bindings.get(button)
+            if binding and gui_state.is_interactive_window():
+                self.action_executor.submit(*binding)
+
+    @staticmethod
+    @functools.cache
+    def get_modifier_keys():
+        """Return the modifier keys once 'pynput' is needed."""
+        return frozenset(
+            getattr(keyboard.Key, name) for name in Trade._MODIFIER_KEY_NAMES
+        )
+
+    @staticmethod
+    @functools.cache
+    def get_function_keys():
+        """Return the function keys once 'pynput' is needed."""
+        return frozenset(
+            getattr(keyboard.Key, name) for name in Trade._FUNCTION_KEY_NAMES
+        )
 
     def on_press(self, key, config, gui_state):
         """Handle key press events."""
         if gui_state.is_interactive_window():
             # Add context for whether modifiers are pressed.
-            if key in Trade._MODIFIER_KEYS:
+            if key in Trade.get_modifier_keys():
                 self._pressed_modifiers.add(key)
                 return
-            if self.keyboard_listener_state == 0:
-                if key in Trade._FUNCTION_KEYS and not self._pressed_modifiers:
+            armed_tokens = self._armed_tokens
+            if not armed_tokens:
+                binding = self.input_map.bindings.get(key)
+                if binding and not self._pressed_modifiers:
                     now = time.time()
                     # A 0.3-second debounce interval prevents double-triggers
                     # from both software detection and hardware chattering.
                     if now - self._last_action_time > 0.3:
-                        action = configuration.evaluate_value(
-                            config[self.process]["input_map"]
-                        ).get(key.name)
-                        if action:
-                            start_execute_action_thread(
-                                self, config, gui_state, action
-                            )
-                            self._last_action_time = now
-            elif self.keyboard_listener_state == 1:
-                if (
-                    hasattr(key, "char") and key.char == self.key_to_check
-                ) or key == self.key_to_check:
-                    self.should_continue = True
-                    self.keyboard_listener_state = 0
-                elif key == keyboard.Key.esc:
-                    self.should_continue = False
-                    self.keyboard_listener_state = 0
+                        self.action_executor.submit(*binding)
+                        self._last_action_time = now
+            else:
+                with self._armed_tokens_lock:
+                    armed_tokens = tuple(armed_tokens)
+                for token in armed_tokens:
+                    if key == keyboard.Key.esc:
+                        token.cancel()
+                    elif (
+                        hasattr(key, "char") and key.char == token.key
+                    ) or key == token.key:
+                        token.resume()
+
+    def arm_token(self, token, key=None):
+        """Route the key, or the Esc key, to a waiting action's token."""
+        token.arm(key)
+        with self._armed_tokens_lock:
+            self._armed_tokens.add(token)
+
+    def disarm_token(self, token):
+        """Stop routing key presses to a token."""
+        with self._armed_tokens_lock:
+            self._armed_tokens.discard(token)
 
     def on_release(self, key, gui_state):
         """Handle key release events to update modifiers."""
@@ -272,51 +423,33 @@ class IndicatorThread(threading.Thread):
         self.root.attributes("-transparentcolor", "black")
         self.root.config(bg="black")
         self.root.overrideredirect(True)
-        self.root.title(
-            self.config[self.trade.process]["title"] + " Indicator"
-        )
+        settings = get_settings(self.trade, self.config)
+        self.root.title(settings.process.title + " Indicator")
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
 
-        is_clock_label_enabled = self.config[
-            self.trade.widgets_section
-        ].getboolean("is_clock_label_enabled")
-        maximum_daily_number_of_trades = int(
-            self.config[self.trade.process]["maximum_daily_number_of_trades"]
+        is_clock_label_enabled = settings.widgets.is_clock_label_enabled
+        maximum_daily_number_of_trades = (
+            settings.process.maximum_daily_number_of_trades
         )
 
         if is_clock_label_enabled:
             clock_label = tk.Label(
                 self.root,
-                font=(
-                    "Tahoma",
-                    -int(
-                        self.config[self.trade.widgets_section][
-                            "clock_label_font_size"
-                        ]
-                    ),
-                ),
+                font=("Tahoma", -settings.widgets.clock_label_font_size),
                 bg="gray5",
                 fg="tan1",
             )
             self._place_widget(
-                clock_label,
-                self.config[self.trade.widgets_section][
-                    "clock_label_position"
-                ],
+                clock_label, settings.widgets.clock_label_position
             )
             IndicatorTooltip(clock_label, "Current system time")
 
-        status_bar_frame_font_size = int(
-            self.config[self.trade.widgets_section][
-                "status_bar_frame_font_size"
-            ]
+        status_bar_frame_font_size = (
+            settings.widgets.status_bar_frame_font_size
         )
         status_bar_frame = tk.Frame(self.root, bg="gray5")
         self._place_widget(
-            status_bar_frame,
-            self.config[self.trade.widgets_section][
-                "status_bar_frame_position"
-            ],
+            status_bar_frame, settings.widgets.status_bar_frame_position
         )
 
         current_number_of_trades_label = tk.Label(
@@ -372,9 +505,9 @@ class IndicatorThread(threading.Thread):
                 if is_clock_label_enabled:
                     clock_label.config(text=time.strftime("%H:%M:%S"))
 
-                current_number_of_trades = self.config[
-                    self.trade.variables_section
-                ]["current_number_of_trades"]
+                current_number_of_trades = (
+                    self.trade.state_store.current_number_of_trades
+                )
                 if maximum_daily_number_of_trades:
                     current_number_of_trades_label.config(
                         text=(
@@ -388,14 +521,14 @@ class IndicatorThread(threading.Thread):
                     )
 
                 self.root.update()
-            except TclError:
+            except tk.TclError:
                 break
             time.sleep(0.01)
 
         if self.root:
             try:
                 self.root.destroy()
-            except TclError:
+            except tk.TclError:
                 pass
 
     def stop(self):
@@ -409,9 +542,9 @@ class IndicatorThread(threading.Thread):
 
     def _place_widget(self, widget, position):
         """Place the widget according to the specified position."""
-        work_left, work_top, work_right, work_bottom = GetMonitorInfo(
-            MonitorFromPoint((0, 0))
-        ).get("Work")
+        work_left, work_top, work_right, work_bottom = (
+            self.trade.backend.get_work_area()
+        )
         work_center_x = int(0.5 * work_right)
         work_center_y = int(0.5 * work_bottom)
         position_map = {
@@ -461,6 +594,7 @@ class IndicatorThread(threading.Thread):
             self.config[self.trade.process][
                 "utilization_ratio"
             ] = self._utilization_ratio_string.get()
+            publish_settings(self.trade, self.config)
         except ValueError:
             pass
 
@@ -530,28 +664,20 @@ class MessageThread(threading.Thread):
         root.attributes("-topmost", True)
         root.bind("<Escape>", lambda event: root.destroy())
         root.resizable(False, False)
-        root.title(self.config[self.trade.process]["title"] + " Message")
+        settings = get_settings(self.trade, self.config)
+        root.title(settings.process.title + " Message")
         root.withdraw()
 
         tk.Message(
             root,
             bg="gray5",
             fg="tan1",
-            font=(
-                "Bahnschrift",
-                -int(
-                    self.config[self.trade.widgets_section][
-                        "message_font_size"
-                    ]
-                ),
-            ),
+            font=("Bahnschrift", -settings.widgets.message_font_size),
             text=self.text,
         ).pack()
 
         root.update()
-        _, _, work_right, work_bottom = GetMonitorInfo(
-            MonitorFromPoint((0, 0))
-        ).get("Work")
+        _, _, work_right, work_bottom = self.trade.backend.get_work_area()
         root.geometry(
             f"+{int(0.5 * (work_right - root.winfo_width()))}"
             f"+{int(0.5 * (work_bottom - root.winfo_height()))}"
@@ -561,6 +687,445 @@ class MessageThread(threading.Thread):
         root.mainloop()
 
 
+class AutomationBackend(abc.ABC):
+    """Define the side effects that actions perform on the desktop."""
+
+    # Pointer
+
+    @abc.abstractmethod
+    def move_to(self, *position):
+        """Move the pointer to a position."""
+
+    @abc.abstractmethod
+    def click(self, x, y, button="left"):
+        """Click a button at the coordinates."""
+
+    @abc.abstractmethod
+    def drag_to(self, x, y):
+        """Drag the pointer to the coordinates."""
+
+    # Keyboard
+
+    @abc.abstractmethod
+    def press_hotkeys(self, *keys):
+        """Press the keys together."""
+
+    @abc.abstractmethod
+    def press_key(self, key, presses=1):
+        """Press a key a number of times."""
+
+    @abc.abstractmethod
+    def write_string(self, string):
+        """Type a string."""
+
+    @abc.abstractmethod
+    def create_mouse_listener(self, on_click):
+        """Return an unstarted listener that reports mouse clicks."""
+
+    @abc.abstractmethod
+    def create_keyboard_listener(self, on_press, on_release):
+        """Return an unstarted listener that reports key events."""
+
+    # Clipboard
+
+    @abc.abstractmethod
+    def get_clipboard_text(self):
+        """Return the text on the clipboard."""
+
+    @abc.abstractmethod
+    def set_clipboard_text(self, text):
+        """Replace the clipboard contents with the text."""
+
+    # Windows and processes
+
+    @abc.abstractmethod
+    def create_gui_state(self, interactive_windows):
+        """Return the GUI state for the interactive window patterns."""
+
+    @abc.abstractmethod
+    def get_foreground_window(self):
+        """Return the handle of the foreground window."""
+
+    @abc.abstractmethod
+    def get_window_text(self, hwnd):
+        """Return the title of a window."""
+
+    @abc.abstractmethod
+    def enumerate_windows(self, callback, argument):
+        """Call the callback for each top-level window until it stops."""
+
+    @abc.abstractmethod
+    def hide_window(self, title_regex):
+        """Hide the windows whose titles match."""
+
+    @abc.abstractmethod
+    def show_hide_window(self, title_regex):
+        """Toggle the visibility of the windows whose titles match."""
+
+    @abc.abstractmethod
+    def show_window(self, title_regex, max_count=1):
+        """Show up to a number of windows whose titles match."""
+
+    @abc.abstractmethod
+    def wait_for_window(self, title_regex, should_continue_reference):
+        """Wait for a matching window while the reference returns True."""
+
+    @abc.abstractmethod
+    def get_work_area(self):
+        """Return the left, top, right, and bottom of the work area."""
+
+    @abc.abstractmethod
+    def is_process_running(self, process):
+        """Return True if the process is running."""
+
+    # Screen capture and text recognition
+
+    @abc.abstractmethod
+    def click_widget(self, gui_state, image, x, y, width, height):
+        """Locate an image in the region and click it."""
+
+    @abc.abstractmethod
+    def recognize_text(self, *args, **kwargs):
+        """Recognize text in a screen region."""
+
+
+class WindowsBackend(AutomationBackend):
+    """Perform actions on the Windows desktop."""
+
+    def move_to(self, *position):
+        """Move the pointer to a position."""
+        pyautogui.moveTo(*position)
+
+    def click(self, x, y, button="left"):
+        """Click a button at the coordinates."""
+        pyautogui.click(x, y, button=button)
+
+    def drag_to(self, x, y):
+        """Drag the pointer to the coordinates."""
+        pyautogui.dragTo(x, y)
+
+    def press_hotkeys(self, *keys):
+        """Press the keys together."""
+        pyautogui.hotkey(*keys)
+
+    def press_key(self, key, presses=1):
+        """Press a key a number of times."""
+        pyautogui.press(key, presses=presses)
+
+    def write_string(self, string):
+        """Type a string."""
+        pyautogui.write(string)
+
+    def create_mouse_listener(self, on_click):
+        """Return an unstarted listener that reports mouse clicks."""
+        return mouse.Listener(on_click=on_click)
+
+    def create_keyboard_listener(self, on_press, on_release):
+        """Return an unstarted listener that reports key events."""
+        return keyboard.Listener(on_press=on_press, on_release=on_release)
+
+    def get_clipboard_text(self):
+        """Return the text on the clipboard."""
+        win32clipboard.OpenClipboard()
+        try:
+            return win32clipboard.GetClipboardData(
+                win32clipboard.CF_UNICODETEXT
+            )
+        except TypeError:
+            return ""
+        finally:
+            win32clipboard.CloseClipboard()
+
+    def set_clipboard_text(self, text):
+        """Replace the clipboard contents with the text."""
+        win32clipboard.OpenClipboard()
+        win32clipboard.EmptyClipboard()
+        win32clipboard.SetClipboardText(text)
+        win32clipboard.CloseClipboard()
+
+    def create_gui_state(self, interactive_windows):
+        """Return the GUI state for the interactive window patterns."""
+        gui_state = gui_interactions.GuiState(interactive_windows)
+        # Input events check the foreground window, so replace the check
+        # that matches each pattern in turn.
+        gui_state.is_interactive_window = WindowClassifier(
+            self, interactive_windows
+        ).is_interactive_window
+        return gui_state
+
+    def get_foreground_window(self):
+        """Return the handle of the foreground window."""
+        return win32gui.GetForegroundWindow()
+
+    def get_window_text(self, hwnd):
+        """Return the title of a window."""
+        return win32gui.GetWindowText(hwnd)
+
+    def enumerate_windows(self, callback, argument):
+        """Call the callback for each top-level window until it stops."""
+        gui_interactions.enumerate_windows(callback, argument)
+
+    def hide_window(self, title_regex):
+        """Hide the windows whose titles match."""
+        gui_interactions.enumerate_windows(
+            gui_interactions.hide_window, title_regex
+        )
+
+    def show_hide_window(self, title_regex):
+        """Toggle the visibility of the windows whose titles match."""
+        gui_interactions.enumerate_windows(
+            gui_interactions.show_hide_window, title_regex
+        )
+
+    def show_window(self, title_regex, max_count=1):
+        """Show up to a number of windows whose titles match."""
+        gui_interactions._show_window_state["count"] = 0
+        gui_interactions._show_window_state["max_count"] = max_count
+        gui_interactions.enumerate_windows(
+            gui_interactions.show_window, title_regex
+        )
+
+    def wait_for_window(self, title_regex, should_continue_reference):
+        """Wait for a matching window while the reference returns True."""
+        gui_interactions.wait_for_window(
+            title_regex, should_continue_reference=should_continue_reference
+        )
+
+    def get_work_area(self):
+        """Return the left, top, right, and bottom of the work area."""
+        return win32api.GetMonitorInfo(win32api.MonitorFromPoint((0, 0))).get(
+            "Work"
+        )
+
+    def is_process_running(self, process):
+        """Return True if the process is running."""
+        return process_utilities.is_running(process)
+
+    def click_widget(self, gui_state, image, x, y, width, height):
+        """Locate an image in the region and click it."""
+        gui_interactions.click_widget(gui_state, image, x, y, width, height)
+
+    def recognize_text(self, *args, **kwargs):
+        """Recognize text in a screen region."""
+        return text_recognition.recognize_text(*args, **kwargs)
+
+
+class HeadlessBackend(AutomationBackend):
+    """Record automation calls and serve scripted responses."""
+
+    def __init__(self, windows=None, responses=None, work_area=None):
+        """Construct a new HeadlessBackend object."""
+        self.calls = []
+        self.windows = dict(windows or {})
+        self.responses = dict(responses or {})
+        self.work_area = work_area or (0, 0, 1920, 1040)
+        self.clipboard_text = ""
+        self.mouse_listener = None
+        self.keyboard_listener = None
+
+    def _record(self, name, *args, **kwargs):
+        """Append a timestamped call; 'list.append()' is thread-safe."""
+        self.calls.append((time.perf_counter(), name, args, kwargs))
+
+    def _respond(self, name, default=None):
+        """Return the next scripted response for a method."""
+        response = self.responses.get(name, default)
+        if callable(response):
+            return response()
+        if isinstance(response, list):
+            return response.pop(0) if response else default
+        return response
+
+    def move_to(self, *position):
+        """Record moving the pointer to a position."""
+        self._record("move_to", *position)
+
+    def click(self, x, y, button="left"):
+        """Record a click at the coordinates."""
+        self._record("click", x, y, button=button)
+
+    def drag_to(self, x, y):
+        """Record dragging the pointer to the coordinates."""
+        self._record("drag_to", x, y)
+
+    def press_hotkeys(self, *keys):
+        """Record pressing the keys together."""
+        self._record("press_hotkeys", *keys)
+
+    def press_key(self, key, presses=1):
+        """Record pressing a key a number of times."""
+        self._record("press_key", key, presses=presses)
+
+    def write_string(self, string):
+        """Record typing a string."""
+        self._record("write_string", string)
+
+    def create_mouse_listener(self, on_click):
+        """Return a listener whose callback can be fed recorded clicks."""
+        self.mouse_listener = HeadlessListener(on_click=on_click)
+        return self.mouse_listener
+
+    def create_keyboard_listener(self, on_press, on_release):
+        """Return a listener whose callbacks can be fed recorded keys."""
+        self.keyboard_listener = HeadlessListener(
+            on_press=on_press, on_release=on_release
+        )
+        return self.keyboard_listener
+
+    def get_clipboard_text(self):
+        """Return the recorded clipboard text."""
+        self._record("get_clipboard_text")
+        return self.clipboard_text
+
+    def set_clipboard_text(self, text):
+        """Record replacing the clipboard contents."""
+        self._record("set_clipboard_text", text)
+        self.clipboard_text = text
+
+    def create_gui_state(self, interactive_windows):
+        """Return a GUI state that treats every window as interactive."""
+        return HeadlessGuiState(self, interactive_windows)
+
+    def get_foreground_window(self):
+        """Return the scripted foreground window or the first window."""
+        return self._respond(
+            "get_foreground_window", next(iter(self.windows), 0)
+        )
+
+    def get_window_text(self, hwnd):
+        """Return the title of a scripted window."""
+        return self.windows.get(hwnd, "")
+
+    def enumerate_windows(self, callback, argument):
+        """Call the callback for each scripted window until it stops."""
+        self._record("enumerate_windows", argument)
+        for hwnd in list(self.windows):
+            if callback(hwnd, argument) is False:
+                break
+
+    def hide_window(self, title_regex):
+        """Record hiding the matching windows."""
+        self._record("hide_window", title_regex)
+
+    def show_hide_window(self, title_regex):
+        """Record toggling the matching windows."""
+        self._record("show_hide_window", title_regex)
+
+    def show_window(self, title_regex, max_count=1):
+        """Record showing the matching windows."""
+        self._record("show_window", title_regex, max_count=max_count)
+
+    def wait_for_window(self, title_regex, should_continue_reference):
+        """Record waiting for a window, which appears immediately."""
+        self._record("wait_for_window", title_regex)
+
+    def get_work_area(self):
+        """Return the scripted work area."""
+        return self.work_area
+
+    def is_process_running(self, process):
+        """Return the scripted process state, which defaults to True."""
+        return self._respond("is_process_running", True)
+
+    def click_widget(self, gui_state, image, x, y, width, height):
+        """Record locating and clicking an image."""
+        self._record("click_widget", image, x, y, width, height)
+
+    def recognize_text(self, *args, **kwargs):
+        """Return the next scripted recognition result."""
+        self._record("recognize_text", *args, **kwargs)
+        return self._respond("recognize_text", 0)
+
+
+class WindowClassifier:
+    """Classify the foreground window by its title with a cached verdict."""
+
+    def __init__(self, backend, interactive_windows):
+        """Construct a new WindowClassifier object."""
+        self.backend = backend
+        regexes = [
+            re.compile(title_regex) for title_regex in interactive_windows
+        ]
+        # Inline flags apply to a whole alternation and group numbers shift
+        # in it, so the patterns that use them are matched one by one.
+        separate_regexes = [
+            regex
+            for regex in regexes
+            if regex.flags != re.UNICODE
+            or re.search(r"\\[1-9]|\(\?\(", regex.pattern)
+        ]
+        combined_patterns = [
+            f"(?:{regex.pattern})"
+            for regex in regexes
+            if regex not in separate_regexes
+        ]
+        self.regexes = tuple(separate_regexes)
+        if combined_patterns:
+            try:
+                self.regexes = (
+                    re.compile("|".join(combined_patterns)),
+                    *separate_regexes,
+                )
+            except re.error:
+                # Group names may repeat across the patterns.
+                self.regexes = tuple(regexes)
+        self._verdict = (None, None, False)
+
+    def is_interactive_window(self):
+        """Return True if the foreground window title matches a pattern."""
+        hwnd = self.backend.get_foreground_window()
+        title = self.backend.get_window_text(hwnd)
+        cached_hwnd, cached_title, verdict = self._verdict
+        if hwnd != cached_hwnd or title != cached_title:
+            verdict = any(regex.fullmatch(title) for regex in self.regexes)
+            # Replace the tuple whole so that readers never see a mix.
+            self._verdict = (hwnd, title, verdict)
+        return verdict
+
+
+class HeadlessGuiState:
+    """Provide the GUI state attributes that actions read."""
+
+    def __init__(self, backend, interactive_windows):
+        """Construct a new HeadlessGuiState object."""
+        self.backend = backend
+        self.interactive_windows = interactive_windows
+        self.previous_position = None
+        self.swapped = False
+
+    def initialize_attributes(self):
+        """Reset the previous pointer position."""
+        self.previous_position = None
+
+    def is_interactive_window(self):
+        """Return the scripted interactivity, which defaults to True."""
+        return self.backend._respond("is_interactive_window", True)
+
+
+class HeadlessListener:
+    """Stand in for a pynput listener so tests can inject events."""
+
+    def __init__(self, **callbacks):
+        """Construct a new HeadlessListener object."""
+        self.callbacks = callbacks
+        self.running = False
+
+    def start(self):
+        """Mark the listener as running."""
+        self.running = True
+
+    def stop(self):
+        """Mark the listener as stopped."""
+        self.running = False
+
+    def join(self, timeout=None):
+        """Return immediately because no thread is involved."""
+
+    def is_alive(self):
+        """Return True if the listener is running."""
+        return self.running
+
+
 # Entry Point
 
 
@@ -568,29 +1133,59 @@ def main():
     """Execute the main program based on command-line arguments."""
     args = get_arguments()
     trade = Trade(*args.P)
+    # A running daemon executes the action without the startup below.
+    if args.a and not args.d and send_action(trade, args.a[0]):
+        return
 
     file_utilities.create_launchers_exit(args, __file__)
     configure_exit(args, trade)
 
     config = configure(trade)
     configuration.ensure_section_exists(config, trade.process)
-    gui_state = gui_interactions.GuiState(
+    gui_state = trade.backend.create_gui_state(
         configuration.evaluate_value(
             config[trade.process]["interactive_windows"]
         )
     )
+    trade.config_digest = get_config_digest(config)
+    publish_settings(trade, config)
+    trade.state_store = StateStore(trade.state_file, trade.state_journal)
+    if config.has_section(trade.variables_section):
+        if trade.state_store.is_new:
+            trade.state_store.migrate(config[trade.variables_section])
+        config.remove_section(trade.variables_section)
+    trade.state_store.roll_over(date.today())
     atexit.register(on_exit, trade, config)
+    if args.s or args.l or args.a or args.d:
+        # Orders only look up the table, so the history is read beforehand.
+        threading.Thread(
+            target=restore_market_data, args=(trade, config), daemon=True
+        ).start()
+    compile_actions(trade, config)
+    if args.t:
+        start_tracing(trade)
+    if config[trade.process].getboolean("is_parallel_execution_enabled"):
+        start_parallel_execution(
+            int(config[trade.process]["number_of_instruction_workers"])
+        )
 
     if args.r:
         save_customer_margin_ratios(trade, config)
+    if args.b:
+        save_share_sizes(trade, config, args.b[0], args.b[1:])
 
-    is_running = process_utilities.is_running(trade.process)
-    if args.s or args.l or args.a:
+    is_running = trade.backend.is_process_running(trade.process)
+    if args.s or args.l or args.a or args.d:
         # Use 'BaseManager' to share 'SpeechManager' instance across processes.
-        BaseManager.register("SpeechManager", speech_synthesis.SpeechManager)
-        base_manager = BaseManager()
+        managers.BaseManager.register(
+            "SpeechManager", speech_synthesis.SpeechManager
+        )
+        base_manager = managers.BaseManager()
         base_manager.start()
         trade.speech_manager = base_manager.SpeechManager()
+    if args.d:
+        start_daemon(trade, config, gui_state, base_manager)
+        return
     if args.a:
         if not (is_running and args.l):
             start_listeners(
@@ -605,9 +1200,11 @@ def main():
             trade,
             config,
             gui_state,
-            config[trade.actions_section][args.a[0]],
+            trade.action_graph.actions[args.a[0]],
         )
         if not (is_running and args.l):
+            trade.input_event_queue.stop()
+            trade.action_executor.shutdown()
             process_utilities.stop_listeners(
                 trade.mouse_listener,
                 trade.keyboard_listener,
@@ -634,7 +1231,13 @@ def on_exit(trade, config):
     # Ensure the config is written on normal interpreter shutdown, since
     # 'IndicatorThread.stop()' or 'IndicatorThread.on_closing()' may not run if
     # the main thread terminates abruptly.
-    configuration.write_config(config, trade.config_path, is_encrypted=True)
+    if trade.state_store:
+        trade.state_store.close()
+    # Write the config only if it has been edited.
+    if get_config_digest(config) != trade.config_digest:
+        configuration.write_config(
+            config, trade.config_path, is_encrypted=True
+        )
 
 
 # CLI and Configuration
@@ -655,6 +1258,13 @@ def get_arguments():
     parser.add_argument(
         "-r", action="store_true", help="save the customer margin ratios"
     )
+    parser.add_argument(
+        "-b",
+        nargs="+",
+        help="save the share sizes of the symbols or the symbols on the"
+        " clipboard at the utilization ratios",
+        metavar=("CASH_BALANCE", "SYMBOL"),
+    )
     parser.add_argument("-s", action="store_true", help="start the scheduler")
     parser.add_argument(
         "-l",
@@ -664,6 +1274,18 @@ def get_arguments():
     parser.add_argument(
         "-a", nargs=1, help="execute an action", metavar="ACTION"
     )
+    parser.add_argument(
+        "-d",
+        action="store_true",
+        help="start a resident daemon that owns the listeners and the"
+        " scheduler, reloads the configuration when it changes, and executes"
+        " actions sent by -a",
+    )
+    parser.add_argument(
+        "-t",
+        action="store_true",
+        help="trace the execution of actions and save a Chrome trace on exit",
+    )
 
     file_utilities.add_launcher_options(group)
     group.add_argument(
@@ -722,7 +1344,21 @@ def get_arguments():
         "-C", action="store_true", help="check configuration changes and exit"
     )
 
-    return parser.parse_args(None if sys.argv[1:] else ["-h"])
+    args = parser.parse_args(None if sys.argv[1:] else ["-h"])
+    if args.b:
+        try:
+            args.b[0] = _parse_cash_balance(args.b[0])
+        except ValueError:
+            parser.error(f"argument -b: invalid CASH_BALANCE: '{args.b[0]}'")
+    return args
+
+
+def _parse_cash_balance(value):
+    """Return a positive cash balance that may have thousands separators."""
+    cash_balance = int(value.replace(",", ""))
+    if cash_balance <= 0:
+        raise ValueError(value)
+    return cash_balance
 
 
 def configure(trade, can_interpolate=True, can_override=True):
@@ -734,8 +1370,58 @@ def configure(trade, can_interpolate=True, can_override=True):
     else:
         config = configparser.ConfigParser(interpolation=None)
 
+    # Both views are built from the same raw sections, so the encrypted file
+    # is decrypted and the defaults are built only once per process.
+    if can_override:
+        config.read_dict(_load_config_sections(trade))
+    else:
+        config.read_dict(_get_default_sections(trade))
+
+    _apply_theme(trade, config)
+    return config
+
+
+def _load_config_sections(trade):
+    """Return the raw sections of the defaults overridden by the file."""
+    snapshot_key = _get_config_snapshot_key(trade)
+    if trade.config_sections and trade.config_sections[0] == snapshot_key:
+        return trade.config_sections[1]
+
+    snapshot = _load_config_snapshot(trade, snapshot_key)
+    if snapshot:
+        trade.executable = snapshot["executable"]
+        sections = snapshot["sections"]
+    else:
+        config = configparser.ConfigParser(interpolation=None)
+        config.read_dict(_get_default_sections(trade))
+        configuration.read_config(config, trade.config_path, is_encrypted=True)
+        sections = _get_raw_sections(config)
+        if config["General"].getboolean("is_config_snapshot_enabled"):
+            _save_config_snapshot(trade, sections, snapshot_key)
+        elif os.path.exists(trade.config_snapshot):
+            os.remove(trade.config_snapshot)
+
+    trade.config_sections = (snapshot_key, sections)
+    return sections
+
+
+def _get_raw_sections(config):
+    """Return the uninterpolated options of every section."""
+    return {
+        section: dict(config.items(section, raw=True))
+        for section in config.sections()
+    }
+
+
+def _get_default_sections(trade):
+    """Return the raw sections of the default configuration."""
+    if trade.default_sections:
+        return trade.default_sections
+
+    config = configparser.ConfigParser(interpolation=None)
     config["General"] = {
         "fingerprint": "",
+        "is_config_snapshot_enabled": "False",
         "voice_name": "Microsoft Zira Desktop",
         "speech_rate": "2",
         "countdown_seconds_before_candle_close": "30, 10, 5",
@@ -762,6 +1448,9 @@ def configure(trade, can_interpolate=True, can_override=True):
             "Downloads",
             "rankings.csv",
         ).replace("\\", "\\\\"),
+        "history_compaction_days": "7",
+        "history_retention_days": "400",
+        "price_limit_bands": str(PRICE_LIMIT_BANDS),
     }
     config[trade.geometries_section] = {
         "cash_balance_region": "0, 0, 0, 0, 0",
@@ -856,11 +1545,6 @@ def configure(trade, can_interpolate=True, can_override=True):
         ],
     }
     config[trade.schedules_section] = {}
-    config[trade.variables_section] = {
-        "current_date": date.min.strftime("%Y-%m-%d"),
-        "initial_cash_balance": "0",
-        "current_number_of_trades": "0",
-    }
 
     if trade.vendor == "SBI Securities":
         config[trade.customer_margin_ratios_section] = {
@@ -879,40 +1563,7 @@ def configure(trade, can_interpolate=True, can_override=True):
         }
 
     if trade.process == "HYPERSBI2":
-        if not trade.executable:
-            location_dat = os.path.join(
-                os.path.expandvars("%LOCALAPPDATA%"),
-                trade.vendor,
-                trade.process,
-                "location.dat",
-            )
-            try:
-                with open(location_dat, encoding="utf-8") as f:
-                    trade.executable = os.path.normpath(
-                        os.path.join(f.read(), trade.process + ".exe")
-                    )
-            except OSError as e:
-                print(e)
-                for program_files in ("%ProgramFiles%", "%ProgramFiles(x86)%"):
-                    executable = os.path.join(
-                        os.path.expandvars(program_files),
-                        trade.vendor,
-                        trade.process,
-                        trade.process + ".exe",
-                    )
-                    if os.path.isfile(executable):
-                        trade.executable = executable
-                        break
-                if not trade.executable:
-                    print(
-                        f"The executable file for {trade.process}"
-                        " does not exist."
-                    )
-                    sys.exit(1)
-
-        file_description = file_utilities.get_file_description(
-            trade.executable
-        )
+        file_description = _get_file_description(trade)
         title = (
             data_utilities.title_except_acronyms(file_description, ["SBI"])
             + " Assistant"
@@ -989,11 +1640,20 @@ def configure(trade, can_interpolate=True, can_override=True):
                 "f12": "",
             },
             "utilization_ratio": "1.0",
+            "share_size_utilization_ratios": "(0.25, 0.5, 0.75, 1.0)",
             "daily_loss_limit_ratio": "-0.01",
             "maximum_daily_number_of_trades": "0",
             "image_magnification": "2",
             "binarization_threshold": "128",
             "is_dark_theme": "True",
+            "number_of_action_workers": "4",
+            "action_overlap_policy": "drop",
+            "action_overlap_policies": {},
+            "coalescing_window": "0.5",
+            "action_runtime": "threads",
+            "input_queue_size": "256",
+            "is_parallel_execution_enabled": "False",
+            "number_of_instruction_workers": "4",
             "screencast_directory": os.path.join(
                 os.path.expanduser("~"), "Videos", trade.process.title()
             ),
@@ -1019,21 +1679,51 @@ def configure(trade, can_interpolate=True, can_override=True):
             [("show_hide_window", "${HYPERSBI2 Window Titles:watchlists}")]
         )
 
-    if can_override:
-        configuration.read_config(config, trade.config_path, is_encrypted=True)
+    trade.default_sections = _get_raw_sections(config)
+    return trade.default_sections
 
-    current_date = date.today()
-    if (
-        date.fromisoformat(config[trade.variables_section]["current_date"])
-        != current_date
-    ):
-        config[trade.variables_section]["current_date"] = str(current_date)
-        config[trade.variables_section]["initial_cash_balance"] = "0"
-        config[trade.variables_section]["current_number_of_trades"] = "0"
 
-    if trade.process == "HYPERSBI2":
-        theme_config = configparser.ConfigParser(interpolation=None)
-        theme_config.read(
+def _get_file_description(trade):
+    """Find the executable unless it is known and return its description."""
+    if not trade.executable:
+        location_dat = os.path.join(
+            os.path.expandvars("%LOCALAPPDATA%"),
+            trade.vendor,
+            trade.process,
+            "location.dat",
+        )
+        try:
+            with open(location_dat, encoding="utf-8") as f:
+                trade.executable = os.path.normpath(
+                    os.path.join(f.read(), trade.process + ".exe")
+                )
+        except OSError as e:
+            print(e)
+            for program_files in ("%ProgramFiles%", "%ProgramFiles(x86)%"):
+                executable = os.path.join(
+                    os.path.expandvars(program_files),
+                    trade.vendor,
+                    trade.process,
+                    trade.process + ".exe",
+                )
+                if os.path.isfile(executable):
+                    trade.executable = executable
+                    break
+            if not trade.executable:
+                print(
+                    f"The executable file for {trade.process}"
+                    " does not exist."
+                )
+                sys.exit(1)
+
+    return file_utilities.get_file_description(trade.executable)
+
+
+def _apply_theme(trade, config):
+    """Match the theme option to the theme of the trading software."""
+    if (
+        trade.process == "HYPERSBI2"
+        and _get_theme(
             os.path.join(
                 os.path.expandvars("%APPDATA%"),
                 trade.vendor,
@@ -1041,13 +1731,236 @@ def configure(trade, can_interpolate=True, can_override=True):
                 "theme.ini",
             )
         )
-        if (
-            theme_config.has_option("General", "theme")
-            and theme_config["General"]["theme"] == "Light"
-        ):
-            config[trade.process]["is_dark_theme"] = "False"
+        == "Light"
+    ):
+        config[trade.process]["is_dark_theme"] = "False"
 
-    return config
+
+@functools.cache
+def _get_theme(path):
+    """Return the theme in the settings of the trading software."""
+    theme_config = configparser.ConfigParser(interpolation=None)
+    theme_config.read(path)
+    return theme_config.get("General", "theme", fallback=None)
+
+
+def _get_config_snapshot_key(trade):
+    """Return what a config snapshot depends on, or None without a file."""
+    try:
+        status = os.stat(trade.config_path)
+        with open(trade.config_path, "rb") as f:
+            config_digest = hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+    # The defaults in this script are part of the snapshot too.
+    return (
+        status.st_mtime_ns,
+        status.st_size,
+        config_digest,
+        _get_script_digest(),
+    )
+
+
+@functools.cache
+def _get_script_digest():
+    """Return the digest of this script."""
+    with open(__file__, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _load_config_snapshot(trade, snapshot_key):
+    """Return the snapshot saved for the key or None if it is stale."""
+    if snapshot_key is None:
+        return None
+    try:
+        snapshot = marshal.loads(_read_private_file(trade.config_snapshot))
+    except (OSError, EOFError, TypeError, ValueError):
+        return None
+    if snapshot.get("key") != snapshot_key:
+        return None
+    return snapshot
+
+
+def _save_config_snapshot(trade, sections, snapshot_key):
+    """Save the decrypted config so that it can be loaded without GnuPG."""
+    if snapshot_key is None:
+        return
+
+    _write_private_file(
+        trade.config_snapshot,
+        marshal.dumps(
+            {
+                "key": snapshot_key,
+                "executable": trade.executable,
+                "sections": sections,
+            }
+        ),
+    )
+
+
+def _write_private_file(path, data):
+    """Write data that only the current user can read."""
+    # Mode bits do not restrict access on Windows, so the data is encrypted
+    # for the user with DPAPI there.
+    if sys.platform == "win32":
+        data = win32crypt.CryptProtectData(data, None, None, None, None, 0)
+
+    # '_replace_file()' creates the file with mode 0o600.
+    _replace_file(path, data)
+
+
+def _read_private_file(path):
+    """Return the data written by '_write_private_file()'."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if sys.platform == "win32":
+        try:
+            data = win32crypt.CryptUnprotectData(data, None, None, None, 0)[1]
+        except pywintypes.error as e:
+            raise ValueError(f"{path} cannot be decrypted: {e}") from e
+    return data
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class GeneralSettings:
+    """Hold the typed options of the General section."""
+
+    voice_name: str
+    speech_rate: int
+    countdown_seconds: tuple
+
+    @classmethod
+    def from_section(cls, section):
+        """Construct a GeneralSettings from the section."""
+        return cls(
+            voice_name=section["voice_name"],
+            speech_rate=int(section["speech_rate"]),
+            countdown_seconds=tuple(
+                int(seconds.strip())
+                for seconds in section[
+                    "countdown_seconds_before_candle_close"
+                ].split(",")
+            ),
+        )
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class ProcessSettings:
+    """Hold the typed options of the process section read by handlers."""
+
+    title: str
+    utilization_ratio: float
+    share_size_utilization_ratios: tuple[float, ...]
+    daily_loss_limit_ratio: float
+    maximum_daily_number_of_trades: int
+    image_magnification: int
+    binarization_threshold: int
+    is_dark_theme: bool
+    screencast_directory: str
+    screencast_regex: str
+
+    @classmethod
+    def from_section(cls, section):
+        """Construct a ProcessSettings from the section."""
+        return cls(
+            title=section["title"],
+            utilization_ratio=float(section["utilization_ratio"]),
+            share_size_utilization_ratios=tuple(
+                map(
+                    float,
+                    configuration.evaluate_value(
+                        section["share_size_utilization_ratios"]
+                    ),
+                )
+            ),
+            daily_loss_limit_ratio=float(section["daily_loss_limit_ratio"]),
+            maximum_daily_number_of_trades=int(
+                section["maximum_daily_number_of_trades"]
+            ),
+            image_magnification=int(section["image_magnification"]),
+            binarization_threshold=int(section["binarization_threshold"]),
+            is_dark_theme=section.getboolean("is_dark_theme"),
+            screencast_directory=section["screencast_directory"],
+            screencast_regex=section["screencast_regex"],
+        )
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class WidgetSettings:
+    """Hold the typed options of the widgets section."""
+
+    is_clock_label_enabled: bool
+    clock_label_position: str
+    clock_label_font_size: int
+    status_bar_frame_position: str
+    status_bar_frame_font_size: int
+    message_font_size: int
+
+    @classmethod
+    def from_section(cls, section):
+        """Construct a WidgetSettings from the section."""
+        return cls(
+            is_clock_label_enabled=section.getboolean(
+                "is_clock_label_enabled"
+            ),
+            clock_label_position=section["clock_label_position"],
+            clock_label_font_size=int(section["clock_label_font_size"]),
+            status_bar_frame_position=section["status_bar_frame_position"],
+            status_bar_frame_font_size=int(
+                section["status_bar_frame_font_size"]
+            ),
+            message_font_size=int(section["message_font_size"]),
+        )
+
+
+class Settings:
+    """Hold typed settings so that hot paths skip interpolation."""
+
+    def __init__(self, trade, config):
+        """Construct a new Settings object that reads the config lazily."""
+        self._trade = trade
+        self._config = config
+
+    # Each group is read on first use, as the commands that use its options
+    # did, so a section without them fails only in those commands.
+    @functools.cached_property
+    def general(self):
+        """Return the settings of the General section or None."""
+        return self._get_group(GeneralSettings, "General")
+
+    @functools.cached_property
+    def process(self):
+        """Return the settings of the process section or None."""
+        return self._get_group(ProcessSettings, self._trade.process)
+
+    @functools.cached_property
+    def widgets(self):
+        """Return the settings of the widgets section or None."""
+        return self._get_group(WidgetSettings, self._trade.widgets_section)
+
+    @classmethod
+    def from_config(cls, trade, config):
+        """Construct a Settings from the config."""
+        return cls(trade, config)
+
+    def _get_group(self, settings_class, section):
+        """Return the settings of the section if it exists."""
+        if not self._config.has_section(section):
+            return None
+        return settings_class.from_section(self._config[section])
+
+
+def get_settings(trade, config):
+    """Return the published settings, publishing them on first use."""
+    return trade.settings or publish_settings(trade, config)
+
+
+def publish_settings(trade, config):
+    """Replace the published settings with those built from the config."""
+    # Readers see either the previous or the new object because the
+    # assignment replaces a single reference.
+    trade.settings = Settings.from_config(trade, config)
+    return trade.settings
 
 
 def configure_exit(args, trade):
@@ -1234,6 +2147,7 @@ def configure_exit(args, trade):
                 ),
             )
 
+        check_actions(trade, config)
         create_completion(trade, config)
         sys.exit()
     if args.D:
@@ -1386,56 +2300,590 @@ def save_customer_margin_ratios(trade, config):
 
 
 def save_market_data(trade, config):
-    """Split the rankings CSV by the first digit of the securities code."""
+    """Save the rankings CSV as a dense table and a history snapshot."""
     rankings = config["Market Data"]["rankings"].replace("\\\\", "\\")
-    data_by_digit = defaultdict(list)
-
+    closing_prices = np.zeros(NUMBER_OF_SECURITIES_CODE_KEYS)
     try:
-        with open(rankings, "r", encoding="utf-8") as f:
-            reader = csv.reader(f)
-            for row in reader:
-                securities_code = row[6].strip()
-                if not re.fullmatch(SECURITIES_CODE_REGEX, securities_code):
-                    continue
-                data_by_digit[securities_code[0]].append(
-                    (securities_code, row[9].strip().replace(",", ""))
-                )
-    except OSError as e:
-        print(e)
+        source_status = os.stat(rankings)
+        column_names, skip_rows = _get_rankings_columns(rankings)
+        if not column_names:
+            # An empty export publishes an empty table as the row loop did.
+            batches = ()
+        elif "closing_price" not in column_names:
+            print(f"{rankings} does not have the columns of the rankings.")
+            return False
+        else:
+            # Only the codes and the prices are needed to publish the table.
+            batches = _open_rankings(
+                rankings,
+                column_names,
+                skip_rows,
+                include_columns=["securities_code", "closing_price"],
+            )
+        for batch in batches:
+            batch = _filter_rankings(batch)
+            closing_prices[
+                encode_securities_codes(batch["securities_code"])
+            ] = batch["closing_price"].to_numpy()
+    except (OSError, pa.ArrowInvalid) as e:
+        print(e)
         return False
 
-    for digit in range(1, 10):
-        digit_string = str(digit)
-        try:
-            with open(
-                f"{trade.closing_prices}{digit}.csv",
-                "w",
-                encoding="utf-8",
-                # 'csv.writer()' on Windows writes '\r\n' itself; without
-                # 'newline=""', 'open()' would translate '\n' to '\r\n',
-                # producing '\r\r\n' (seen as '^M') and causing extra blank
-                # lines.
-                newline="",
-            ) as f:
-                writer = csv.writer(f)
-                if digit_string in data_by_digit:
-                    for securities_code, current_price in data_by_digit[
-                        digit_string
-                    ]:
-                        writer.writerow([securities_code, current_price])
-        except OSError as e:
-            print(e)
-            return False
+    if not _write_market_data_table(trade, config, closing_prices):
+        return False
 
-    if os.path.isfile(rankings):
-        try:
+    # Orders only need the table, so the snapshot is saved in the background.
+    _market_history_executor.submit(
+        _append_market_history,
+        trade,
+        config,
+        rankings,
+        source_status,
+        date.today(),
+    )
+    return True
+
+
+_market_history_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=1, thread_name_prefix="market_history"
+)
+
+
+def flush_market_history():
+    """Wait until the snapshots submitted so far are saved."""
+    _market_history_executor.submit(lambda: None).result()
+
+
+def _append_market_history(trade, config, rankings, source_status, today):
+    """Save the rankings as a snapshot and then remove the rankings CSV."""
+    partition = os.path.join(trade.market_history, f"date={today}")
+    snapshot_name = f"{time.time_ns()}.parquet"
+    snapshot = os.path.join(partition, snapshot_name)
+    # Dataset discovery skips files whose names start with a dot.
+    temporary_snapshot = os.path.join(partition, f".{snapshot_name}.tmp")
+    writer = None
+    try:
+        column_names, skip_rows = _get_rankings_columns(rankings)
+        # An empty export has no snapshot to save.
+        for batch in (
+            _open_rankings(rankings, column_names, skip_rows)
+            if column_names
+            else ()
+        ):
+            batch = _filter_rankings(batch)
+            if writer is None:
+                os.makedirs(partition, exist_ok=True)
+                writer = pa_parquet.ParquetWriter(
+                    temporary_snapshot, batch.schema, compression="zstd"
+                )
+            writer.write_batch(batch)
+        if writer:
+            writer.close()
+            os.replace(temporary_snapshot, snapshot)
+    except (OSError, pa.ArrowInvalid) as e:
+        print(e)
+        if writer:
+            writer.close()
+        if os.path.exists(temporary_snapshot):
+            os.remove(temporary_snapshot)
+        return False
+
+    compact_market_history(trade, config, today)
+    # Keep a newer export that has replaced the one saved.
+    try:
+        status = os.stat(rankings)
+        if (status.st_ino, status.st_mtime_ns, status.st_size) == (
+            source_status.st_ino,
+            source_status.st_mtime_ns,
+            source_status.st_size,
+        ):
             os.remove(rankings)
-        except OSError as e:
-            print(e)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(e)
+    return True
+
+
+def _open_rankings(rankings, column_names, skip_rows, include_columns=None):
+    """Return a reader of the rankings CSV in blocks of string columns."""
+    # Reading the export in blocks keeps memory use independent of its size.
+    return pa_csv.open_csv(
+        rankings,
+        read_options=pa_csv.ReadOptions(
+            column_names=column_names,
+            skip_rows=skip_rows,
+            block_size=RANKINGS_BLOCK_SIZE,
+        ),
+        parse_options=pa_csv.ParseOptions(
+            invalid_row_handler=lambda row: "skip"
+        ),
+        convert_options=pa_csv.ConvertOptions(
+            column_types=dict.fromkeys(column_names, pa.string()),
+            include_columns=include_columns,
+        ),
+    )
+
+
+def _get_rankings_columns(rankings):
+    """Return the column names of the rankings CSV and the rows to skip."""
+    with open(rankings, encoding="utf-8", newline="") as f:
+        row = next(csv.reader(f), [])
+
+    # Use the header only if it names every column distinctly.
+    if (
+        len(row) > 9
+        and not re.fullmatch(SECURITIES_CODE_REGEX, row[6].strip())
+        and all(row)
+        and len(set(row)) == len(row)
+    ):
+        column_names, skip_rows = list(row), 1
+    else:
+        column_names, skip_rows = [f"f{i}" for i in range(len(row))], 0
+    # The code and the price are always the 7th and the 10th columns.
+    if len(column_names) > 9:
+        column_names[6] = "securities_code"
+        column_names[9] = "closing_price"
+    return column_names, skip_rows
+
+
+def _filter_rankings(batch):
+    """Return the rows with valid codes and prices as numbers."""
+    securities_codes = pa_compute.utf8_trim_whitespace(
+        batch.column("securities_code")
+    )
+    closing_prices = pa_compute.replace_substring(
+        pa_compute.utf8_trim_whitespace(batch.column("closing_price")), ",", ""
+    )
+    # Issues without a trade have no current price.
+    mask = pa_compute.and_(
+        pa_compute.match_substring_regex(
+            securities_codes, f"^(?:{SECURITIES_CODE_REGEX})$"
+        ),
+        pa_compute.match_substring_regex(closing_prices, r"^\d+(?:\.\d+)?$"),
+    )
+    columns = dict(zip(batch.schema.names, batch.columns))
+    columns["securities_code"] = securities_codes
+    columns["closing_price"] = closing_prices
+    columns = {
+        name: pa_compute.filter(column, mask)
+        for name, column in columns.items()
+    }
+    columns["closing_price"] = pa_compute.cast(
+        columns["closing_price"], pa.float64()
+    )
+    return pa.RecordBatch.from_pydict(columns)
+
+
+def write_closing_prices(trade, config, closing_prices):
+    """Write closing prices keyed by securities code to the table."""
+    table = np.zeros(NUMBER_OF_SECURITIES_CODE_KEYS)
+    for securities_code, closing_price in closing_prices.items():
+        table[encode_securities_code(securities_code)] = closing_price
+    return _write_market_data_table(trade, config, table)
 
+
+def _write_market_data_table(trade, config, closing_prices):
+    """Write the closing prices with the price limits derived from them."""
+    table = np.zeros((len(closing_prices), 2))
+    table[:, 0] = closing_prices
+    try:
+        table[:, 1] = get_price_limits(config, closing_prices)
+    except configuration.ConfigError as e:
+        print(e)
+        return False
+    return _write_closing_price_table(trade, memoryview(table).cast("B"))
+
+
+def get_price_limits(config, closing_prices):
+    """Return the price limits of the closing prices from their bands."""
+    maximum_prices, limits = _parse_price_limit_bands(
+        config["Market Data"]["price_limit_bands"]
+    )
+    # Most codes are unassigned, so only the traded ones are looked up.
+    # Missing prices stay 0.0, which 'get_price_limit()' treats as unknown.
+    traded = np.flatnonzero(closing_prices > 0)
+    price_limits = np.zeros(len(closing_prices))
+    price_limits[traded] = (
+        closing_prices[traded]
+        + limits[
+            np.minimum(
+                np.searchsorted(
+                    maximum_prices, closing_prices[traded], side="right"
+                ),
+                len(limits) - 1,
+            )
+        ]
+    )
+    return price_limits
+
+
+@functools.cache
+def _parse_price_limit_bands(value):
+    """Return the maximum prices and the limits of the bands as arrays."""
+    bands = configuration.evaluate_value(value)
+    if not (
+        isinstance(bands, (list, tuple))
+        and bands
+        and all(
+            isinstance(band, (list, tuple)) and len(band) == 2
+            for band in bands
+        )
+    ):
+        raise configuration.ConfigError(
+            f"'price_limit_bands': '{value}' is not a sequence of pairs of"
+            " a maximum price and a limit."
+        )
+
+    maximum_prices, limits = zip(*bands)
+    if not all(
+        isinstance(price, (int, float)) for price in maximum_prices[:-1]
+    ) or not (
+        maximum_prices[-1] is None
+        or isinstance(maximum_prices[-1], (int, float))
+    ):
+        raise configuration.ConfigError(
+            "'price_limit_bands': Only the last maximum price can be None,"
+            " and the others must be numbers."
+        )
+    if not all(isinstance(limit, (int, float)) for limit in limits):
+        raise configuration.ConfigError(
+            "'price_limit_bands': The limits must be numbers."
+        )
+
+    maximum_prices = np.array(
+        [np.inf if price is None else price for price in maximum_prices],
+        dtype=float,
+    )
+    if np.any(np.diff(maximum_prices) <= 0):
+        raise configuration.ConfigError(
+            "'price_limit_bands': The maximum prices must be ascending."
+        )
+    return maximum_prices, np.array(limits, dtype=float)
+
+
+def _write_closing_price_table(trade, data):
+    """Publish the data as a new generation of the closing price table."""
+    directory, base = os.path.split(trade.closing_prices)
+    generation = f"{base}_{time.time_ns()}.bin"
+    try:
+        _replace_file(os.path.join(directory, generation), data)
+        # Readers follow the pointer, so they map either the previous or the
+        # new generation and never a partially written table.
+        _replace_file(trade.closing_prices, generation.encode())
+    except OSError as e:
+        print(e)
+        return False
+
+    # Keep the previous generation for readers that have just followed the
+    # old pointer.  Another process may still map an older one on Windows.
+    generations = sorted(
+        entry
+        for entry in os.listdir(directory)
+        if re.fullmatch(rf"{re.escape(base)}_\d+\.bin", entry)
+    )
+    for entry in generations[:-2]:
+        try:
+            os.remove(os.path.join(directory, entry))
+        except OSError:
+            pass
     return True
 
 
+def get_closing_price(trade, securities_code):
+    """Return the saved closing price of a securities code or 0.0."""
+    return _get_market_data(trade, securities_code)[0]
+
+
+def get_saved_price_limit(trade, securities_code):
+    """Return the price limit derived from the closing price or 0.0."""
+    return _get_market_data(trade, securities_code)[1]
+
+
+def _get_market_data(trade, securities_code):
+    """Return the closing price and the price limit of a code."""
+    if not re.fullmatch(SECURITIES_CODE_REGEX, securities_code):
+        return 0.0, 0.0
+
+    table = _get_closing_price_table(trade.closing_prices)
+    if table is None:
+        return 0.0, 0.0
+    try:
+        return MARKET_DATA_ROW.unpack_from(
+            table,
+            MARKET_DATA_ROW.size * encode_securities_code(securities_code),
+        )
+    except ValueError:
+        # Another thread closed the mapping when it published a generation.
+        return _get_market_data(trade, securities_code)
+
+
+def encode_securities_code(securities_code):
+    """Return the dense key of a code that matches the regex."""
+    key = int(securities_code[0]) - 1
+    key = key * 29 + SECURITIES_CODE_CHARACTERS.index(securities_code[1])
+    key = key * 10 + int(securities_code[2])
+    key = key * 29 + SECURITIES_CODE_CHARACTERS.index(securities_code[3])
+    return key * 2 + (len(securities_code) == 5)
+
+
+def encode_securities_codes(securities_codes):
+    """Return the dense keys of an Arrow array of matching codes."""
+    # Codes shorter than five characters are padded with null bytes.
+    characters = (
+        securities_codes.to_numpy(zero_copy_only=False)
+        .astype("S5")
+        .view(np.uint8)
+        .reshape(-1, 5)
+        .astype(np.int64)
+    )
+    indexes = np.zeros(256, dtype=np.int64)
+    indexes[list(SECURITIES_CODE_CHARACTERS.encode())] = np.arange(
+        len(SECURITIES_CODE_CHARACTERS)
+    )
+    keys = characters[:, 0] - ord("1")
+    keys = keys * 29 + indexes[characters[:, 1]]
+    keys = keys * 10 + characters[:, 2] - ord("0")
+    keys = keys * 29 + indexes[characters[:, 3]]
+    return keys * 2 + (characters[:, 4] == ord("5"))
+
+
+_closing_price_tables = {}
+
+
+def _get_closing_price_table(path):
+    """Map the current generation, following the pointer when it changes."""
+    try:
+        status = os.stat(path)
+    except OSError as e:
+        print(e)
+        return None
+
+    file_key = (status.st_ino, status.st_mtime_ns, status.st_size)
+    cached = _closing_price_tables.get(path)
+    if cached and cached[0] == file_key:
+        return cached[1]
+
+    try:
+        with open(path, encoding="utf-8") as f:
+            generation = os.path.join(os.path.dirname(path), f.read().strip())
+        with open(generation, "rb") as f:
+            if (
+                os.fstat(f.fileno()).st_size
+                != MARKET_DATA_ROW.size * NUMBER_OF_SECURITIES_CODE_KEYS
+            ):
+                print(f"{generation} is not a closing price table.")
+                return None
+            # Processes that map the same file share its pages.
+            table = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except OSError as e:
+        print(e)
+        return None
+
+    _closing_price_tables[path] = (file_key, table)
+    if cached:
+        try:
+            # Windows cannot delete an old generation while it is mapped.
+            cached[1].close()
+        except BufferError:
+            # An exported view keeps it mapped until the view is released.
+            pass
+    return table
+
+
+def compact_market_history(trade, config, today):
+    """Drop superseded and expired snapshots from the market history."""
+    section = config["Market Data"]
+    compaction_days = int(section["history_compaction_days"])
+    retention_days = int(section["history_retention_days"])
+    try:
+        sessions = _get_history_sessions(trade)
+    except (OSError, pa.ArrowInvalid) as e:
+        print(e)
+        return
+
+    for session_date, snapshots in sessions.items():
+        age = (today - session_date).days
+        if age > retention_days:
+            shutil.rmtree(os.path.dirname(snapshots[0]), ignore_errors=True)
+        elif age > compaction_days:
+            # Only the last snapshot of a session is read after compaction.
+            for snapshot in snapshots[:-1]:
+                try:
+                    os.remove(snapshot)
+                except OSError as e:
+                    print(e)
+
+
+def restore_market_data(trade, config):
+    """Rebuild an unreadable table from the previous session's snapshot."""
+    if _get_closing_price_table(trade.closing_prices) is not None:
+        return False
+
+    today = date.today()
+    previous_session = get_previous_trading_day(
+        today,
+        trade.market_holidays,
+        config["Market Holidays"]["date_format"],
+    )
+    # A snapshot saved after the previous close and before today's open
+    # holds the closes of the previous session.  Older closes may belong to
+    # halted issues, so their limits are recognized on screen instead.
+    table = _read_market_history(
+        trade,
+        ["securities_code", "closing_price"],
+        pa_dataset.field("date") >= previous_session,
+        as_of=today,
+        number_of_sessions=1,
+    )
+    if not table:
+        return False
+
+    closing_prices = np.zeros(NUMBER_OF_SECURITIES_CODE_KEYS)
+    closing_prices[
+        encode_securities_codes(table["securities_code"].combine_chunks())
+    ] = table["closing_price"].to_numpy()
+    return _write_market_data_table(trade, config, closing_prices)
+
+
+def get_previous_trading_day(today, market_holidays, date_format):
+    """Return the last trading day before a date."""
+    try:
+        market_holidays = set(
+            pd.read_csv(market_holidays, header=None, dtype=str)[0]
+        )
+    except (OSError, pd.errors.EmptyDataError):
+        market_holidays = set()
+
+    previous_day = today - timedelta(days=1)
+    while (
+        previous_day.weekday() >= 5
+        or previous_day.strftime(date_format) in market_holidays
+    ):
+        previous_day -= timedelta(days=1)
+    return previous_day
+
+
+def get_previous_close(trade, securities_code, as_of):
+    """Return the latest close saved on or before a date or None."""
+    table = _read_market_history(
+        trade,
+        ["date", "closing_price"],
+        pa_dataset.field("securities_code") == securities_code,
+        as_of=as_of,
+    )
+    if not table:
+        return None
+    return table.sort_by([("date", "descending")])["closing_price"][0].as_py()
+
+
+def get_closing_history(
+    trade, number_of_sessions, as_of=None, securities_codes=None
+):
+    """Return the closes of the last sessions on or before a date."""
+    columns = ["securities_code", "closing_price", "date"]
+    table = _read_market_history(
+        trade,
+        columns,
+        (
+            pa_dataset.field("securities_code").isin(list(securities_codes))
+            if securities_codes is not None
+            else None
+        ),
+        as_of=as_of,
+        number_of_sessions=number_of_sessions,
+    )
+    if not table:
+        return pd.DataFrame(columns=columns)
+    return table.sort_by([("date", "ascending")]).to_pandas()
+
+
+def _read_market_history(
+    trade, columns, filter=None, as_of=None, number_of_sessions=None
+):
+    """Scan the last snapshot of each session and return a table or None."""
+    try:
+        sessions = _get_history_sessions(trade, as_of)
+    except (OSError, pa.ArrowInvalid) as e:
+        print(e)
+        return None
+
+    sessions = list(sessions.values())
+    if number_of_sessions is not None:
+        sessions = sessions[max(len(sessions) - number_of_sessions, 0) :]
+    if not sessions:
+        return None
+    try:
+        return _scan_snapshots(
+            trade, [snapshots[-1] for snapshots in sessions], columns, filter
+        )
+    except (OSError, pa.ArrowInvalid) as e:
+        print(e)
+
+    # Fall back on the newest readable snapshot of each session.
+    tables = []
+    for snapshots in sessions:
+        for snapshot in reversed(snapshots):
+            try:
+                tables.append(
+                    _scan_snapshots(trade, [snapshot], columns, filter)
+                )
+                break
+            except (OSError, pa.ArrowInvalid):
+                print(f"{snapshot} is not a readable snapshot.")
+    return pa.concat_tables(tables) if tables else None
+
+
+def _scan_snapshots(trade, snapshots, columns, filter):
+    """Return the projected rows of the snapshots that match the filter."""
+    return pa_dataset.dataset(
+        snapshots,
+        format="parquet",
+        partitioning=_get_history_partitioning(),
+        partition_base_dir=trade.market_history,
+    ).to_table(columns=columns, filter=filter)
+
+
+def _get_history_sessions(trade, as_of=None):
+    """Return the snapshots of each session from oldest to newest."""
+    if not os.path.isdir(trade.market_history):
+        return {}
+
+    # Only the partitions up to the date are listed, so the cost does not
+    # grow with the snapshots saved after it.
+    sessions = {}
+    with os.scandir(trade.market_history) as partitions:
+        for partition in partitions:
+            key, _, value = partition.name.partition("=")
+            if key != "date" or not partition.is_dir():
+                continue
+            try:
+                session_date = date.fromisoformat(value)
+            except ValueError:
+                continue
+            if as_of is not None and session_date > as_of:
+                continue
+            with os.scandir(partition.path) as entries:
+                # Hidden and temporary files are skipped like in discovery.
+                snapshots = sorted(
+                    entry.path
+                    for entry in entries
+                    if entry.is_file()
+                    and not entry.name.startswith((".", "_"))
+                )
+            if snapshots:
+                sessions[session_date] = snapshots
+    return dict(sorted(sessions.items()))
+
+
+@functools.cache
+def _get_history_partitioning():
+    """Return the partitioning of the history by session date."""
+    return pa_dataset.partitioning(
+        pa.schema([("date", pa.date32())]), flavor="hive"
+    )
+
+
 def get_latest(
     config, market_holidays, update_time, timezone, *paths, volatile_time=None
 ):
@@ -1506,19 +2954,213 @@ def get_latest(
     return False
 
 
+class VariablesJournal:
+    """Journal variable changes and write them behind to a sink."""
+
+    def __init__(self, path, variables, write, coalescing_delay=1.0):
+        """Construct a new VariablesJournal object and start its writer."""
+        self.path = path
+        self.variables = variables
+        self.write = write
+        self.coalescing_delay = coalescing_delay
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+        self._is_dirty = threading.Event()
+        self._stop_event = threading.Event()
+        if self._file.tell():
+            # Fold entries replayed from a previous run into the sink.
+            self._is_dirty.set()
+        self._writer = threading.Thread(target=self._write_behind, daemon=True)
+        self._writer.start()
+
+    @staticmethod
+    def replay(path, variables):
+        """Apply the journaled changes and return their count."""
+        count = 0
+        try:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        option, value = json.loads(line)
+                    except ValueError:
+                        # A crash can leave the last entry incomplete.
+                        break
+                    variables[option] = value
+                    count += 1
+        except FileNotFoundError:
+            pass
+        return count
+
+    def set(self, option, value):
+        """Change a variable and make the change durable before returning."""
+        with self._lock:
+            self.variables[option] = value
+            self._file.write(json.dumps([option, value]) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._is_dirty.set()
+
+    def close(self):
+        """Stop the writer and write the pending changes."""
+        self._stop_event.set()
+        self._is_dirty.set()
+        self._writer.join()
+        self._write()
+        self._file.close()
+
+    def _write_behind(self):
+        """Coalesce changes into the sink until stopped."""
+        while True:
+            self._is_dirty.wait()
+            if self._stop_event.wait(self.coalescing_delay):
+                break
+
+            self._is_dirty.clear()
+            try:
+                self._write()
+            except Exception as e:
+                print(f"Unexpected error in '{self.path}': {e}")
+                self._is_dirty.set()
+
+    def _write(self):
+        """Write the variables and drop the entries that the sink has."""
+        with self._lock:
+            offset = self._file.tell()
+            variables = dict(self.variables)
+        self.write(variables)
+        with self._lock:
+            # Keep the entries journaled while the sink was being written.
+            self._file.flush()
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                remainder = f.read()
+            # Windows cannot replace a file that is still open.
+            self._file.close()
+            try:
+                _replace_file(self.path, remainder)
+            finally:
+                self._file = open(self.path, "a", encoding="utf-8")
+
+
+class StateStore:
+    """Persist the per-day trading state outside the encrypted config."""
+
+    DEFAULT_STATE = {
+        "current_date": date.min.isoformat(),
+        "initial_cash_balance": 0,
+        "current_number_of_trades": 0,
+    }
+
+    def __init__(self, path, journal_path):
+        """Construct a new StateStore object and load the saved state."""
+        self.path = path
+        self.is_new = not os.path.exists(path)
+        state = dict(StateStore.DEFAULT_STATE)
+        if not self.is_new:
+            with open(path, encoding="utf-8") as f:
+                state.update(json.load(f))
+        VariablesJournal.replay(journal_path, state)
+        self._journal = VariablesJournal(journal_path, state, self._write)
+
+    @property
+    def current_date(self):
+        """Return the date that the state belongs to."""
+        return date.fromisoformat(self._journal.variables["current_date"])
+
+    @property
+    def initial_cash_balance(self):
+        """Return the cash balance at the first check of the day."""
+        return self._journal.variables["initial_cash_balance"]
+
+    @initial_cash_balance.setter
+    def initial_cash_balance(self, value):
+        """Store the cash balance at the first check of the day."""
+        self._journal.set("initial_cash_balance", int(value))
+
+    @property
+    def current_number_of_trades(self):
+        """Return the number of trades made today."""
+        return self._journal.variables["current_number_of_trades"]
+
+    @current_number_of_trades.setter
+    def current_number_of_trades(self, value):
+        """Store the number of trades made today."""
+        self._journal.set("current_number_of_trades", int(value))
+
+    def roll_over(self, current_date):
+        """Reset the state if it belongs to a previous day."""
+        if self.current_date != current_date:
+            self._journal.set("current_date", current_date.isoformat())
+            self._journal.set("initial_cash_balance", 0)
+            self._journal.set("current_number_of_trades", 0)
+
+    def migrate(self, section):
+        """Import the state from a former variables section of the config."""
+        self._journal.set("current_date", section["current_date"])
+        self._journal.set(
+            "initial_cash_balance", int(section["initial_cash_balance"])
+        )
+        self._journal.set(
+            "current_number_of_trades",
+            int(section["current_number_of_trades"]),
+        )
+
+    def close(self):
+        """Write the pending changes."""
+        self._journal.close()
+
+    def _write(self, state):
+        """Replace the state file with the state."""
+        _replace_file(self.path, json.dumps(state, indent=2).encode())
+
+
+def _replace_file(path, data):
+    """Replace a file with the data so that readers see either version."""
+    # A unique name keeps concurrent writers from sharing a temporary file.
+    file_descriptor, temporary_path = tempfile.mkstemp(
+        dir=os.path.dirname(path) or None,
+        prefix=f"{os.path.basename(path)}.",
+        suffix=".tmp",
+    )
+    try:
+        with os.fdopen(file_descriptor, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary_path, path)
+    except BaseException:
+        try:
+            os.remove(temporary_path)
+        except OSError:
+            pass
+        raise
+
+
+def get_config_digest(config):
+    """Return a digest of the uninterpolated config."""
+    return hashlib.sha256(
+        repr(
+            [
+                (section, config.items(section, raw=True))
+                for section in config.sections()
+            ]
+        ).encode()
+    ).hexdigest()
+
+
 # Scheduling and Background Processes
 
 
-def start_scheduler(trade, config, gui_state, process, base_manager):
+def start_scheduler(
+    trade, config, gui_state, process, base_manager, stop_event=None
+):
     """Start a scheduler for executing actions at specified times."""
     should_stop_speaking_process = False
     if not trade.speaking_process:
         trade.speaking_process = _start_speaking_process(trade, config)
         should_stop_speaking_process = True
 
-    scheduler = sched.scheduler(time.time, time.sleep)
-    schedules = []
-
+    triggers = []
     section = config[trade.schedules_section]
     for option in section:
         trigger, action = configuration.evaluate_value(section[option])
@@ -1527,32 +3169,17 @@ def start_scheduler(trade, config, gui_state, process, base_manager):
         )
         trigger = time.mktime(trigger)
         if time.time() < trigger:
-            schedule = scheduler.enterabs(
-                trigger,
-                1,
-                execute_action,
-                argument=(
-                    trade,
-                    config,
-                    gui_state,
-                    config[trade.actions_section][action],
-                ),
-            )
-            schedules.append(schedule)
+            triggers.append((trigger, action))
 
     try:
-        while scheduler.queue:
-            if process_utilities.is_running(process):
-                scheduler.run(False)
-                time.sleep(
-                    max(0.0, min(scheduler.queue[0].time - time.time(), 1.0))
-                    if scheduler.queue
-                    else 1.0
-                )
-            else:
-                for schedule in schedules:
-                    if schedule in scheduler.queue:
-                        scheduler.cancel(schedule)
+        if _get_runtime_class(config, trade) is AsyncActionRuntime:
+            _run_async_schedules(
+                trade, config, gui_state, process, triggers, stop_event
+            )
+        else:
+            _run_schedules(
+                trade, config, gui_state, process, triggers, stop_event
+            )
     finally:
         if should_stop_speaking_process:
             speech_synthesis.stop_speaking_process(
@@ -1560,20 +3187,104 @@ def start_scheduler(trade, config, gui_state, process, base_manager):
             )
 
 
+def _run_schedules(
+    trade, config, gui_state, process, triggers, stop_event=None
+):
+    """Execute the scheduled actions on the scheduler thread."""
+    scheduler = sched.scheduler(time.time, time.sleep)
+    schedules = []
+    for trigger, action in triggers:
+        schedule = scheduler.enterabs(
+            trigger,
+            1,
+            execute_action,
+            argument=(
+                trade,
+                config,
+                gui_state,
+                get_compiled_action(trade, config, action),
+            ),
+        )
+        schedules.append(schedule)
+
+    while scheduler.queue:
+        if trade.backend.is_process_running(process) and not (
+            stop_event and stop_event.is_set()
+        ):
+            scheduler.run(False)
+            time.sleep(
+                max(0.0, min(scheduler.queue[0].time - time.time(), 1.0))
+                if scheduler.queue
+                else 1.0
+            )
+        else:
+            for schedule in schedules:
+                if schedule in scheduler.queue:
+                    scheduler.cancel(schedule)
+
+
+def _run_async_schedules(
+    trade, config, gui_state, process, triggers, stop_event=None
+):
+    """Submit the scheduled actions to an asyncio runtime at their times."""
+    # Queue overlapping runs as the scheduler thread does instead of applying
+    # the overlap policies of triggered actions.
+    runtime = AsyncActionRuntime(
+        trade,
+        config,
+        gui_state,
+        number_of_workers=int(
+            config[trade.process]["number_of_action_workers"]
+        ),
+        default_policy="queue",
+    )
+    futures = [
+        runtime.schedule(trigger, action) for trigger, action in triggers
+    ]
+    try:
+        # Scheduled actions run on the event loop, so this thread only
+        # watches the process.
+        while not all(future.done() for future in futures):
+            if not trade.backend.is_process_running(process) or (
+                stop_event and stop_event.is_set()
+            ):
+                for future in futures:
+                    future.cancel()
+                break
+            time.sleep(1.0)
+        while runtime.counters["queued"] or runtime.counters["running"]:
+            time.sleep(0.1)
+    finally:
+        runtime.shutdown()
+
+
 def start_listeners(
     trade, config, gui_state, base_manager, is_persistent=False
 ):
     """Initiate listeners for mouse and keyboard events."""
-    trade.mouse_listener = mouse.Listener(
-        on_click=lambda x, y, button, pressed: trade.on_click(
-            x, y, button, pressed, config, gui_state
+    for problem in compile_actions(trade, config).problems:
+        print(problem)
+    compile_input_map(trade, config)
+
+    trade.action_executor = _get_runtime_class(config, trade).from_config(
+        trade, config, gui_state
+    )
+    # The hooks only queue events so that Windows does not unhook them.
+    input_event_queue = trade.input_event_queue = InputEventQueue(
+        int(config[trade.process]["input_queue_size"])
+    )
+    trade.mouse_listener = trade.backend.create_mouse_listener(
+        lambda x, y, button, pressed: input_event_queue.put(
+            trade.on_click, x, y, button, pressed, config, gui_state
         )
     )
     trade.mouse_listener.start()
 
-    trade.keyboard_listener = keyboard.Listener(
-        on_press=lambda key: trade.on_press(key, config, gui_state),
-        on_release=lambda key: trade.on_release(key, gui_state),
+    trade.keyboard_listener = trade.backend.create_keyboard_listener(
+        lambda key: input_event_queue.put(
+            trade.on_press, key, config, gui_state
+        ),
+        lambda key: input_event_queue.put(trade.on_release, key, gui_state),
     )
     trade.keyboard_listener.start()
 
@@ -1599,81 +3310,824 @@ def start_listeners(
     trade.wait_listeners_thread.start()
 
 
+def _get_runtime_class(config, trade):
+    """Return the action runtime class selected in the process section."""
+    if config[trade.process]["action_runtime"] == "asyncio":
+        return AsyncActionRuntime
+    return ActionExecutor
+
+
 def _start_speaking_process(trade, config):
     """Start a speaking process using the configured voice settings."""
+    settings = get_settings(trade, config).general
     return speech_synthesis.start_speaking_process(
         trade.speech_manager,
-        voice_name=config["General"]["voice_name"],
-        speech_rate=int(config["General"]["speech_rate"]),
+        voice_name=settings.voice_name,
+        speech_rate=settings.speech_rate,
     )
 
 
+def start_daemon(trade, config, gui_state, base_manager):
+    """Serve actions sent by '-a' clients until interrupted."""
+    start_listeners(trade, config, gui_state, base_manager, is_persistent=True)
+    stop_event = threading.Event()
+    threading.Thread(
+        target=supervise_daemon,
+        args=(trade, config, gui_state, base_manager, stop_event),
+        daemon=True,
+    ).start()
+
+    action_server = ActionServer(trade, _create_daemon_authkey(trade))
+    try:
+        action_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_event.set()
+        action_server.close()
+        trade.input_event_queue.stop()
+        trade.action_executor.shutdown()
+        process_utilities.stop_listeners(
+            trade.mouse_listener,
+            trade.keyboard_listener,
+            base_manager,
+            trade.speech_manager,
+            trade.speaking_process,
+        )
+        trade.stop_listeners_event.set()
+        trade.wait_listeners_thread.join()
+
+
+def supervise_daemon(
+    trade, config, gui_state, base_manager, stop_event, poll_interval=1.0
+):
+    """Keep the state, the config, and the schedules of a daemon current."""
+    current_date = None
+    config_status = _get_config_status(trade)
+    scheduler_thread = scheduler_stop_event = None
+    should_arm = True
+    while True:
+        today = date.today()
+        if today != current_date:
+            current_date = today
+            trade.state_store.roll_over(today)
+            should_arm = True
+
+        status = _get_config_status(trade)
+        if status != config_status:
+            config_status = status
+            reload_config(trade, config)
+            # Stop the schedules armed from the previous config so that
+            # edited ones take effect and removed ones no longer fire.  They
+            # are armed again once the running scheduler returns.
+            if scheduler_stop_event:
+                scheduler_stop_event.set()
+            should_arm = True
+
+        # The scheduler drops the schedules once the process is not running,
+        # so arm them again when it starts and at the start of each day.
+        if not trade.backend.is_process_running(trade.process):
+            should_arm = True
+        elif should_arm and not (
+            scheduler_thread and scheduler_thread.is_alive()
+        ):
+            scheduler_stop_event = threading.Event()
+            scheduler_thread = threading.Thread(
+                target=start_scheduler,
+                args=(
+                    trade,
+                    config,
+                    gui_state,
+                    trade.process,
+                    base_manager,
+                    scheduler_stop_event,
+                ),
+                daemon=True,
+            )
+            scheduler_thread.start()
+            should_arm = False
+
+        if stop_event.wait(poll_interval):
+            break
+
+
+def _get_config_status(trade):
+    """Return the modification time and size of the config file."""
+    try:
+        status = os.stat(trade.config_path)
+    except OSError:
+        return None
+    return status.st_mtime_ns, status.st_size
+
+
+def reload_config(trade, config):
+    """Update the config in place with the sections read from the file."""
+    new_sections = _get_raw_sections(configure(trade))
+    new_sections.pop(trade.variables_section, None)
+    for section in config.sections():
+        if section not in new_sections:
+            config.remove_section(section)
+    # Update the options instead of replacing the sections so that running
+    # actions never see a section without its options.
+    for section, options in new_sections.items():
+        config.read_dict({section: options})
+        for option in set(config.options(section)) - options.keys():
+            config.remove_option(section, option)
+
+    trade.config_digest = get_config_digest(config)
+    publish_settings(trade, config)
+    for problem in compile_actions(trade, config).problems:
+        print(problem)
+    compile_input_map(trade, config)
+
+
+def send_action(trade, action):
+    """Send an action to a running daemon and return whether it replied."""
+    try:
+        authkey = _read_private_file(trade.daemon_authkey)
+        with Client(trade.daemon_address, authkey=authkey) as connection:
+            connection.send(("execute_action", action))
+            is_accepted, message = connection.recv()
+    except (AuthenticationError, EOFError, OSError, ValueError):
+        return False
+
+    if message:
+        print(message)
+    return True
+
+
+def _create_daemon_authkey(trade):
+    """Create an authentication key that only the user can read."""
+    authkey = secrets.token_bytes(32)
+    _write_private_file(trade.daemon_authkey, authkey)
+    return authkey
+
+
+class ActionServer:
+    """Accept action names from clients and submit them to the executor."""
+
+    def __init__(self, trade, authkey):
+        """Construct a new ActionServer object."""
+        self.trade = trade
+        self.authkey = authkey
+        # A socket file left by a daemon that did not exit cleanly would
+        # prevent binding the address.
+        if sys.platform != "win32" and os.path.exists(trade.daemon_address):
+            os.remove(trade.daemon_address)
+        self.listener = Listener(trade.daemon_address, authkey=authkey)
+        self._is_closed = False
+        self._is_serving = False
+        self._lock = threading.Lock()
+
+    def serve_forever(self):
+        """Handle one request per connection until the server is closed."""
+        with self._lock:
+            if self._is_closed:
+                return
+            self._is_serving = True
+        try:
+            # Keep accepting until 'close()' connects, so that its connection
+            # never waits for an 'accept()' that does not come.
+            while True:
+                try:
+                    connection = self.listener.accept()
+                except AuthenticationError as e:
+                    print(e)
+                    continue
+                except OSError:
+                    if self._is_closed:
+                        break
+                    raise
+
+                with connection:
+                    if self._is_closed:
+                        break
+                    try:
+                        request = connection.recv()
+                        connection.send(self.handle_request(request))
+                    except (EOFError, OSError):
+                        continue
+        finally:
+            with self._lock:
+                self._is_serving = False
+
+    def handle_request(self, request):
+        """Return whether the request was accepted and a message."""
+        command, *arguments = request
+        if command != "execute_action":
+            return False, f"{command} is not a recognized request."
+
+        (action,) = arguments
+        if action not in self.trade.action_graph.actions:
+            return False, f"{action} is not a configured action."
+        return (
+            self.trade.action_executor.submit(
+                action, self.trade.action_graph.actions[action]
+            ),
+            None,
+        )
+
+    def close(self):
+        """Stop serving and remove the authentication key."""
+        with self._lock:
+            if self._is_closed:
+                return
+            self._is_closed = True
+            is_serving = self._is_serving
+
+        # Closing the listener does not interrupt a blocking 'accept()', so
+        # connect once to wake it.
+        if is_serving:
+            try:
+                with Client(self.trade.daemon_address, authkey=self.authkey):
+                    pass
+            except (AuthenticationError, EOFError, OSError):
+                pass
+        self.listener.close()
+        if os.path.exists(self.trade.daemon_authkey):
+            os.remove(self.trade.daemon_authkey)
+
+
 # Action Execution Pipeline
 
 
-def start_execute_action_thread(trade, config, gui_state, action):
-    """Start a new thread to execute a specified action."""
-    execute_action_thread = threading.Thread(
-        target=execute_action,
-        args=(trade, config, gui_state, config[trade.actions_section][action]),
-    )
-    execute_action_thread.start()
+class InputEventQueue:
+    """Pass timestamped hook events to a thread that handles them."""
+
+    def __init__(self, maximum_size=256):
+        """Construct a new InputEventQueue object and start its consumer."""
+        self.maximum_size = maximum_size
+        self.dispatched = 0
+        self.dropped = 0
+        self._queue = queue.SimpleQueue()
+        self._drop_lock = threading.Lock()
+        self._latencies = deque(maxlen=1024)
+        self._consumer = threading.Thread(target=self._consume, daemon=True)
+        self._consumer.start()
+
+    @property
+    def metrics(self):
+        """Return the depth, the counts, and the latency percentiles."""
+        latencies = sorted(self._latencies)
+        return {
+            "depth": self._queue.qsize(),
+            "dispatched": self.dispatched,
+            "dropped": self.dropped,
+            "latency_p50": (
+                latencies[len(latencies) // 2] / 1e9 if latencies else 0.0
+            ),
+            "latency_p99": (
+                latencies[int(len(latencies) * 0.99)] / 1e9
+                if latencies
+                else 0.0
+            ),
+        }
 
+    def put(self, handler, *arguments):
+        """Queue an event from a hook unless the queue is full."""
+        if self._queue.qsize() >= self.maximum_size:
+            with self._drop_lock:
+                self.dropped += 1
+            return
 
-def _unpack_instruction(instruction):
-    """Extract command name and up to two arguments from an instruction."""
-    return (
-        instruction[0],
-        instruction[1] if len(instruction) > 1 else None,
-        instruction[2] if len(instruction) > 2 else None,
+        self._queue.put((time.perf_counter_ns(), handler, arguments))
+
+    def stop(self):
+        """Stop the consumer after the queued events."""
+        self._queue.put(None)
+
+    def _consume(self):
+        """Handle queued events in order until stopped."""
+        while True:
+            event = self._queue.get()
+            if event is None:
+                break
+
+            timestamp, handler, arguments = event
+            try:
+                handler(*arguments)
+            except Exception as e:
+                print(f"Unexpected error in '{handler.__name__}': {e}")
+
+            end = time.perf_counter_ns()
+            self._latencies.append(end - timestamp)
+            self.dispatched += 1
+            if _action_tracer:
+                _action_tracer.record(handler.__name__, timestamp, end, 0)
+
+
+class ActionExecutor:
+    """Run triggered actions on pre-started workers by overlap policy."""
+
+    OVERLAP_POLICIES = ("drop", "queue", "replace", "coalesce")
+
+    def __init__(
+        self,
+        trade,
+        config,
+        gui_state,
+        number_of_workers=4,
+        default_policy="drop",
+        policies=None,
+        coalescing_window=0.5,
+    ):
+        """Construct a new ActionExecutor object and start its workers."""
+        self.trade = trade
+        self.config = config
+        self.gui_state = gui_state
+        self.default_policy = default_policy
+        self.policies = dict(policies or {})
+        self.coalescing_window = coalescing_window
+        for policy in (default_policy, *self.policies.values()):
+            if policy not in ActionExecutor.OVERLAP_POLICIES:
+                raise configuration.ConfigError(
+                    f"'{policy}' is not an overlap policy."
+                )
+
+        self._lock = threading.Lock()
+        self._ready_queue = queue.SimpleQueue()
+        self._running = {}
+        self._pending = defaultdict(deque)
+        self._last_accepted_times = {}
+        self._counters = {
+            "queued": 0,
+            "running": 0,
+            "dropped": 0,
+            "replaced": 0,
+            "completed": 0,
+        }
+        self._workers = [
+            threading.Thread(target=self._work, daemon=True)
+            for _ in range(number_of_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    @classmethod
+    def from_config(cls, trade, config, gui_state):
+        """Construct an ActionExecutor from the process section."""
+        section = config[trade.process]
+        return cls(
+            trade,
+            config,
+            gui_state,
+            number_of_workers=int(section["number_of_action_workers"]),
+            default_policy=section["action_overlap_policy"],
+            policies=configuration.evaluate_value(
+                section["action_overlap_policies"]
+            ),
+            coalescing_window=float(section["coalescing_window"]),
+        )
+
+    @property
+    def counters(self):
+        """Return a snapshot of the queued, running, and dropped counts."""
+        with self._lock:
+            return dict(self._counters)
+
+    def submit(self, action, compiled_action=None):
+        """Schedule an action unless its overlap policy rejects it."""
+        policy = self.policies.get(action, self.default_policy)
+        now = time.monotonic()
+        token = CancellationToken()
+        with self._lock:
+            pending = self._pending[action]
+            if action in self._running or pending:
+                if policy == "drop" or (
+                    policy == "coalesce"
+                    and (
+                        pending
+                        or now - self._last_accepted_times[action]
+                        < self.coalescing_window
+                    )
+                ):
+                    self._counters["dropped"] += 1
+                    return False
+                if policy == "replace":
+                    self._running[action].cancel()
+                    self._counters["replaced"] += 1
+                    self._counters["dropped"] += len(pending)
+                    self._counters["queued"] -= len(pending)
+                    pending.clear()
+
+                pending.append((token, compiled_action))
+            else:
+                self._running[action] = token
+                self._dispatch(action, token, compiled_action)
+
+            self._last_accepted_times[action] = now
+            self._counters["queued"] += 1
+            return True
+
+    def shutdown(self):
+        """Stop the workers after their current actions."""
+        for _ in self._workers:
+            self._ready_queue.put(None)
+
+    def _work(self):
+        """Execute ready actions until shutdown."""
+        while True:
+            item = self._ready_queue.get()
+            if item is None:
+                break
+
+            action, token, compiled_action = item
+            self._begin()
+            reset_token = _cancellation_token.set(token)
+            try:
+                execute_action(
+                    self.trade,
+                    self.config,
+                    self.gui_state,
+                    compiled_action
+                    or get_compiled_action(self.trade, self.config, action),
+                )
+            except Exception as e:
+                print(f"Unexpected error in '{action}': {e}")
+            finally:
+                _cancellation_token.reset(reset_token)
+                self._complete(action)
+
+    def _dispatch(self, action, token, compiled_action):
+        """Hand an accepted run over to the workers."""
+        self._ready_queue.put((action, token, compiled_action))
+
+    def _begin(self):
+        """Count a dispatched run as running."""
+        with self._lock:
+            self._counters["queued"] -= 1
+            self._counters["running"] += 1
+
+    def _complete(self, action):
+        """Count a finished run and dispatch the next pending run."""
+        with self._lock:
+            self._counters["running"] -= 1
+            self._counters["completed"] += 1
+            pending = self._pending[action]
+            if pending:
+                token, compiled_action = pending.popleft()
+                self._running[action] = token
+                self._dispatch(action, token, compiled_action)
+            else:
+                del self._running[action]
+
+
+class AsyncActionRuntime(ActionExecutor):
+    """Run triggered actions as coroutines on a single event loop."""
+
+    COROUTINE_COMMANDS = frozenset(
+        {
+            "execute_action",
+            "is_now_after",
+            "is_now_before",
+            "is_recording",
+            "is_trading_day",
+            "sleep",
+            "wait_for_key",
+            "wait_for_key_count_down",
+            "wait_for_price",
+            "wait_for_window",
+        }
     )
+    POLLING_INTERVAL = 0.1
+
+    def __init__(
+        self, trade, config, gui_state, number_of_workers=4, **kwargs
+    ):
+        """Construct a new AsyncActionRuntime object and start its loop."""
+        self._loop = asyncio.new_event_loop()
+        # Only blocking calls occupy these threads; waits do not.
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=number_of_workers, thread_name_prefix="action"
+        )
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, daemon=True
+        )
+        self._thread.start()
+        super().__init__(
+            trade, config, gui_state, number_of_workers=0, **kwargs
+        )
+
+    def schedule(self, trigger, action):
+        """Submit an action at a POSIX time and return a cancelable future."""
+        return asyncio.run_coroutine_threadsafe(
+            self._submit_at(trigger, action), self._loop
+        )
+
+    def shutdown(self):
+        """Cancel the running actions and stop the loop and the threads."""
+        with self._lock:
+            for token in self._running.values():
+                token.cancel()
+        asyncio.run_coroutine_threadsafe(
+            self._cancel_tasks(), self._loop
+        ).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._executor.shutdown(wait=False)
+
+    async def _cancel_tasks(self):
+        """Cancel the other tasks and wait until they finish."""
+        tasks = asyncio.all_tasks() - {asyncio.current_task()}
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def execute_action(self, action):
+        """Execute a compiled action without holding a thread while waiting."""
+        token = _get_cancellation_token()
+        for instruction in action:
+            if token.is_cancelled:
+                return False
+
+            command = instruction.command
+            if (
+                _get_command(instruction) is None
+                or command not in AsyncActionRuntime.COROUTINE_COMMANDS
+            ):
+                is_successful = await self._loop.run_in_executor(
+                    self._executor,
+                    contextvars.copy_context().run,
+                    instruction.handler,
+                    self.trade,
+                    self.config,
+                    self.gui_state,
+                    instruction,
+                )
+            elif command == "sleep":
+                # Arming without routing keys leaves only cancellation to
+                # wake the token.
+                token.arm()
+                await self._wait_for_token(token, instruction.operand)
+                is_successful = not token.is_cancelled
+            elif command in {"wait_for_key", "wait_for_key_count_down"}:
+                is_successful = await self._wait_for_key(
+                    instruction, command == "wait_for_key_count_down"
+                )
+            elif command == "wait_for_price":
+                settings = get_settings(self.trade, self.config).process
+                is_successful = await self._poll(
+                    instruction,
+                    functools.partial(
+                        self.trade.backend.recognize_text,
+                        *instruction.operand,
+                        settings.image_magnification,
+                        settings.binarization_threshold,
+                        settings.is_dark_theme,
+                    ),
+                )
+            elif command == "wait_for_window":
+                is_successful = await self._poll(
+                    instruction,
+                    functools.partial(
+                        _is_window_open, self.trade, instruction.argument
+                    ),
+                )
+            elif command == "execute_action":
+                is_successful = await self._execute_nested_action(
+                    instruction.nested_action
+                )
+            else:
+                # Conditions read files, so they run off the event loop.
+                is_successful = not await self._loop.run_in_executor(
+                    self._executor,
+                    contextvars.copy_context().run,
+                    _evaluate_condition,
+                    self.trade,
+                    self.config,
+                    instruction,
+                ) or await self._execute_nested_action(
+                    instruction.nested_action
+                )
+
+            if not is_successful:
+                return False
+
+        return True
+
+    async def _execute_nested_action(self, nested_action):
+        """Execute a compiled or referenced nested action."""
+        if isinstance(nested_action, str):
+            nested_action = get_compiled_action(
+                self.trade, self.config, nested_action
+            )
+        elif not isinstance(nested_action, tuple):
+            print(nested_action, "is not a list or a string.")
+            return False
+        return await self.execute_action(nested_action)
+
+    async def _wait_for_key(self, instruction, should_count_down):
+        """Wait for a key press with optional countdown."""
+        token = _get_cancellation_token()
+        self.trade.arm_token(token, instruction.operand)
+        try:
+            if should_count_down:
+                countdown_seconds = get_settings(
+                    self.trade, self.config
+                ).general.countdown_seconds
+                announced_minutes = {
+                    seconds: -1 for seconds in countdown_seconds
+                }
+                while not await self._wait_for_token(
+                    token, 1.0 - time.time() % 1.0
+                ):
+                    _announce_countdown(
+                        self.trade, countdown_seconds, announced_minutes
+                    )
+            else:
+                await self._wait_for_token(token)
+        finally:
+            self.trade.disarm_token(token)
+
+        return await self._handle_cancellation_exit(instruction, token)
+
+    async def _poll(self, instruction, is_ready):
+        """Wait until a blocking check passes, holding a thread only for it."""
+        token = _get_cancellation_token()
+        self.trade.arm_token(token)
+        try:
+            while not await self._loop.run_in_executor(
+                self._executor, contextvars.copy_context().run, is_ready
+            ):
+                if await self._wait_for_token(
+                    token, AsyncActionRuntime.POLLING_INTERVAL
+                ):
+                    break
+        finally:
+            self.trade.disarm_token(token)
+        return await self._handle_cancellation_exit(instruction, token)
+
+    async def _handle_cancellation_exit(self, instruction, token):
+        """Return True unless canceled, running the cancellation action."""
+        if not token.is_cancelled:
+            return True
+        if instruction.nested_action:
+            # Run the cancellation action under a token that is not canceled.
+            _cancellation_token.set(CancellationToken())
+            try:
+                await self._execute_nested_action(instruction.nested_action)
+            finally:
+                _cancellation_token.set(token)
+        self.trade.speech_manager.set_speech_text("Canceled.")
+        return False
+
+    async def _wait_for_token(self, token, timeout=None):
+        """Return True if the token wakes before the timeout elapses."""
+        woken = asyncio.Event()
+        waker = functools.partial(self._loop.call_soon_threadsafe, woken.set)
+        token.add_waker(waker)
+        try:
+            if not token.wait(0):
+                await asyncio.wait_for(woken.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            token.remove_waker(waker)
+        return True
+
+    async def _submit_at(self, trigger, action):
+        """Sleep until the trigger and then submit the action."""
+        await asyncio.sleep(max(0.0, trigger - time.time()))
+        return self.submit(action)
+
+    def _dispatch(self, action, token, compiled_action):
+        """Start an accepted run as a task on the event loop."""
+        asyncio.run_coroutine_threadsafe(
+            self._run(action, token, compiled_action), self._loop
+        )
+
+    async def _run(self, action, token, compiled_action):
+        """Execute a dispatched run in the context of its token."""
+        self._begin()
+        _cancellation_token.set(token)
+        try:
+            self.trade.initialize_attributes()
+            self.gui_state.initialize_attributes()
+            await self.execute_action(
+                compiled_action
+                or get_compiled_action(self.trade, self.config, action)
+            )
+        except Exception as e:
+            print(f"Unexpected error in '{action}': {e}")
+        finally:
+            self._complete(action)
+
+
+def _is_window_open(trade, title_regex):
+    """Return True if the title of a top-level window matches."""
+    matched_windows = []
+
+    def match(hwnd, title_regex):
+        if re.fullmatch(title_regex, trade.backend.get_window_text(hwnd)):
+            matched_windows.append(hwnd)
+            return False
+        return True
+
+    trade.backend.enumerate_windows(match, title_regex)
+    return bool(matched_windows)
+
+
+class CancellationToken:
+    """Wake the waits of one action on a continue key, Esc, or replacement."""
+
+    def __init__(self):
+        """Construct a new CancellationToken object."""
+        self.key = None
+        self.is_cancelled = False
+        self._event = threading.Event()
+        self._wakers = []
+
+    def arm(self, key=None):
+        """Prepare for a wait that the key or cancellation ends."""
+        self.key = key
+        if not self.is_cancelled:
+            self._event.clear()
+
+    def resume(self):
+        """Wake the current wait so the action continues."""
+        self._event.set()
+        self._wake()
+
+    def cancel(self):
+        """Cancel the action and wake its current wait."""
+        self.is_cancelled = True
+        self._event.set()
+        self._wake()
+
+    def add_waker(self, waker):
+        """Call the waker on the next resumption or cancellation."""
+        self._wakers.append(waker)
+
+    def remove_waker(self, waker):
+        """Stop calling the waker."""
+        if waker in self._wakers:
+            self._wakers.remove(waker)
+
+    def wait(self, timeout=None):
+        """Block until resumed or canceled and return True if woken."""
+        return self._event.wait(timeout)
+
+    def _wake(self):
+        """Call the wakers of coroutines awaiting the token."""
+        for waker in tuple(self._wakers):
+            waker()
+
+
+_cancellation_token = contextvars.ContextVar(
+    "cancellation_token", default=None
+)
+
+
+def _get_cancellation_token():
+    """Return the token of the running action or a new one."""
+    # A new token is not stored, so it cannot outlive the caller.
+    return _cancellation_token.get() or CancellationToken()
 
 
 def _handle_gui_command(trade, config, gui_state, instruction):
     """Handle GUI interaction commands."""
-    command, argument, additional_argument = _unpack_instruction(instruction)
+    command = instruction.command
+
+    backend = trade.backend
 
     if command == "back_to":
-        pyautogui.moveTo(gui_state.previous_position)
+        backend.move_to(gui_state.previous_position)
     elif command == "click":
-        (pyautogui.rightClick if gui_state.swapped else pyautogui.click)(
-            *map(int, argument.split(","))
+        backend.click(
+            *instruction.operand,
+            button="right" if gui_state.swapped else "left",
         )
     elif command == "click_widget":
-        gui_interactions.click_widget(
+        backend.click_widget(
             gui_state,
-            os.path.join(trade.resource_directory, argument),
-            *map(int, additional_argument.split(",")),
+            *instruction.operand,
+            *instruction.additional_operand,
         )
     elif command == "drag_to":
-        pyautogui.dragTo(*map(int, argument.split(",")))
+        backend.drag_to(*instruction.operand)
     elif command == "move_to":
-        pyautogui.moveTo(*map(int, argument.split(",")))
+        backend.move_to(*instruction.operand)
     elif command == "press_hotkeys":
-        pyautogui.hotkey(*tuple(map(str.strip, argument.split(","))))
+        backend.press_hotkeys(*instruction.operand)
     elif command == "press_key":
-        argument = tuple(map(str.strip, argument.split(",")))
-        presses = int(argument[1]) if len(argument) > 1 else 1
-        pyautogui.press(argument[0], presses=presses)
+        key, presses = instruction.operand
+        backend.press_key(key, presses=presses)
     elif command == "right_click":
-        pyautogui.click(
-            *map(int, argument.split(",")),
+        backend.click(
+            *instruction.operand,
             button="left" if gui_state.swapped else "right",
         )
     elif command == "write_string":
-        pyautogui.write(argument)
+        backend.write_string(instruction.argument)
 
     return True
 
 
 def _handle_window_command(trade, config, gui_state, instruction):
     """Handle window and indicator visibility commands."""
-    command, argument, additional_argument = _unpack_instruction(instruction)
+    command, argument = instruction.command, instruction.argument
 
     if command == "hide_window":
-        gui_interactions.enumerate_windows(
-            gui_interactions.hide_window, argument
-        )
+        trade.backend.hide_window(argument)
     elif command == "show_hide_indicator":
         if trade.indicator_thread:
             trade.indicator_thread.stop()
@@ -1686,34 +4140,31 @@ def _handle_window_command(trade, config, gui_state, instruction):
         else:
             print(f"The '{trade.widgets_section}' section is undefined.")
     elif command == "show_hide_window":
-        gui_interactions.enumerate_windows(
-            gui_interactions.show_hide_window, argument
-        )
+        trade.backend.show_hide_window(argument)
     elif command == "show_window":
-        gui_interactions._show_window_state["count"] = 0
-        gui_interactions._show_window_state["max_count"] = int(
-            additional_argument or 1
-        )
-        gui_interactions.enumerate_windows(
-            gui_interactions.show_window, argument
-        )
+        trade.backend.show_window(argument, instruction.additional_operand)
 
     return True
 
 
 def _handle_wait_command(trade, config, gui_state, instruction):
     """Handle blocking and wait-related commands."""
-    command, argument, additional_argument = _unpack_instruction(instruction)
+    command = instruction.command
 
     if command == "sleep":
-        time.sleep(float(argument))
+        # Arming without routing keys leaves only cancellation to wake the
+        # token, so a replacing run or Esc ends the sleep early.
+        token = _get_cancellation_token()
+        token.arm()
+        if token.wait(instruction.operand) and token.is_cancelled:
+            return False
     elif command == "wait_for_key":
         if not _wait_for_key(
             trade,
             config,
             gui_state,
-            argument,
-            additional_argument,
+            instruction.operand,
+            instruction.nested_action,
         ):
             return False
     elif command == "wait_for_key_count_down":
@@ -1721,38 +4172,40 @@ def _handle_wait_command(trade, config, gui_state, instruction):
             trade,
             config,
             gui_state,
-            argument,
-            additional_argument,
+            instruction.operand,
+            instruction.nested_action,
             should_count_down=True,
         ):
             return False
     elif command == "wait_for_price":
-        trade.keyboard_listener_state = 1
-        trade.key_to_check = None
-        trade.should_continue = True
-        text_recognition.recognize_text(
-            *map(int, argument.split(",")),
-            int(config[trade.process]["image_magnification"]),
-            int(config[trade.process]["binarization_threshold"]),
-            config[trade.process].getboolean("is_dark_theme"),
-            should_continue_reference=lambda: trade.should_continue,
-        )
-        trade.keyboard_listener_state = 0
-        if not trade.should_continue and _handle_cancellation_exit(
-            trade, config, gui_state, additional_argument
+        settings = get_settings(trade, config).process
+        token = _get_cancellation_token()
+        trade.arm_token(token)
+        try:
+            trade.backend.recognize_text(
+                *instruction.operand,
+                settings.image_magnification,
+                settings.binarization_threshold,
+                settings.is_dark_theme,
+                should_continue_reference=lambda: not token.is_cancelled,
+            )
+        finally:
+            trade.disarm_token(token)
+        if token.is_cancelled and _handle_cancellation_exit(
+            trade, config, gui_state, instruction.nested_action
         ):
             return False
     elif command == "wait_for_window":
-        trade.keyboard_listener_state = 1
-        trade.key_to_check = None
-        trade.should_continue = True
-        gui_interactions.wait_for_window(
-            argument,
-            should_continue_reference=lambda: trade.should_continue,
-        )
-        trade.keyboard_listener_state = 0
-        if not trade.should_continue and _handle_cancellation_exit(
-            trade, config, gui_state, additional_argument
+        token = _get_cancellation_token()
+        trade.arm_token(token)
+        try:
+            trade.backend.wait_for_window(
+                instruction.argument, lambda: not token.is_cancelled
+            )
+        finally:
+            trade.disarm_token(token)
+        if token.is_cancelled and _handle_cancellation_exit(
+            trade, config, gui_state, instruction.nested_action
         ):
             return False
 
@@ -1761,19 +4214,19 @@ def _handle_wait_command(trade, config, gui_state, instruction):
 
 def _handle_speak_command(trade, config, gui_state, instruction):
     """Handle speech and user notification commands."""
-    command, argument, additional_argument = _unpack_instruction(instruction)
+    command, argument = instruction.command, instruction.argument
 
     if command == "speak_config":
         trade.speech_manager.set_speech_text(
-            config[argument][additional_argument]
+            config[argument][instruction.additional_argument]
         )
     elif command == "speak_cpu_utilization":
         trade.speech_manager.set_speech_text(
-            f"{round(psutil.cpu_percent(interval=float(argument)))}%."
+            f"{round(psutil.cpu_percent(interval=instruction.operand))}%."
         )
     elif command == "speak_minutes_since_hour":
         if argument:
-            target_time = data_utilities.get_target_time(argument)
+            target_time = _get_target_time(instruction.operand)
         else:
             now = pd.Timestamp.now()
             target_time = time.mktime(
@@ -1792,12 +4245,12 @@ def _handle_speak_command(trade, config, gui_state, instruction):
             trade.speech_manager.set_speech_text(f"{minutes_since} minutes.")
     elif command == "speak_seconds_since_time":
         seconds_since = math.floor(
-            time.time() - data_utilities.get_target_time(argument)
+            time.time() - _get_target_time(instruction.operand)
         )
         trade.speech_manager.set_speech_text(f"{seconds_since} seconds.")
     elif command == "speak_seconds_until_time":
         seconds_until = math.ceil(
-            data_utilities.get_target_time(argument) - time.time()
+            _get_target_time(instruction.operand) - time.time()
         )
         trade.speech_manager.set_speech_text(f"{seconds_until} seconds.")
     elif command == "speak_show_text":
@@ -1811,24 +4264,22 @@ def _handle_speak_command(trade, config, gui_state, instruction):
 
 def _handle_market_data_command(trade, config, gui_state, instruction):
     """Handle market data retrieval and persistence commands."""
-    command, argument, additional_argument = _unpack_instruction(instruction)
+    command = instruction.command
 
     if command == "copy_symbols_from_column":
-        win32clipboard.OpenClipboard()
-        win32clipboard.EmptyClipboard()
-        win32clipboard.SetClipboardText(
+        settings = get_settings(trade, config).process
+        trade.backend.set_clipboard_text(
             " ".join(
-                text_recognition.recognize_text(
-                    *map(int, argument.split(",")),
+                trade.backend.recognize_text(
+                    *instruction.operand,
                     None,
-                    int(config[trade.process]["image_magnification"]),
-                    int(config[trade.process]["binarization_threshold"]),
-                    config[trade.process].getboolean("is_dark_theme"),
+                    settings.image_magnification,
+                    settings.binarization_threshold,
+                    settings.is_dark_theme,
                     text_type="securities_code_column",
                 )
             )
         )
-        win32clipboard.CloseClipboard()
     elif command == "save_market_data":
         save_market_data(trade, config)
 
@@ -1837,7 +4288,7 @@ def _handle_market_data_command(trade, config, gui_state, instruction):
 
 def _handle_trade_state_command(trade, config, gui_state, instruction):
     """Handle trade state and accounting commands."""
-    command, argument, additional_argument = _unpack_instruction(instruction)
+    command, argument = instruction.command, instruction.argument
 
     if command == "calculate_share_size":
         is_successful, text = calculate_share_size(trade, config, argument)
@@ -1845,50 +4296,40 @@ def _handle_trade_state_command(trade, config, gui_state, instruction):
             trade.speech_manager.set_speech_text(text)
             return False
     elif command == "check_daily_loss_limit":
+        settings = get_settings(trade, config).process
         daily_loss_limit = (
             trade.cash_balance
-            * float(config[trade.process]["utilization_ratio"])
-            * float(config[trade.process]["daily_loss_limit_ratio"])
-        )
-        initial_cash_balance = int(
-            config[trade.variables_section]["initial_cash_balance"]
+            * settings.utilization_ratio
+            * settings.daily_loss_limit_ratio
         )
+        initial_cash_balance = trade.state_store.initial_cash_balance
         if initial_cash_balance == 0:
-            config[trade.variables_section]["initial_cash_balance"] = str(
-                trade.cash_balance
-            )
-            configuration.write_config(
-                config, trade.config_path, is_encrypted=True
-            )
+            trade.state_store.initial_cash_balance = trade.cash_balance
         else:
             daily_profit = trade.cash_balance - initial_cash_balance
             if daily_profit < daily_loss_limit:
                 trade.speech_manager.set_speech_text(argument)
                 return False
     elif command == "check_maximum_daily_number_of_trades":
+        settings = get_settings(trade, config).process
         if (
             0
-            < int(config[trade.process]["maximum_daily_number_of_trades"])
-            <= int(config[trade.variables_section]["current_number_of_trades"])
+            < settings.maximum_daily_number_of_trades
+            <= trade.state_store.current_number_of_trades
         ):
             trade.speech_manager.set_speech_text(argument)
             return False
     elif command == "count_trades":
+        settings = get_settings(trade, config).process
         current_number_of_trades = (
-            int(config[trade.variables_section]["current_number_of_trades"])
-            + 1
-        )
-        config[trade.variables_section]["current_number_of_trades"] = str(
-            current_number_of_trades
-        )
-        configuration.write_config(
-            config, trade.config_path, is_encrypted=True
+            trade.state_store.current_number_of_trades + 1
         )
+        trade.state_store.current_number_of_trades = current_number_of_trades
 
         file_utilities.write_chapter(
             file_utilities.get_latest_file(
-                config[trade.process]["screencast_directory"],
-                config[trade.process]["screencast_regex"],
+                settings.screencast_directory,
+                settings.screencast_regex,
             ),
             (
                 f"Trade {current_number_of_trades}"
@@ -1899,141 +4340,219 @@ def _handle_trade_state_command(trade, config, gui_state, instruction):
             offset=argument,
         )
     elif command == "get_cash_balance":
+        settings = get_settings(trade, config).process
         trade.cash_balance = int(
-            text_recognition.recognize_text(
+            trade.backend.recognize_text(
                 *map(
                     int,
                     config[trade.geometries_section][
                         "cash_balance_region"
                     ].split(","),
                 ),
-                int(config[trade.process]["image_magnification"]),
-                int(config[trade.process]["binarization_threshold"]),
-                config[trade.process].getboolean("is_dark_theme"),
+                settings.image_magnification,
+                settings.binarization_threshold,
+                settings.is_dark_theme,
             )
         )
     elif command == "get_symbol":
-        gui_interactions.enumerate_windows(trade.get_symbol, argument)
+        trade.backend.enumerate_windows(trade.get_symbol, argument)
     elif command == "write_chapter":
+        settings = get_settings(trade, config).process
         file_utilities.write_chapter(
             file_utilities.get_latest_file(
-                config[trade.process]["screencast_directory"],
-                config[trade.process]["screencast_regex"],
+                settings.screencast_directory,
+                settings.screencast_regex,
             ),
             argument,
-            previous_title=additional_argument,
+            previous_title=instruction.additional_argument,
         )
     elif command == "write_share_size":
-        pyautogui.write(str(trade.share_size))
+        trade.backend.write_string(str(trade.share_size))
 
     return True
 
 
 def _handle_control_flow_command(trade, config, gui_state, instruction):
     """Handle conditional control-flow commands."""
-    command, argument, additional_argument = _unpack_instruction(instruction)
+    if _evaluate_condition(
+        trade, config, instruction
+    ) and not _recursively_execute_action(
+        trade, config, gui_state, instruction.nested_action
+    ):
+        return False
+
+    return True
+
+
+def _evaluate_condition(trade, config, instruction):
+    """Return whether the condition of a control-flow command holds."""
+    command = instruction.command
 
     if command == "is_now_after":
-        if data_utilities.get_target_time(
-            argument
-        ) < time.time() and not _recursively_execute_action(
-            trade, config, gui_state, additional_argument
-        ):
-            return False
-    elif command == "is_now_before":
-        if time.time() < data_utilities.get_target_time(
-            argument
-        ) and not _recursively_execute_action(
-            trade, config, gui_state, additional_argument
-        ):
-            return False
-    elif command == "is_recording":
-        if file_utilities.is_writing(
-            file_utilities.get_latest_file(
-                config[trade.process]["screencast_directory"],
-                config[trade.process]["screencast_regex"],
+        return _get_target_time(instruction.operand) < time.time()
+    if command == "is_now_before":
+        return time.time() < _get_target_time(instruction.operand)
+    if command == "is_recording":
+        settings = get_settings(trade, config).process
+        return (
+            file_utilities.is_writing(
+                file_utilities.get_latest_file(
+                    settings.screencast_directory,
+                    settings.screencast_regex,
+                )
             )
-        ) == bool(
-            argument.lower() == "true"
-        ) and not _recursively_execute_action(
-            trade, config, gui_state, additional_argument
-        ):
-            return False
-    elif command == "is_trading_day":
-        if is_trading_day(
-            pd.Timestamp.now(tz=config["Market Data"]["timezone"]),
-            trade.market_holidays,
-            config["Market Holidays"]["date_format"],
-        ) == bool(
-            argument.lower() == "true"
-        ) and not _recursively_execute_action(
-            trade, config, gui_state, additional_argument
-        ):
-            return False
-
-    return True
+            == instruction.operand
+        )
+    if command == "is_trading_day":
+        return (
+            is_trading_day(
+                pd.Timestamp.now(tz=config["Market Data"]["timezone"]),
+                trade.market_holidays,
+                config["Market Holidays"]["date_format"],
+            )
+            == instruction.operand
+        )
+    return False
 
 
 def _handle_execution_command(trade, config, gui_state, instruction):
     """Handle execution and delegation commands."""
-    command, argument, additional_argument = _unpack_instruction(instruction)
+    command = instruction.command
 
     if command == "execute_action":
-        if not _recursively_execute_action(trade, config, gui_state, argument):
+        if not _recursively_execute_action(
+            trade, config, gui_state, instruction.nested_action
+        ):
             return False
+    elif command == "save_trace":
+        if _action_tracer:
+            _action_tracer.dump()
+        else:
+            print("Tracing is disabled.")
 
     return True
 
 
+@dataclasses.dataclass(frozen=True, slots=True)
+class Command:
+    """Hold the handler of a command and the effects that order it."""
+
+    handler: object
+    reads: frozenset = frozenset()
+    writes: frozenset = frozenset()
+    is_input: bool = False
+    is_barrier: bool = False
+
+
+# Effects name the state that a command reads or writes: 'desktop' covers
+# the screen, windows, and input devices, and the others name trade
+# attributes or external stores.  Input commands run in their original
+# order on the calling thread.  Barriers, which wait, branch, delegate, or
+# can stop an action, run only after every preceding instruction.
+_DESKTOP = frozenset({"desktop"})
 _COMMAND_DISPATCH = {
     # GUI interaction commands
-    "back_to": _handle_gui_command,
-    "click": _handle_gui_command,
-    "click_widget": _handle_gui_command,
-    "drag_to": _handle_gui_command,
-    "move_to": _handle_gui_command,
-    "press_hotkeys": _handle_gui_command,
-    "press_key": _handle_gui_command,
-    "right_click": _handle_gui_command,
-    "write_string": _handle_gui_command,
+    "back_to": Command(_handle_gui_command, writes=_DESKTOP, is_input=True),
+    "click": Command(_handle_gui_command, writes=_DESKTOP, is_input=True),
+    "click_widget": Command(
+        _handle_gui_command, writes=_DESKTOP, is_input=True
+    ),
+    "drag_to": Command(_handle_gui_command, writes=_DESKTOP, is_input=True),
+    "move_to": Command(_handle_gui_command, writes=_DESKTOP, is_input=True),
+    "press_hotkeys": Command(
+        _handle_gui_command, writes=_DESKTOP, is_input=True
+    ),
+    "press_key": Command(_handle_gui_command, writes=_DESKTOP, is_input=True),
+    "right_click": Command(
+        _handle_gui_command, writes=_DESKTOP, is_input=True
+    ),
+    "write_string": Command(
+        _handle_gui_command, writes=_DESKTOP, is_input=True
+    ),
     # Window and indicator visibility commands
-    "hide_window": _handle_window_command,
-    "show_hide_indicator": _handle_window_command,
-    "show_hide_window": _handle_window_command,
-    "show_window": _handle_window_command,
+    "hide_window": Command(
+        _handle_window_command, writes=_DESKTOP, is_input=True
+    ),
+    "show_hide_indicator": Command(
+        _handle_window_command, writes=_DESKTOP, is_input=True
+    ),
+    "show_hide_window": Command(
+        _handle_window_command, writes=_DESKTOP, is_input=True
+    ),
+    "show_window": Command(
+        _handle_window_command, writes=_DESKTOP, is_input=True
+    ),
     # Blocking and wait-related commands
-    "sleep": _handle_wait_command,
-    "wait_for_key": _handle_wait_command,
-    "wait_for_key_count_down": _handle_wait_command,
-    "wait_for_price": _handle_wait_command,
-    "wait_for_window": _handle_wait_command,
+    "sleep": Command(_handle_wait_command, is_barrier=True),
+    "wait_for_key": Command(_handle_wait_command, is_barrier=True),
+    "wait_for_key_count_down": Command(_handle_wait_command, is_barrier=True),
+    "wait_for_price": Command(_handle_wait_command, is_barrier=True),
+    "wait_for_window": Command(_handle_wait_command, is_barrier=True),
     # Speech and user notification commands
-    "speak_config": _handle_speak_command,
-    "speak_cpu_utilization": _handle_speak_command,
-    "speak_minutes_since_hour": _handle_speak_command,
-    "speak_seconds_since_time": _handle_speak_command,
-    "speak_seconds_until_time": _handle_speak_command,
-    "speak_show_text": _handle_speak_command,
-    "speak_text": _handle_speak_command,
+    "speak_config": Command(
+        _handle_speak_command, frozenset({"config"}), frozenset({"speech"})
+    ),
+    "speak_cpu_utilization": Command(
+        _handle_speak_command, writes=frozenset({"speech"})
+    ),
+    "speak_minutes_since_hour": Command(
+        _handle_speak_command, writes=frozenset({"speech"})
+    ),
+    "speak_seconds_since_time": Command(
+        _handle_speak_command, writes=frozenset({"speech"})
+    ),
+    "speak_seconds_until_time": Command(
+        _handle_speak_command, writes=frozenset({"speech"})
+    ),
+    "speak_show_text": Command(
+        _handle_speak_command, writes=frozenset({"speech", "desktop"})
+    ),
+    "speak_text": Command(_handle_speak_command, writes=frozenset({"speech"})),
     # Market data retrieval and persistence commands
-    "copy_symbols_from_column": _handle_market_data_command,
-    "save_market_data": _handle_market_data_command,
+    "copy_symbols_from_column": Command(
+        _handle_market_data_command, _DESKTOP, frozenset({"clipboard"})
+    ),
+    "save_market_data": Command(
+        _handle_market_data_command, writes=frozenset({"market_data"})
+    ),
     # Trade state and accounting commands
-    "calculate_share_size": _handle_trade_state_command,
-    "check_daily_loss_limit": _handle_trade_state_command,
-    "check_maximum_daily_number_of_trades": _handle_trade_state_command,
-    "count_trades": _handle_trade_state_command,
-    "get_cash_balance": _handle_trade_state_command,
-    "get_symbol": _handle_trade_state_command,
-    "write_chapter": _handle_trade_state_command,
-    "write_share_size": _handle_trade_state_command,
+    "calculate_share_size": Command(
+        _handle_trade_state_command, is_barrier=True
+    ),
+    "check_daily_loss_limit": Command(
+        _handle_trade_state_command, is_barrier=True
+    ),
+    "check_maximum_daily_number_of_trades": Command(
+        _handle_trade_state_command, is_barrier=True
+    ),
+    "count_trades": Command(
+        _handle_trade_state_command,
+        frozenset({"symbol"}),
+        frozenset({"state", "screencast"}),
+    ),
+    "get_cash_balance": Command(
+        _handle_trade_state_command, _DESKTOP, frozenset({"cash_balance"})
+    ),
+    "get_symbol": Command(
+        _handle_trade_state_command, _DESKTOP, frozenset({"symbol"})
+    ),
+    "write_chapter": Command(
+        _handle_trade_state_command, writes=frozenset({"screencast"})
+    ),
+    "write_share_size": Command(
+        _handle_trade_state_command,
+        frozenset({"share_size"}),
+        _DESKTOP,
+        is_input=True,
+    ),
     # Conditional control-flow commands
-    "is_now_after": _handle_control_flow_command,
-    "is_now_before": _handle_control_flow_command,
-    "is_recording": _handle_control_flow_command,
-    "is_trading_day": _handle_control_flow_command,
+    "is_now_after": Command(_handle_control_flow_command, is_barrier=True),
+    "is_now_before": Command(_handle_control_flow_command, is_barrier=True),
+    "is_recording": Command(_handle_control_flow_command, is_barrier=True),
+    "is_trading_day": Command(_handle_control_flow_command, is_barrier=True),
     # Execution and delegation commands
-    "execute_action": _handle_execution_command,
+    "execute_action": Command(_handle_execution_command, is_barrier=True),
+    "save_trace": Command(_handle_execution_command, is_barrier=True),
 }
 
 
@@ -2042,43 +4561,50 @@ def execute_action(trade, config, gui_state, action, should_initialize=True):
     if should_initialize:
         trade.initialize_attributes()
         gui_state.initialize_attributes()
+    # A top-level run outside an executor gets its own token, so that a
+    # cancellation does not leak into later runs on the same thread.
+    if _cancellation_token.get() is None:
+        reset_token = _cancellation_token.set(CancellationToken())
+        try:
+            return execute_action(
+                trade, config, gui_state, action, should_initialize=False
+            )
+        finally:
+            _cancellation_token.reset(reset_token)
 
-    if isinstance(action, str):
-        action = configuration.evaluate_value(action)
+    if not isinstance(action, tuple):
+        action = compile_action(trade, action)
+    token = _get_cancellation_token()
+    if _action_tracer:
+        return _action_tracer.execute(trade, config, gui_state, action, token)
+    if _instruction_pool:
+        return _execute_in_parallel(trade, config, gui_state, action, token)
 
     for instruction in action:
-        command = instruction[0]
-        handler = _COMMAND_DISPATCH.get(command)
-
-        if not handler:
-            print(f"'{command}' is not a recognized command.")
+        if token.is_cancelled:
             return False
-        if not handler(trade, config, gui_state, instruction):
+        if not instruction.handler(trade, config, gui_state, instruction):
             return False
 
     return True
 
 
-def _recursively_execute_action(trade, config, gui_state, additional_argument):
-    """Recursively execute an action if it is a list or a string."""
-    if isinstance(additional_argument, list):
+def _recursively_execute_action(trade, config, gui_state, nested_action):
+    """Recursively execute a compiled action or a referenced action."""
+    if isinstance(nested_action, tuple):
         return execute_action(
-            trade,
-            config,
-            gui_state,
-            additional_argument,
-            should_initialize=False,
+            trade, config, gui_state, nested_action, should_initialize=False
         )
-    if isinstance(additional_argument, str):
+    if isinstance(nested_action, str):
         return execute_action(
             trade,
             config,
             gui_state,
-            config[trade.actions_section][additional_argument],
+            get_compiled_action(trade, config, nested_action),
             should_initialize=False,
         )
 
-    print(additional_argument, "is not a list or a string.")
+    print(nested_action, "is not a list or a string.")
     return False
 
 
@@ -2086,57 +4612,738 @@ def _wait_for_key(
     trade,
     config,
     gui_state,
-    argument,
-    additional_argument,
+    key,
+    nested_action,
     should_count_down=False,
 ):
     """Wait for a key press with optional countdown."""
-    trade.keyboard_listener_state = 1
-    trade.key_to_check = (
-        argument if len(argument) == 1 else keyboard.Key[argument]
-    )
-    countdown_seconds = [
-        int(seconds.strip())
-        for seconds in config["General"][
-            "countdown_seconds_before_candle_close"
-        ].split(",")
-    ]
-    announced_minutes = {seconds: -1 for seconds in countdown_seconds}
-
-    while trade.keyboard_listener_state == 1:
+    token = _get_cancellation_token()
+    trade.arm_token(token, key)
+    try:
         if should_count_down:
-            now = pd.Timestamp.now()
-            current_second = now.second
-            current_minute = now.minute
-
-            for seconds in countdown_seconds:
-                if (
-                    current_second == 60 - seconds
-                    and current_minute != announced_minutes[seconds]
-                ):
-                    trade.speech_manager.set_speech_text(f"{seconds} seconds.")
-                    announced_minutes[seconds] = current_minute
-
-        time.sleep(0.01)
+            countdown_seconds = get_settings(
+                trade, config
+            ).general.countdown_seconds
+            announced_minutes = {seconds: -1 for seconds in countdown_seconds}
+
+            # Wake at each second boundary to announce the countdown.
+            while not token.wait(1.0 - time.time() % 1.0):
+                _announce_countdown(
+                    trade, countdown_seconds, announced_minutes
+                )
+        else:
+            token.wait()
+    finally:
+        trade.disarm_token(token)
 
-    if not trade.should_continue and _handle_cancellation_exit(
-        trade, config, gui_state, additional_argument
+    if token.is_cancelled and _handle_cancellation_exit(
+        trade, config, gui_state, nested_action
     ):
         return False
     return True
 
 
-def _handle_cancellation_exit(trade, config, gui_state, additional_argument):
+def _announce_countdown(trade, countdown_seconds, announced_minutes):
+    """Announce the seconds left once per minute at each countdown second."""
+    now = time.localtime()
+    for seconds in countdown_seconds:
+        if (
+            now.tm_sec == 60 - seconds
+            and now.tm_min != announced_minutes[seconds]
+        ):
+            trade.speech_manager.set_speech_text(f"{seconds} seconds.")
+            announced_minutes[seconds] = now.tm_min
+
+
+def _handle_cancellation_exit(trade, config, gui_state, nested_action):
     """Perform cancellation actions and signal caller to exit."""
-    if additional_argument:
-        _recursively_execute_action(
-            trade, config, gui_state, additional_argument
-        )
+    if nested_action:
+        # Run the cancellation action under a token that is not canceled.
+        reset_token = _cancellation_token.set(CancellationToken())
+        try:
+            _recursively_execute_action(
+                trade, config, gui_state, nested_action
+            )
+        finally:
+            _cancellation_token.reset(reset_token)
 
     trade.speech_manager.set_speech_text("Canceled.")
     return True
 
 
+# Action Compilation
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class Instruction:
+    """Hold a command resolved to its handler with pre-parsed arguments."""
+
+    command: str
+    handler: object
+    argument: object = None
+    additional_argument: object = None
+    operand: object = None
+    additional_operand: object = None
+    nested_action: object = None
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class ActionGraph:
+    """Hold compiled actions keyed by name and the digest of their source."""
+
+    digest: str
+    actions: types.MappingProxyType
+    call_graph: types.MappingProxyType
+    problems: tuple
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class InputMap:
+    """Hold the actions bound to mouse buttons and function keys."""
+
+    digest: str
+    bindings: types.MappingProxyType
+
+
+_ACTION_GRAPH_CACHE = {}
+_MAXIMUM_ACTION_GRAPH_CACHE_SIZE = 8
+_NESTED_ARGUMENT_COMMANDS = {"execute_action"}
+_NESTED_ADDITIONAL_ARGUMENT_COMMANDS = {
+    "is_now_after",
+    "is_now_before",
+    "is_recording",
+    "is_trading_day",
+    "wait_for_key",
+    "wait_for_key_count_down",
+    "wait_for_price",
+    "wait_for_window",
+}
+
+
+def compile_actions(trade, config):
+    """Compile the actions section into a graph cached by its contents."""
+    items = tuple(config[trade.actions_section].items())
+    digest = hashlib.sha256(
+        repr((trade.resource_directory, items)).encode()
+    ).hexdigest()
+    action_graph = _ACTION_GRAPH_CACHE.get(digest)
+    if action_graph is None:
+        sources = {
+            option: configuration.evaluate_value(value)
+            for option, value in items
+        }
+        call_graph, cyclic_actions, problems = analyze_actions(sources)
+        action_graph = ActionGraph(
+            digest,
+            types.MappingProxyType(
+                _link_actions(
+                    {
+                        option: compile_action(trade, source)
+                        for option, source in sources.items()
+                    },
+                    cyclic_actions,
+                )
+            ),
+            types.MappingProxyType(call_graph),
+            tuple(problems),
+        )
+        if len(_ACTION_GRAPH_CACHE) >= _MAXIMUM_ACTION_GRAPH_CACHE_SIZE:
+            _ACTION_GRAPH_CACHE.clear()
+        _ACTION_GRAPH_CACHE[digest] = action_graph
+
+    if trade.action_graph is not action_graph:
+        trade.action_graph = action_graph
+        # The bindings hold compiled actions, so rebuild them with the graph.
+        if trade.input_map:
+            compile_input_map(trade, config)
+    return action_graph
+
+
+def check_actions(trade, config):
+    """Print the problems found in the actions section."""
+    _, _, problems = analyze_actions(
+        {
+            option: configuration.evaluate_value(value)
+            for option, value in config[trade.actions_section].items()
+        }
+    )
+    for problem in problems:
+        print(problem)
+    return not problems
+
+
+def analyze_actions(sources):
+    """Build the call graph of actions and find unknown or cyclic ones."""
+    call_graph = {}
+    problems = []
+    for name, source in sources.items():
+        references = set()
+        unknown_commands = []
+        _collect_references(source, references, unknown_commands)
+        call_graph[name] = frozenset(references)
+        problems.extend(
+            f"'{name}': '{command}' is not a recognized command."
+            for command in unknown_commands
+        )
+        problems.extend(
+            f"'{name}': '{reference}' is not a defined action."
+            for reference in sorted(references)
+            if reference not in sources
+        )
+
+    cyclic_actions = set()
+    states = {}
+
+    def visit(name, path):
+        states[name] = "visiting"
+        path.append(name)
+        for reference in sorted(call_graph[name]):
+            if reference not in call_graph:
+                continue
+            if states.get(reference) == "visiting":
+                cycle = path[path.index(reference) :] + [reference]
+                cyclic_actions.update(cycle)
+                problems.append(
+                    " -> ".join(f"'{action}'" for action in cycle)
+                    + " is a cycle."
+                )
+            elif reference not in states:
+                visit(reference, path)
+        path.pop()
+        states[name] = "visited"
+
+    for name in call_graph:
+        if name not in states:
+            visit(name, [])
+
+    return call_graph, cyclic_actions, problems
+
+
+def _collect_references(action, references, unknown_commands):
+    """Collect referenced action names and unknown commands in an action."""
+    if not isinstance(action, (list, tuple)):
+        return
+
+    for instruction in action:
+        if not isinstance(instruction, (list, tuple)) or not instruction:
+            unknown_commands.append(str(instruction))
+            continue
+
+        command, argument, additional_argument = _unpack_instruction(
+            instruction
+        )
+        if command not in _COMMAND_DISPATCH:
+            unknown_commands.append(command)
+            continue
+
+        nested_action = _select_nested_action(
+            command, argument, additional_argument
+        )
+        if isinstance(nested_action, str):
+            references.add(nested_action)
+        else:
+            _collect_references(nested_action, references, unknown_commands)
+
+
+def _select_nested_action(command, argument, additional_argument):
+    """Return the argument of a command that holds a nested action."""
+    if command in _NESTED_ARGUMENT_COMMANDS:
+        return argument
+    if command in _NESTED_ADDITIONAL_ARGUMENT_COMMANDS:
+        return additional_argument
+    return None
+
+
+def _link_actions(actions, cyclic_actions):
+    """Resolve action references and inline unconditional sub-actions."""
+    linked_actions = {}
+
+    def link_action(name):
+        if name not in linked_actions:
+            linked_actions[name] = link_sequence(actions[name])
+        return linked_actions[name]
+
+    def link_sequence(sequence):
+        linked_sequence = []
+        for instruction in sequence:
+            nested_action = instruction.nested_action
+            if isinstance(nested_action, str):
+                if nested_action in cyclic_actions:
+                    linked_sequence.append(
+                        dataclasses.replace(
+                            instruction, handler=_handle_cyclic_action
+                        )
+                    )
+                    continue
+                if nested_action not in actions:
+                    linked_sequence.append(
+                        dataclasses.replace(
+                            instruction, handler=_handle_undefined_action
+                        )
+                    )
+                    continue
+
+                nested_action = link_action(nested_action)
+            elif isinstance(nested_action, tuple):
+                nested_action = link_sequence(nested_action)
+            else:
+                linked_sequence.append(instruction)
+                continue
+
+            # 'execute_action' fails exactly when one of its instructions
+            # fails, so its sub-action can be spliced into the caller.
+            if instruction.command == "execute_action":
+                linked_sequence.extend(nested_action)
+            else:
+                linked_sequence.append(
+                    dataclasses.replace(
+                        instruction, nested_action=nested_action
+                    )
+                )
+
+        return tuple(linked_sequence)
+
+    for name in actions:
+        link_action(name)
+    return linked_actions
+
+
+def compile_input_map(trade, config):
+    """Compile the input map into bindings keyed by buttons and keys."""
+    source = config[trade.process]["input_map"]
+    action_graph = compile_actions(trade, config)
+    digest = hashlib.sha256(
+        repr((source, action_graph.digest)).encode()
+    ).hexdigest()
+    if trade.input_map and trade.input_map.digest == digest:
+        return trade.input_map
+
+    bindings = {}
+    for name, action in configuration.evaluate_value(source).items():
+        if not action:
+            continue
+        if action not in action_graph.actions:
+            print(f"'{name}': '{action}' is not a defined action.")
+            continue
+
+        # The executor runs the bound compiled action without a lookup.
+        button = getattr(mouse.Button, name, None)
+        key = getattr(keyboard.Key, name, None)
+        if button is not None:
+            bindings[button] = (action, action_graph.actions[action])
+        elif key in Trade.get_function_keys():
+            bindings[key] = (action, action_graph.actions[action])
+        else:
+            print(f"'{name}' is not a mouse button or a function key.")
+
+    trade.input_map = InputMap(digest, types.MappingProxyType(bindings))
+    return trade.input_map
+
+
+def get_compiled_action(trade, config, action):
+    """Return the compiled action for a name in the actions section."""
+    action_graph = trade.action_graph
+    if action_graph is None or action not in action_graph.actions:
+        action_graph = compile_actions(trade, config)
+    return action_graph.actions[action]
+
+
+def compile_action(trade, action):
+    """Compile an action string or list into a tuple of instructions."""
+    if isinstance(action, str):
+        action = configuration.evaluate_value(action)
+    if not isinstance(action, (list, tuple)):
+        return (
+            Instruction(
+                "execute_action",
+                _handle_invalid_instruction,
+                argument=action,
+            ),
+        )
+
+    return tuple(
+        _compile_instruction(trade, instruction) for instruction in action
+    )
+
+
+def _compile_instruction(trade, instruction):
+    """Resolve the handler and pre-parse the arguments of an instruction."""
+    if not isinstance(instruction, (list, tuple)) or not instruction:
+        return Instruction(str(instruction), _handle_unknown_command)
+
+    command, argument, additional_argument = _unpack_instruction(instruction)
+    command_entry = _COMMAND_DISPATCH.get(command)
+    if not command_entry:
+        return Instruction(
+            command, _handle_unknown_command, argument, additional_argument
+        )
+
+    try:
+        operand = _parse_operand(trade, command, argument)
+        additional_operand = _parse_additional_operand(
+            command, additional_argument
+        )
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return Instruction(
+            command, _handle_invalid_instruction, argument, additional_argument
+        )
+
+    nested_action = _select_nested_action(
+        command, argument, additional_argument
+    )
+    if isinstance(nested_action, (list, tuple)):
+        nested_action = compile_action(trade, nested_action)
+
+    return Instruction(
+        command,
+        command_entry.handler,
+        argument,
+        additional_argument,
+        operand,
+        additional_operand,
+        nested_action,
+    )
+
+
+def _unpack_instruction(instruction):
+    """Extract command name and up to two arguments from an instruction."""
+    return (
+        instruction[0],
+        instruction[1] if len(instruction) > 1 else None,
+        instruction[2] if len(instruction) > 2 else None,
+    )
+
+
+def _parse_operand(trade, command, argument):
+    """Parse the argument of a command into the value its handler uses."""
+    if command in {
+        "click",
+        "copy_symbols_from_column",
+        "drag_to",
+        "move_to",
+        "right_click",
+        "wait_for_price",
+    }:
+        return _parse_integers(argument)
+    if command == "click_widget":
+        return (os.path.join(trade.resource_directory, argument),)
+    if command == "press_hotkeys":
+        return tuple(map(str.strip, argument.split(",")))
+    if command == "press_key":
+        keys = tuple(map(str.strip, argument.split(",")))
+        return keys[0], int(keys[1]) if len(keys) > 1 else 1
+    if command in {"sleep", "speak_cpu_utilization"}:
+        return float(argument)
+    if command in {"wait_for_key", "wait_for_key_count_down"}:
+        return argument if len(argument) == 1 else keyboard.Key[argument]
+    if command in {
+        "is_now_after",
+        "is_now_before",
+        "speak_seconds_since_time",
+        "speak_seconds_until_time",
+    } or (command == "speak_minutes_since_hour" and argument):
+        return _parse_time_of_day(argument)
+    if command in {"is_recording", "is_trading_day"}:
+        return argument.lower() == "true"
+    return None
+
+
+def _parse_additional_operand(command, additional_argument):
+    """Parse the additional argument of a command for its handler."""
+    if command == "click_widget":
+        return _parse_integers(additional_argument)
+    if command == "show_window":
+        return int(additional_argument or 1)
+    return None
+
+
+def _parse_integers(value):
+    """Parse comma-separated integers such as coordinates or a region."""
+    return tuple(map(int, value.split(",")))
+
+
+def _parse_time_of_day(value):
+    """Parse a time of day into hours, minutes, and seconds if possible."""
+    try:
+        parts = tuple(map(int, value.split(":")))
+    except ValueError:
+        return value
+    if not 2 <= len(parts) <= 3:
+        return value
+    return parts + (0,) * (3 - len(parts))
+
+
+def _get_target_time(time_of_day):
+    """Return the epoch time for a parsed time of day today."""
+    if isinstance(time_of_day, str):
+        return data_utilities.get_target_time(time_of_day)
+    # 'time.mktime()' normalizes hours past midnight to the next day.
+    return time.mktime(time.localtime()[:3] + time_of_day + (0, 0, -1))
+
+
+def _handle_unknown_command(trade, config, gui_state, instruction):
+    """Report an unrecognized command and stop the action."""
+    print(f"'{instruction.command}' is not a recognized command.")
+    return False
+
+
+def _handle_undefined_action(trade, config, gui_state, instruction):
+    """Report a reference to an undefined action and stop the action."""
+    print(f"'{instruction.nested_action}' is not a defined action.")
+    return False
+
+
+def _handle_cyclic_action(trade, config, gui_state, instruction):
+    """Report a reference to an action in a cycle and stop the action."""
+    print(f"'{instruction.nested_action}' calls itself recursively.")
+    return False
+
+
+def _handle_invalid_instruction(trade, config, gui_state, instruction):
+    """Report arguments that could not be parsed and stop the action."""
+    print(
+        f"'{instruction.command}' has invalid arguments:",
+        instruction.argument,
+        instruction.additional_argument,
+    )
+    return False
+
+
+# Parallel Instruction Execution
+
+
+_instruction_pool = None
+_DEPENDENCY_CACHE = {}
+_MAXIMUM_DEPENDENCY_CACHE_SIZE = 64
+
+
+def start_parallel_execution(number_of_workers):
+    """Run independent non-input instructions on a shared worker pool."""
+    global _instruction_pool
+    _instruction_pool = concurrent.futures.ThreadPoolExecutor(
+        max_workers=number_of_workers, thread_name_prefix="instruction"
+    )
+    return _instruction_pool
+
+
+def get_dependencies(action):
+    """Return the indices of the instructions each instruction waits for."""
+    cached_action, dependencies = _DEPENDENCY_CACHE.get(id(action), (None, ()))
+    if cached_action is action:
+        return dependencies
+
+    dependencies = []
+    barrier = None
+    since_barrier = []
+    last_writers = {}
+    readers = defaultdict(list)
+    for index, instruction in enumerate(action):
+        command = _get_command(instruction)
+        if command is None or command.is_barrier:
+            dependencies.append(
+                frozenset(since_barrier)
+                | (frozenset() if barrier is None else {barrier})
+            )
+            barrier = index
+            since_barrier = []
+            last_writers.clear()
+            readers.clear()
+            continue
+
+        waits = set() if barrier is None else {barrier}
+        for resource in command.reads:
+            if resource in last_writers:
+                waits.add(last_writers[resource])
+        for resource in command.writes:
+            if resource in last_writers:
+                waits.add(last_writers[resource])
+            waits.update(readers[resource])
+
+        for resource in command.reads:
+            readers[resource].append(index)
+        for resource in command.writes:
+            last_writers[resource] = index
+            readers[resource] = []
+        dependencies.append(frozenset(waits))
+        since_barrier.append(index)
+
+    if len(_DEPENDENCY_CACHE) >= _MAXIMUM_DEPENDENCY_CACHE_SIZE:
+        _DEPENDENCY_CACHE.clear()
+    # Keep the action alive so that its 'id()' is not reused.
+    dependencies = tuple(dependencies)
+    _DEPENDENCY_CACHE[id(action)] = (action, dependencies)
+    return dependencies
+
+
+def _get_command(instruction):
+    """Return the command of an instruction unless its handler differs."""
+    command = _COMMAND_DISPATCH.get(instruction.command)
+    if command is None or command.handler is not instruction.handler:
+        return None
+    return command
+
+
+def _execute_in_parallel(trade, config, gui_state, action, token):
+    """Execute instructions as soon as their dependencies have succeeded."""
+    futures = []
+    try:
+        for instruction, dependencies in zip(action, get_dependencies(action)):
+            dependencies = [futures[index] for index in dependencies]
+            command = _get_command(instruction)
+            if command and not (command.is_input or command.is_barrier):
+                # Copy the context so that the task sees the same token.
+                futures.append(
+                    _instruction_pool.submit(
+                        contextvars.copy_context().run,
+                        _execute_after,
+                        dependencies,
+                        trade,
+                        config,
+                        gui_state,
+                        instruction,
+                        token,
+                    )
+                )
+                continue
+
+            future = concurrent.futures.Future()
+            futures.append(future)
+            future.set_result(
+                _execute_after(
+                    dependencies, trade, config, gui_state, instruction, token
+                )
+            )
+            if not future.result():
+                break
+    finally:
+        concurrent.futures.wait(futures)
+
+    return all(future.result() for future in futures)
+
+
+def _execute_after(dependencies, trade, config, gui_state, instruction, token):
+    """Execute an instruction if its dependencies have succeeded."""
+    if not all(future.result() for future in dependencies):
+        return False
+    if token.is_cancelled:
+        return False
+    return instruction.handler(trade, config, gui_state, instruction)
+
+
+# Action Tracing
+
+
+class ActionTracer:
+    """Record instruction timings in a ring buffer for Chrome traces."""
+
+    def __init__(self, path, capacity=65536, origin=None):
+        """Construct a new ActionTracer object."""
+        self.path = path
+        self._capacity = capacity
+        self._events = [None] * capacity
+        # 'next()' on 'itertools.count()' is atomic under the GIL, so
+        # concurrent actions can claim slots without taking a lock.
+        self._counter = itertools.count()
+        self._local = threading.local()
+        # The timestamps of the trace are relative to the origin.
+        self._origin = time.perf_counter_ns() if origin is None else origin
+
+    def execute(self, trade, config, gui_state, action, token=None):
+        """Execute compiled instructions while recording their timings."""
+        if token is None:
+            token = _get_cancellation_token()
+        depth = getattr(self._local, "depth", 0)
+        self._local.depth = depth + 1
+        action_start = time.perf_counter_ns()
+        try:
+            for instruction in action:
+                if token.is_cancelled:
+                    return False
+
+                start = time.perf_counter_ns()
+                is_successful = instruction.handler(
+                    trade, config, gui_state, instruction
+                )
+                self.record(
+                    instruction.command,
+                    start,
+                    time.perf_counter_ns(),
+                    depth + 1,
+                )
+                if not is_successful:
+                    return False
+
+            return True
+        finally:
+            self._local.depth = depth
+            self.record(
+                "execute_action", action_start, time.perf_counter_ns(), depth
+            )
+
+    def record(self, name, start, end, depth):
+        """Store a completed span, overwriting the oldest when full."""
+        self._events[next(self._counter) % self._capacity] = (
+            name,
+            start,
+            end,
+            depth,
+            threading.get_ident(),
+        )
+
+    def dump(self, path=None):
+        """Write the recorded spans as a Chrome trace JSON file."""
+        path = path or self.path
+        pid = os.getpid()
+        trace_events = [
+            {
+                "name": name,
+                "cat": "action",
+                "ph": "X",
+                "ts": (start - self._origin) / 1000,
+                "dur": (end - start) / 1000,
+                "pid": pid,
+                "tid": tid,
+                "args": {"depth": depth},
+            }
+            for name, start, end, depth, tid in sorted(
+                (event for event in list(self._events) if event),
+                key=lambda event: event[1],
+            )
+        ]
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(
+                    {"traceEvents": trace_events, "displayTimeUnit": "ms"}, f
+                )
+        except OSError as e:
+            print(e)
+            return False
+
+        return True
+
+
+_action_tracer = None
+
+
+def start_tracing(trade):
+    """Enable action tracing and save the trace on interpreter shutdown."""
+    global _action_tracer
+    # Start the trace at process creation, which includes loading the
+    # config, so that it shows the startup before the first action.
+    end = time.perf_counter_ns()
+    start = end - int((time.time() - psutil.Process().create_time()) * 1e9)
+    _action_tracer = ActionTracer(
+        os.path.join(
+            trade.resource_directory,
+            f"trace_{time.strftime('%Y%m%d_%H%M%S')}.json",
+        ),
+        origin=start,
+    )
+    _action_tracer.record("startup", start, end, 0)
+    atexit.register(_action_tracer.dump)
+    return _action_tracer
+
+
 # Startup Automation
 
 
@@ -2234,22 +5441,22 @@ def calculate_share_size(trade, config, position):
         except OSError as e:
             print(e)
 
-        trading_unit = 100
         share_size = (
             int(
                 trade.cash_balance
-                * float(config[trade.process]["utilization_ratio"])
+                * get_settings(trade, config).process.utilization_ratio
                 / customer_margin_ratio
                 / get_price_limit(trade, config)
-                / trading_unit
+                / TRADING_UNIT
             )
-            * trading_unit
+            * TRADING_UNIT
         )
         if share_size == 0:
             return (False, "Insufficient cash balance.")
 
-        if position == "short" and share_size > 50 * trading_unit:
-            share_size = 50 * trading_unit
+        maximum_short_share_size = MAXIMUM_SHORT_TRADING_UNITS * TRADING_UNIT
+        if position == "short" and share_size > maximum_short_share_size:
+            share_size = maximum_short_share_size
 
         trade.share_size = share_size
         return (True, None)
@@ -2257,75 +5464,118 @@ def calculate_share_size(trade, config, position):
     return (False, "Symbol or cash balance not provided.")
 
 
-def get_price_limit(trade, config):
-    """Calculate the price limit for a trade."""
-    closing_price = 0.0
+def calculate_share_sizes(trade, config, cash_balance, securities_codes):
+    """Return the share sizes of the codes at the utilization ratios."""
+    securities_codes = list(
+        dict.fromkeys(
+            securities_code
+            for securities_code in securities_codes
+            if re.fullmatch(SECURITIES_CODE_REGEX, securities_code)
+        )
+    )
+    utilization_ratios = np.array(
+        get_settings(trade, config).process.share_size_utilization_ratios
+    )
+
+    market_data = np.zeros((len(securities_codes), 2))
+    table = _get_closing_price_table(trade.closing_prices)
+    if table is not None and securities_codes:
+        market_data = np.frombuffer(table).reshape(-1, 2)[
+            encode_securities_codes(pa.array(securities_codes))
+        ]
+    closing_prices, price_limits = market_data.T
+
+    customer_margin_ratios = pd.Series(
+        config[trade.customer_margin_ratios_section]["customer_margin_ratio"],
+        index=securities_codes,
+    )
     try:
-        with open(
-            f"{trade.closing_prices}{trade.symbol[0]}.csv", encoding="utf-8"
-        ) as f:
-            reader = csv.reader(f)
-            for row in reader:
-                if len(row) < 2:
-                    continue
-                if row[0].strip() == trade.symbol:
-                    closing_price = float(row[1].strip())
-                    break
+        saved_ratios = pd.read_csv(
+            trade.customer_margin_ratios,
+            header=None,
+            index_col=0,
+            dtype=str,
+        ).iloc[:, 0]
+    except (OSError, pd.errors.EmptyDataError) as e:
+        print(e)
+    else:
+        saved_ratios = saved_ratios[~saved_ratios.index.duplicated()]
+        customer_margin_ratios.update(saved_ratios)
+    is_suspended = (customer_margin_ratios == "suspended").to_numpy()
+    customer_margin_ratios = pd.to_numeric(
+        customer_margin_ratios.mask(is_suspended, "inf")
+    ).to_numpy()
+
+    # Each row is a code and each column is a utilization ratio.  Codes
+    # without a saved price limit or with margin trading suspended get 0.
+    # The divisions follow 'calculate_share_size()' so that both round alike
+    # at the boundaries of the trading units.
+    with np.errstate(divide="ignore", invalid="ignore"):
+        trading_units = (
+            cash_balance
+            * utilization_ratios
+            / customer_margin_ratios[:, None]
+            / price_limits[:, None]
+            / TRADING_UNIT
+        )
+    long_share_sizes = (
+        np.where(
+            np.isfinite(trading_units), np.floor(trading_units), 0
+        ).astype(np.int64)
+        * TRADING_UNIT
+    )
+    short_share_sizes = np.minimum(
+        long_share_sizes, MAXIMUM_SHORT_TRADING_UNITS * TRADING_UNIT
+    )
+
+    df = pd.DataFrame(
+        {
+            "closing_price": closing_prices,
+            "price_limit": price_limits,
+            "customer_margin_ratio": np.where(
+                is_suspended, np.nan, customer_margin_ratios
+            ),
+        },
+        index=pd.Index(securities_codes, name="securities_code"),
+    )
+    for index, utilization_ratio in enumerate(utilization_ratios):
+        df[f"long_{utilization_ratio:g}"] = long_share_sizes[:, index]
+        df[f"short_{utilization_ratio:g}"] = short_share_sizes[:, index]
+    return df
+
+
+def save_share_sizes(trade, config, cash_balance, securities_codes=()):
+    """Save the share sizes of the codes or the codes on the clipboard."""
+    if not securities_codes:
+        # 'copy_symbols_from_column' separates the codes with spaces.
+        securities_codes = trade.backend.get_clipboard_text().split()
+
+    df = calculate_share_sizes(trade, config, cash_balance, securities_codes)
+    try:
+        df.to_csv(trade.share_sizes)
     except OSError as e:
         print(e)
+        return None
 
-    if closing_price:
-        price_ranges = (
-            (100, 30),
-            (200, 50),
-            (500, 80),
-            (700, 100),
-            (1000, 150),
-            (1500, 300),
-            (2000, 400),
-            (3000, 500),
-            (5000, 700),
-            (7000, 1000),
-            (10000, 1500),
-            (15000, 3000),
-            (20000, 4000),
-            (30000, 5000),
-            (50000, 7000),
-            (70000, 10000),
-            (100000, 15000),
-            (150000, 30000),
-            (200000, 40000),
-            (300000, 50000),
-            (500000, 70000),
-            (700000, 100000),
-            (1000000, 150000),
-            (1500000, 300000),
-            (2000000, 400000),
-            (3000000, 500000),
-            (5000000, 700000),
-            (7000000, 1000000),
-            (10000000, 1500000),
-            (15000000, 3000000),
-            (20000000, 4000000),
-            (30000000, 5000000),
-            (50000000, 7000000),
-            (float("inf"), 10000000),
-        )
-        for maximum_price, limit in price_ranges:
-            if closing_price < maximum_price:
-                price_limit = closing_price + limit
-                break
-    else:
-        price_limit = text_recognition.recognize_text(
+    print(df.to_string())
+    return df
+
+
+def get_price_limit(trade, config):
+    """Calculate the price limit for a trade."""
+    price_limit = get_saved_price_limit(trade, trade.symbol)
+    if not price_limit:
+        settings = get_settings(trade, config).process
+        price_limit = trade.backend.recognize_text(
             *map(
                 int,
                 config[trade.geometries_section]["price_limit_region"].split(
                     ","
                 ),
             ),
-            int(config[trade.process]["image_magnification"]),
-            int(config[trade.process]["binarization_threshold"]),
-            config[trade.process].getboolean("is_dark_theme"),
+            settings.image_magnification,
+            settings.binarization_threshold,
+            settings.is_dark_theme,
             text_type="decimal_numbers",
         )
     return price_limit